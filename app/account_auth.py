@@ -14,12 +14,9 @@ PASSWORD_MIN_LEN = 8
 
 
 def _get_supabase():
-    url = os.getenv("SUPABASE_URL")
-    key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-    if not url or not key:
-        raise ValueError("需要设置 SUPABASE_URL 和 SUPABASE_SERVICE_ROLE_KEY")
-    from supabase import create_client
-    return create_client(url, key)
+    """与记忆适配器共用进程内的 Supabase client"""
+    from .adapters.supabase_store import get_supabase_client
+    return get_supabase_client()
 
 
 # bcrypt 最多 72 字节，超出部分截断（与 passlib+bcrypt5 兼容性问题的规避）
@@ -1,5 +1,6 @@
 """记忆存储适配器抽象：user_profile、session_temp、npc_learn_progress 的读写（已移除 diary）"""
 from abc import ABC, abstractmethod
+from datetime import datetime
 from typing import Dict, Any, Optional
 
 
@@ -33,6 +34,17 @@ class MemoryAdapter(ABC):
         """保存 session_temp。"""
         pass
 
+    def append_session_message(self, message: Dict[str, Any], character: str = "") -> int:
+        """向 session_temp 追加一条消息，返回追加后的消息数。默认整份读改写，文件后端覆盖为增量写入。"""
+        data = self.load_session_temp()
+        if data is None:
+            data = {"session_start": datetime.now().isoformat(), "character": character, "messages": []}
+        if character:
+            data["character"] = character
+        data["messages"].append(message)
+        self.save_session_temp(data)
+        return len(data["messages"])
+
     @abstractmethod
     def clear_session_temp(self) -> None:
         """清空 session_temp。"""
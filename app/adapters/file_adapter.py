@@ -1,10 +1,47 @@
-"""本地文件记忆适配器：读写 memory/accounts/{account}/ 下 JSON 文件"""
-import json
+"""本地文件记忆适配器：读写 memory/accounts/{account}/ 下 JSON 文件（经按账号的写回缓存，去抖原子写盘）"""
 import os
+from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
 from .base import MemoryAdapter
+from .file_state_store import get_account_store
+
+
+def _session_format() -> str:
+    """SESSION_TEMP_FORMAT=jsonl 时会话改为追加式 session_temp.jsonl，每条消息一行；默认 json（整份 session_temp.json）"""
+    fmt = (os.getenv("SESSION_TEMP_FORMAT") or "json").strip().lower()
+    return "jsonl" if fmt == "jsonl" else "json"
+
+
+def _records_to_session(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """JSONL 记录 -> 与 session_temp.json 同结构的 dict。meta 行记录 session_start / character，message 行为消息。"""
+    session = {"session_start": None, "character": "", "messages": []}
+    for r in records:
+        if "meta" in r:
+            meta = r["meta"] or {}
+            if session["session_start"] is None and meta.get("session_start"):
+                session["session_start"] = meta["session_start"]
+            if "character" in meta:
+                session["character"] = meta["character"]
+        elif "message" in r:
+            session["messages"].append(r["message"])
+    return session
+
+
+def _last_character(records: List[Dict[str, Any]]) -> Optional[str]:
+    """从后往前找最近一条带 character 的 meta 行，没有则返回 None"""
+    for r in reversed(records):
+        meta = r.get("meta")
+        if meta and "character" in meta:
+            return meta["character"] or ""
+    return None
+
+
+def _session_to_records(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    records = [{"meta": {"session_start": data.get("session_start"), "character": data.get("character", "")}}]
+    records.extend({"message": m} for m in data.get("messages") or [])
+    return records
 
 
 def _safe_account(account_name: Optional[str]) -> str:
@@ -24,23 +61,21 @@ class FileAdapter(MemoryAdapter):
         self._user_profile_file = self.base_dir / "user_profile.json"
         self._session_temp_file = self.base_dir / "session_temp.json"
         self._npc_learn_progress_file = self.base_dir / "npc_learn_progress.json"
+        self._session_log_file = self.base_dir / "session_temp.jsonl"
+        self._store = get_account_store(self.base_dir)
 
     def get_user_id(self) -> str:
         return _safe_account(self.account_name)
 
     def _read_json(self, path: Path, default: Dict) -> Dict:
-        if not path.exists():
-            return default
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            return default
-
-    def _write_json(self, path: Path, data: Dict) -> None:
-        path.parent.mkdir(parents=True, exist_ok=True)
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        return self._store.get(path, default)
+
+    def _write_json(self, path: Path, data: Dict, flush: bool = False) -> None:
+        self._store.put(path, data, flush=flush)
+
+    def flush(self) -> None:
+        """立即写出本账号缓存中的脏数据"""
+        self._store.flush()
 
     def load_user_profile(self) -> Dict[str, Any]:
         default = {
@@ -64,26 +99,56 @@ class FileAdapter(MemoryAdapter):
         self._write_json(self._user_profile_file, profile)
 
     def load_session_temp(self) -> Optional[Dict[str, Any]]:
-        if not self._session_temp_file.exists():
-            return None
-        try:
-            with open(self._session_temp_file, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            return None
+        if _session_format() == "jsonl":
+            records = self._store.get_log(self._session_log_file)
+            if records is not None:
+                return _records_to_session(records)
+        return self._store.get(self._session_temp_file, None)
 
     def save_session_temp(self, data: Dict[str, Any]) -> None:
+        if _session_format() == "jsonl":
+            self._store.replace_lines(self._session_log_file, _session_to_records(data))
+            return
         self._write_json(self._session_temp_file, data)
 
+    def append_session_message(self, message: Dict[str, Any], character: str = "") -> int:
+        if _session_format() != "jsonl":
+            def _append(session):
+                if character:
+                    session["character"] = character
+                session["messages"].append(message)
+                return session
+            default = {"session_start": datetime.now().isoformat(), "character": character, "messages": []}
+            return len(self._store.update(self._session_temp_file, _append, default)["messages"])
+
+        def _build(current):
+            records = []
+            if not current:
+                # 新会话：若有旧格式 session_temp.json 先迁移其内容，再写 meta 行
+                legacy = self._store.get(self._session_temp_file, None)
+                if legacy:
+                    records.extend(_session_to_records(legacy))
+                    self._store.delete(self._session_temp_file)
+                else:
+                    records.append({"meta": {"session_start": datetime.now().isoformat(), "character": character}})
+            last = _last_character(records)
+            if last is None:
+                last = _last_character(current) or ""
+            if character and last != character:
+                records.append({"meta": {"character": character}})
+            records.append({"message": message})
+            return records
+
+        current = self._store.append_lines(self._session_log_file, _build)
+        return sum(1 for r in current if "message" in r)
+
     def clear_session_temp(self) -> None:
-        if self._session_temp_file.exists():
-            try:
-                self._session_temp_file.unlink()
-            except Exception:
-                pass
+        self._store.delete(self._session_temp_file)
+        self._store.delete(self._session_log_file)
 
     def load_npc_learn_progress(self) -> Dict[str, Any]:
         return self._read_json(self._npc_learn_progress_file, {})
 
     def save_npc_learn_progress(self, data: Dict[str, Any]) -> None:
-        self._write_json(self._npc_learn_progress_file, data)
+        # scene_npc_db 在文件后端会直接读该文件，立即落盘保证一致
+        self._write_json(self._npc_learn_progress_file, data, flush=True)
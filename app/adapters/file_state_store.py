@@ -0,0 +1,240 @@
+"""按账号的 JSON 写回缓存：FileAdapter 的读写先落内存，脏数据去抖后原子写盘（临时文件 + rename）。
+
+同一账号目录在进程内只有一个 AccountStateStore，多个 FileAdapter 实例共享，避免每条消息都整份重写 JSON。
+另提供 session_temp 的 JSONL 追加日志：每条消息只追加一行，不再重写整个会话文件。
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 脏数据延迟写盘的秒数；<=0 表示每次保存立即写盘（仍为原子写）
+FLUSH_DELAY = float(os.getenv("FILE_ADAPTER_FLUSH_DELAY", "1.0"))
+
+_STORES: Dict[Path, "AccountStateStore"] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def _file_mtime(path: Path) -> Optional[int]:
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+def atomic_write_json(path: Path, data: Any) -> None:
+    """先写同目录临时文件再 os.replace，崩溃时不会留下半截 JSON"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+class AccountStateStore:
+    """单个账号目录下 JSON 文件的内存副本，带脏标记与去抖写盘。
+
+    - get: 命中缓存且文件未被外部修改（mtime 未变）时不读盘；返回深拷贝，调用方可随意修改。
+    - put: 只更新内存并标脏，FLUSH_DELAY 秒内的多次保存合并为一次写盘。
+    - 会话日志（JSONL）: append_lines 直接追加到文件，并同步更新内存中的会话视图。
+    """
+
+    def __init__(self, base_dir: Path):
+        self.base_dir = base_dir
+        self._lock = threading.RLock()
+        self._data: Dict[Path, Any] = {}
+        self._mtimes: Dict[Path, Optional[int]] = {}
+        self._dirty: set = set()
+        self._timer: Optional[threading.Timer] = None
+
+    # ---------- JSON 文档 ----------
+
+    def get(self, path: Path, default: Any = None) -> Any:
+        with self._lock:
+            if path in self._dirty or (path in self._data and self._mtimes.get(path) == _file_mtime(path)):
+                value = self._data[path]
+            else:
+                value = self._read(path)
+                self._data[path] = value
+                self._mtimes[path] = _file_mtime(path)
+            if value is None:
+                return default
+            return copy.deepcopy(value)
+
+    def put(self, path: Path, data: Any, flush: bool = False) -> None:
+        """更新内存副本并标脏；flush=True 时立即写盘（供其他模块会直接读文件的数据使用）"""
+        with self._lock:
+            self._data[path] = copy.deepcopy(data)
+            self._mark_dirty(path, flush)
+
+    def update(self, path: Path, fn, default: Any = None) -> Any:
+        """在锁内就地修改缓存对象（不做整份拷贝），fn(data) 返回新的 data；返回 fn 的结果。"""
+        with self._lock:
+            if path not in self._dirty:
+                self.get(path)
+            current = self._data.get(path)
+            if current is None:
+                current = copy.deepcopy(default)
+            result = fn(current)
+            self._data[path] = result
+            self._mark_dirty(path, False)
+            return result
+
+    def _mark_dirty(self, path: Path, flush: bool) -> None:
+        self._dirty.add(path)
+        if flush or FLUSH_DELAY <= 0:
+            self._flush_path(path)
+        else:
+            self._schedule_flush()
+
+    def delete(self, path: Path) -> None:
+        with self._lock:
+            self._data[path] = None
+            self._dirty.discard(path)
+            if path.exists():
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+            self._mtimes[path] = None
+
+    # ---------- JSONL 会话日志 ----------
+
+    def _log(self, path: Path) -> Optional[List[Dict[str, Any]]]:
+        if path in self._data and self._mtimes.get(path) == _file_mtime(path):
+            return self._data[path]
+        value = self._read_lines(path)
+        self._data[path] = value
+        self._mtimes[path] = _file_mtime(path)
+        return value
+
+    def get_log(self, path: Path) -> Optional[List[Dict[str, Any]]]:
+        """返回 JSONL 文件的全部记录（缓存的深拷贝），文件不存在时返回 None。"""
+        with self._lock:
+            value = self._log(path)
+            return copy.deepcopy(value) if value is not None else None
+
+    def append_lines(self, path: Path, build) -> List[Dict[str, Any]]:
+        """追加记录到 JSONL 文件并同步缓存。build(current) 在锁内根据现有记录（只读）返回要追加的记录列表；
+        返回追加后的缓存记录（只读引用，调用方不要修改）。"""
+        with self._lock:
+            current = self._log(path)
+            if current is None:
+                current = []
+            records = build(current)
+            if records:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                with open(path, "a", encoding="utf-8") as f:
+                    for r in records:
+                        f.write(json.dumps(r, ensure_ascii=False) + "\n")
+                current.extend(copy.deepcopy(records))
+            self._data[path] = current
+            self._mtimes[path] = _file_mtime(path)
+            return current
+
+    def replace_lines(self, path: Path, records: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for r in records:
+                    f.write(json.dumps(r, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, path)
+            self._data[path] = copy.deepcopy(records)
+            self._mtimes[path] = _file_mtime(path)
+
+    # ---------- 写盘 ----------
+
+    def flush(self) -> None:
+        """立即写出所有脏数据"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            for path in list(self._dirty):
+                self._flush_path(path)
+
+    def _flush_path(self, path: Path) -> None:
+        try:
+            atomic_write_json(path, self._data[path])
+            self._dirty.discard(path)
+            self._mtimes[path] = _file_mtime(path)
+        except Exception as e:
+            logger.warning("写入 %s 失败，稍后重试: %s", path, e)
+
+    def _schedule_flush(self) -> None:
+        if self._timer is not None:
+            return
+        timer = threading.Timer(FLUSH_DELAY, self._on_timer)
+        timer.daemon = True
+        self._timer = timer
+        timer.start()
+
+    def _on_timer(self) -> None:
+        with self._lock:
+            self._timer = None
+            for path in list(self._dirty):
+                self._flush_path(path)
+            if self._dirty:
+                self._schedule_flush()
+
+    @staticmethod
+    def _read(path: Path) -> Any:
+        if not path.exists():
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    @staticmethod
+    def _read_lines(path: Path) -> Optional[List[Dict[str, Any]]]:
+        if not path.exists():
+            return None
+        records = []
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # 进程崩溃时最后一行可能不完整，跳过即可
+                        continue
+        except OSError:
+            return None
+        return records
+
+
+def get_account_store(base_dir: Path) -> AccountStateStore:
+    """返回账号目录对应的共享 store（进程内单例）"""
+    key = Path(base_dir).resolve()
+    with _STORES_LOCK:
+        store = _STORES.get(key)
+        if store is None:
+            store = AccountStateStore(key)
+            _STORES[key] = store
+        return store
+
+
+def flush_all_stores() -> None:
+    """写出所有账号的脏数据（进程退出、关闭服务时调用）"""
+    with _STORES_LOCK:
+        stores = list(_STORES.values())
+    for store in stores:
+        try:
+            store.flush()
+        except Exception as e:
+            logger.warning("flush %s 失败: %s", store.base_dir, e)
+
+
+atexit.register(flush_all_stores)
@@ -1,10 +1,12 @@
-"""Supabase 记忆适配器：读写 users、user_profile、user_npc_learn_progress。session_temp 仅内存不落库。"""
+"""Supabase 记忆适配器：读写 users、user_profile、user_npc_learn_progress。session_temp 仅内存不落库。
+共享 client、行缓存与批量写回见 supabase_store。"""
 import os
 import logging
 from datetime import datetime, timezone
 from typing import Dict, Any, Optional
 
 from .base import MemoryAdapter
+from .supabase_store import get_supabase_store
 
 logger = logging.getLogger(__name__)
 
@@ -19,20 +21,15 @@ class SupabaseAdapter(MemoryAdapter):
         self.account_name = account_name
         self._user_id = _safe_account(account_name)
         self._session_temp: Optional[Dict[str, Any]] = None  # 仅当次会话，不落库
-        url = os.getenv("SUPABASE_URL")
-        key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-        if not url or not key:
+        if not os.getenv("SUPABASE_URL") or not os.getenv("SUPABASE_SERVICE_ROLE_KEY"):
             raise ValueError("MEMORY_BACKEND=supabase 时需设置 SUPABASE_URL 和 SUPABASE_SERVICE_ROLE_KEY")
-        from supabase import create_client
-        self._client = create_client(url, key)
+        self._store = get_supabase_store()
 
     def get_user_id(self) -> str:
         return self._user_id
 
     def _ensure_user(self) -> None:
-        r = self._client.table("users").select("id").eq("id", self._user_id).execute()
-        if not (r.data and len(r.data) > 0):
-            self._client.table("users").insert({"id": self._user_id, "name": self.account_name or self._user_id, "profile": {}}).execute()
+        self._store.ensure_user(self._user_id, self.account_name or self._user_id)
 
     def load_user_profile(self) -> Dict[str, Any]:
         default = {
@@ -52,9 +49,9 @@ class SupabaseAdapter(MemoryAdapter):
         }
         try:
             self._ensure_user()
-            r = self._client.table("users").select("profile").eq("id", self._user_id).execute()
-            if r.data and len(r.data) > 0 and r.data[0].get("profile") is not None:
-                out = {**default, **(r.data[0]["profile"] or {})}
+            row = self._store.get_row("users", self._user_id)
+            if row and row.get("profile") is not None:
+                out = {**default, **(row["profile"] or {})}
                 return out
             return default
         except Exception as e:
@@ -64,10 +61,10 @@ class SupabaseAdapter(MemoryAdapter):
     def save_user_profile(self, profile: Dict[str, Any]) -> None:
         try:
             now = datetime.now(timezone.utc).isoformat()
-            self._client.table("users").upsert(
+            self._store.put_row(
+                "users",
                 {"id": self._user_id, "name": profile.get("name") or self._user_id, "profile": profile, "last_updated": now},
-                on_conflict="id"
-            ).execute()
+            )
         except Exception as e:
             logger.exception("Supabase save_user_profile: %s", e)
             raise
@@ -84,9 +81,9 @@ class SupabaseAdapter(MemoryAdapter):
     def load_npc_learn_progress(self) -> Dict[str, Any]:
         try:
             self._ensure_user()
-            r = self._client.table("user_npc_learn_progress").select("data").eq("user_id", self._user_id).execute()
-            if r.data and len(r.data) > 0 and r.data[0].get("data"):
-                d = r.data[0]["data"]
+            row = self._store.get_row("user_npc_learn_progress", self._user_id)
+            if row and row.get("data"):
+                d = row["data"]
                 if isinstance(d, dict):
                     return d
             return {}
@@ -97,10 +94,12 @@ class SupabaseAdapter(MemoryAdapter):
     def save_npc_learn_progress(self, data: Dict[str, Any]) -> None:
         try:
             self._ensure_user()
-            self._client.table("user_npc_learn_progress").upsert(
-                {"user_id": self._user_id, "data": data},
-                on_conflict="user_id",
-            ).execute()
+            # 立即写出：写入失败时向调用方抛出（档案保存仍走批量写回）
+            self._store.put_row(
+                "user_npc_learn_progress",
+                {"user_id": self._user_id, "data": data, "updated_at": datetime.now(timezone.utc).isoformat()},
+                flush=True,
+            )
         except Exception as e:
             logger.exception("Supabase save_npc_learn_progress: %s", e)
             raise
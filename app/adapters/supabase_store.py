@@ -0,0 +1,367 @@
+"""Supabase 共享客户端与行缓存：进程内只创建一个 client，SupabaseAdapter / account_auth 共用。
+
+- 已确认存在的 users.id 记在内存，_ensure_user 每个用户每个进程只查一次；
+- users.profile、user_npc_learn_progress.data 读穿缓存：默认每次读取只查版本列（last_updated / updated_at），
+  版本未变直接用缓存，变了才重新拉整行（多 worker 时其他 worker 的新写入不会被本地旧缓存覆盖）；
+  单 worker 部署可设 SUPABASE_CACHE_TTL，在该秒数内跳过版本校验；
+- 保存先更新缓存并进入写回队列，去抖 SUPABASE_FLUSH_DELAY 秒后按表批量 upsert（一次请求多行）；
+  批量失败时逐行重试，仍失败的行按指数退避稍后再试，单行失败 SUPABASE_FLUSH_MAX_ATTEMPTS 次后丢弃并记错误日志，
+  不会一直堵住同表其他用户的写入；进程退出 / 应用关闭时写出全部待写数据。
+测试时可用 set_supabase_client() 注入本地假客户端（需支持 table().select().eq().execute() / insert / upsert）。
+"""
+import atexit
+import copy
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 缓存行免校验直接使用的秒数；<=0（默认）表示每次读取都校验版本。多 worker 部署须保持 0，否则可能覆盖其他 worker 的写入
+SUPABASE_CACHE_TTL = float(os.getenv("SUPABASE_CACHE_TTL", "0"))
+# 写回延迟秒数（期间多次保存合并为一次 upsert）；<=0 表示每次保存立即写入
+SUPABASE_FLUSH_DELAY = float(os.getenv("SUPABASE_FLUSH_DELAY", "1.0"))
+# 单次 upsert 的最大行数
+SUPABASE_FLUSH_BATCH = int(os.getenv("SUPABASE_FLUSH_BATCH", "100"))
+# 单行最多尝试写入的次数，超过后丢弃该行并记错误日志
+SUPABASE_FLUSH_MAX_ATTEMPTS = int(os.getenv("SUPABASE_FLUSH_MAX_ATTEMPTS", "5"))
+# 写入失败后重试间隔的上限（秒）；间隔从 SUPABASE_FLUSH_DELAY 起按失败次数翻倍
+SUPABASE_FLUSH_MAX_BACKOFF = float(os.getenv("SUPABASE_FLUSH_MAX_BACKOFF", "60"))
+
+# 表 -> (主键列, 版本列)；按此顺序写出，保证 users 行先于引用它的进度行
+TABLES: Dict[str, Tuple[str, str]] = {
+    "users": ("id", "last_updated"),
+    "user_npc_learn_progress": ("user_id", "updated_at"),
+}
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_supabase_client():
+    """返回进程内共享的 Supabase client（首次调用时创建）"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            url = os.getenv("SUPABASE_URL")
+            key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+            if not url or not key:
+                raise ValueError("需要设置 SUPABASE_URL 和 SUPABASE_SERVICE_ROLE_KEY")
+            from supabase import create_client
+            _client = create_client(url, key)
+        return _client
+
+
+def set_supabase_client(client) -> None:
+    """替换共享 client（测试注入假客户端）；同时清空行缓存，丢弃未写出的数据"""
+    global _client, _store
+    with _client_lock:
+        _client = client
+    with _store_lock:
+        old, _store = _store, None
+    if old is not None:
+        old.close()
+
+
+def _now_iso() -> str:
+    return datetime.now().astimezone().isoformat()
+
+
+def _version_key(value: Any) -> Any:
+    """版本列统一成可比较的值：数据库返回的时间戳格式可能与写入时不同（如 Z / +00:00、微秒位数）"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return value
+    return value
+
+
+class _CachedRow:
+    __slots__ = ("row", "version", "checked_at")
+
+    def __init__(self, row: Optional[Dict[str, Any]], version: Any):
+        self.row = row
+        self.version = version
+        self.checked_at = time.monotonic()
+
+
+class SupabaseRowStore:
+    """按 (表, 主键) 缓存行，并把 upsert 合并为按表的批量写入"""
+
+    def __init__(self, client):
+        self.client = client
+        self._lock = threading.RLock()
+        # 串行化写出，保证同一行的多次 upsert 按保存顺序到达
+        self._flush_lock = threading.Lock()
+        self._known_users: set = set()
+        self._rows: Dict[Tuple[str, str], _CachedRow] = {}
+        # 待写 / 写出中的行：读取时优先使用，避免写出完成前读到旧数据
+        self._pending: Dict[str, Dict[str, Dict[str, Any]]] = {t: {} for t in TABLES}
+        self._inflight: Dict[str, Dict[str, Dict[str, Any]]] = {t: {} for t in TABLES}
+        # (表, 主键) -> 已失败次数 / 最近一次错误
+        self._attempts: Dict[Tuple[str, str], int] = {}
+        self._last_errors: Dict[Tuple[str, str], Exception] = {}
+        # 连续出现失败的写出次数，决定下次重试的退避间隔
+        self._failed_flushes = 0
+        self._timer: Optional[threading.Timer] = None
+        self._closed = False
+        self.stats = {
+            "hits": 0, "misses": 0, "revalidated": 0, "reloads": 0,
+            "user_checks": 0, "flushed_rows": 0, "flush_batches": 0, "flush_errors": 0, "dropped_rows": 0,
+        }
+
+    # ---------- 用户存在性 ----------
+
+    def ensure_user(self, user_id: str, name: Optional[str] = None) -> None:
+        """确保 users 中有该用户（外键依赖）；确认过的用户不再查询"""
+        with self._lock:
+            if user_id in self._known_users:
+                return
+            self.stats["user_checks"] += 1
+        r = self.client.table("users").select("id").eq("id", user_id).execute()
+        if not (r.data and len(r.data) > 0):
+            self.client.table("users").insert({"id": user_id, "name": name or user_id, "profile": {}}).execute()
+            with self._lock:
+                # 新建的用户行：缓存一份空 profile，省去随后的 load 查询
+                self._rows.setdefault(("users", user_id), _CachedRow({"id": user_id, "name": name or user_id, "profile": {}}, None))
+        with self._lock:
+            self._known_users.add(user_id)
+
+    # ---------- 读 ----------
+
+    def get_row(self, table: str, key: str) -> Optional[Dict[str, Any]]:
+        """返回整行（副本），不存在时返回 None"""
+        key_col, version_col = TABLES[table]
+        with self._lock:
+            local = self._pending[table].get(key) or self._inflight[table].get(key)
+            if local is not None:
+                self.stats["hits"] += 1
+                return copy.deepcopy(local)
+            cached = self._rows.get((table, key))
+            if cached is not None and time.monotonic() - cached.checked_at < SUPABASE_CACHE_TTL:
+                self.stats["hits"] += 1
+                return copy.deepcopy(cached.row)
+        if cached is not None and cached.version is not None:
+            # 缓存过期：只取版本列，未变化则续期
+            r = self.client.table(table).select(version_col).eq(key_col, key).execute()
+            remote = r.data[0].get(version_col) if r.data else None
+            if r.data and _version_key(remote) == cached.version:
+                with self._lock:
+                    cached.checked_at = time.monotonic()
+                    self.stats["revalidated"] += 1
+                    return copy.deepcopy(cached.row)
+            with self._lock:
+                self.stats["reloads"] += 1
+        else:
+            with self._lock:
+                self.stats["misses"] += 1
+        r = self.client.table(table).select("*").eq(key_col, key).execute()
+        row = r.data[0] if r.data else None
+        with self._lock:
+            # 查询期间有新的保存：以本地待写数据为准
+            local = self._pending[table].get(key) or self._inflight[table].get(key)
+            if local is not None:
+                return copy.deepcopy(local)
+            self._rows[(table, key)] = _CachedRow(copy.deepcopy(row), _version_key(row.get(version_col)) if row else None)
+            if row is not None and table == "users":
+                self._known_users.add(key)
+        return copy.deepcopy(row)
+
+    # ---------- 写 ----------
+
+    def put_row(self, table: str, row: Dict[str, Any], flush: bool = False) -> None:
+        """更新缓存并加入写回队列；row 需包含主键列，版本列未给出时自动填当前时间。
+        flush=True 时立即写出，该行写入失败则撤回这次保存并抛出异常（与直接 upsert 的语义一致）"""
+        key_col, version_col = TABLES[table]
+        key = row[key_col]
+        row = copy.deepcopy(row)
+        row.setdefault(version_col, _now_iso())
+        with self._lock:
+            self._pending[table][key] = row
+            self._rows[(table, key)] = _CachedRow(copy.deepcopy(row), _version_key(row[version_col]))
+            self._last_errors.pop((table, key), None)
+            immediate = flush or SUPABASE_FLUSH_DELAY <= 0 or self._closed
+            if not immediate:
+                self._schedule_flush()
+        if not immediate:
+            return
+        self.flush()
+        if not flush:
+            return
+        with self._lock:
+            error = self._last_errors.pop((table, key), None)
+            if error is None:
+                return
+            # 仍是本次保存的数据时撤回，缓存作废（下次读取从数据库重新加载）
+            if self._pending[table].get(key) is row:
+                del self._pending[table][key]
+                self._attempts.pop((table, key), None)
+            self._rows.pop((table, key), None)
+        raise error
+
+    def flush(self) -> None:
+        """立即把待写行按表批量 upsert；批量失败时逐行重试，失败的行放回队列按退避间隔重试，多次失败后丢弃"""
+        with self._flush_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                batches = {}
+                for table in TABLES:
+                    if self._pending[table]:
+                        batches[table] = self._pending[table]
+                        self._inflight[table] = self._pending[table]
+                        self._pending[table] = {}
+            # 写入失败的用户 ID：外键依赖，这些用户在后面表中的行先不写
+            failed_users: set = set()
+            any_failed = False
+            for table, rows in batches.items():
+                key_col = TABLES[table][0]
+                items: List[Dict[str, Any]] = []
+                with self._lock:
+                    for k, r in list(rows.items()):
+                        if table != "users" and k in failed_users and k not in self._known_users:
+                            # 用户行还没写成功：留待下次，不计失败次数
+                            self._pending[table].setdefault(k, r)
+                            self._inflight[table].pop(k, None)
+                        else:
+                            items.append(r)
+                size = max(1, SUPABASE_FLUSH_BATCH)
+                for i in range(0, len(items), size):
+                    chunk = items[i:i + size]
+                    try:
+                        self.client.table(table).upsert(chunk, on_conflict=key_col).execute()
+                        self._on_written(table, chunk)
+                    except Exception as e:
+                        logger.warning("Supabase 写入 %s 失败（%d 行）%s: %s", table, len(chunk),
+                                       "，改为逐行重试" if len(chunk) > 1 else "，稍后重试", e)
+                        with self._lock:
+                            self.stats["flush_errors"] += 1
+                        for r in chunk if len(chunk) > 1 else ():
+                            try:
+                                self.client.table(table).upsert([r], on_conflict=key_col).execute()
+                                self._on_written(table, [r])
+                            except Exception as row_error:
+                                self._on_row_failed(table, r, row_error)
+                        if len(chunk) == 1:
+                            self._on_row_failed(table, chunk[0], e)
+                with self._lock:
+                    # 未写成功的行放回队列（期间有更新的保存则以新数据为准）
+                    for k, r in self._inflight[table].items():
+                        any_failed = True
+                        if table == "users":
+                            failed_users.add(k)
+                        self._pending[table].setdefault(k, r)
+                    self._inflight[table] = {}
+            with self._lock:
+                self._failed_flushes = self._failed_flushes + 1 if any_failed else 0
+                if any(self._pending.values()) and not self._closed:
+                    self._schedule_flush()
+
+    def _on_written(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        key_col = TABLES[table][0]
+        with self._lock:
+            self.stats["flush_batches"] += 1
+            self.stats["flushed_rows"] += len(rows)
+            for r in rows:
+                k = r[key_col]
+                self._inflight[table].pop(k, None)
+                self._attempts.pop((table, k), None)
+                self._last_errors.pop((table, k), None)
+                if table == "users":
+                    self._known_users.add(k)
+
+    def _on_row_failed(self, table: str, row: Dict[str, Any], error: Exception) -> None:
+        """记一次单行失败；达到 SUPABASE_FLUSH_MAX_ATTEMPTS 次后丢弃该行，不再放回队列"""
+        key = row[TABLES[table][0]]
+        with self._lock:
+            attempts = self._attempts.get((table, key), 0) + 1
+            self._last_errors[(table, key)] = error
+            if attempts < max(1, SUPABASE_FLUSH_MAX_ATTEMPTS):
+                self._attempts[(table, key)] = attempts
+                return
+            self._attempts.pop((table, key), None)
+            self._inflight[table].pop(key, None)
+            # 缓存里是没写进去的数据，作废后下次读取从数据库重新加载
+            if key not in self._pending[table]:
+                self._rows.pop((table, key), None)
+            self.stats["dropped_rows"] += 1
+        logger.error("Supabase 写入 %s 行 %s 连续失败 %d 次，已丢弃: %s；数据: %r", table, key, attempts, error, row)
+
+    def _schedule_flush(self) -> None:
+        if self._timer is not None:
+            return
+        delay = max(SUPABASE_FLUSH_DELAY, 0.1)
+        if self._failed_flushes:
+            # 写入失败后指数退避，避免每个去抖周期都重试同一批失败数据
+            delay = min(delay * (2 ** min(self._failed_flushes, 16)), max(SUPABASE_FLUSH_MAX_BACKOFF, delay))
+        timer = threading.Timer(delay, self._on_timer)
+        timer.daemon = True
+        self._timer = timer
+        timer.start()
+
+    def _on_timer(self) -> None:
+        with self._lock:
+            self._timer = None
+        self.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def snapshot_stats(self) -> dict:
+        with self._lock:
+            return {
+                "known_users": len(self._known_users),
+                "cached_rows": len(self._rows),
+                "pending_rows": sum(len(p) for p in self._pending.values()),
+                **self.stats,
+            }
+
+
+_store: Optional[SupabaseRowStore] = None
+_store_lock = threading.Lock()
+
+
+def get_supabase_store() -> SupabaseRowStore:
+    """返回进程内共享的行缓存（绑定共享 client）"""
+    global _store
+    client = get_supabase_client()
+    with _store_lock:
+        if _store is None or _store.client is not client:
+            _store = SupabaseRowStore(client)
+        return _store
+
+
+def flush_supabase_store() -> None:
+    """写出所有待写行（进程退出、关闭服务时调用）；未使用 Supabase 时什么都不做"""
+    with _store_lock:
+        store = _store
+    if store is not None:
+        try:
+            store.flush()
+        except Exception as e:
+            logger.warning("Supabase 写出待写数据失败: %s", e)
+
+
+def supabase_store_stats() -> dict:
+    """缓存状态：已确认用户数、缓存行数、待写行数，以及命中 / 未命中 / 版本校验 / 重新加载 / 写出次数"""
+    with _store_lock:
+        store = _store
+    if store is None:
+        return {"known_users": 0, "cached_rows": 0, "pending_rows": 0,
+                **{k: 0 for k in ("hits", "misses", "revalidated", "reloads", "user_checks",
+                                  "flushed_rows", "flush_batches", "flush_errors", "dropped_rows")}}
+    return store.snapshot_stats()
+
+
+atexit.register(flush_supabase_store)
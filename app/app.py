@@ -1,6 +1,7 @@
 import os
 import asyncio
 import aiohttp
+import time
 # pyaudio 按需导入（服务端录音时使用，Railway 瘦身部署可不装）
 import wave
 import numpy as np
@@ -19,6 +20,11 @@ import re
 import io
 from pydub import AudioSegment
 from .shared import clients, get_current_character, get_learning_stage
+from .http_clients import get_http_session
+from .audio_workers import run_audio_job
+from .audio_transcode import mp3_to_wav_file
+from .ws_router import route_message
+from .metrics import LLM_SECONDS, LLM_TTFT_SECONDS, TTS_SECONDS, PROVIDER_ERRORS, finish_turn
 
 # Spark-TTS / torch 按需导入（仅 TTS_PROVIDER=sparktts 时加载，豆包/OpenAI 路径不加载）
 SPARKTTS_AVAILABLE = False
@@ -275,12 +281,8 @@ def init_set_tts(set_tts):
     global TTS_PROVIDER, sparktts_model
     if set_tts == 'sparktts':
         if not _load_sparktts_deps():
+            # 全局配置变更，没有账号上下文：只记日志，不向所有账号的连接广播
             print("Spark-TTS is not available. Please ensure it's properly installed.")
-            loop = asyncio.get_running_loop()
-            loop.create_task(send_message_to_clients(json.dumps({
-                "action": "error",
-                "message": "Spark-TTS is not available."
-            })))
             return
         
         print(f"Initializing Spark-TTS model from {SPARKTTS_MODEL_DIR}...")
@@ -294,11 +296,6 @@ def init_set_tts(set_tts):
             TTS_PROVIDER = set_tts
         except Exception as e:
             print(f"Failed to load Spark-TTS model: {e}")
-            loop = asyncio.get_running_loop()
-            loop.create_task(send_message_to_clients(json.dumps({
-                "action": "error",
-                "message": f"Failed to load Spark-TTS model: {str(e)}"
-            })))
     else:
         # 如果设置的是doubao或openai，统一设置全局供应商
         if set_tts in ['doubao', 'openai']:
@@ -419,104 +416,161 @@ async def process_and_play(prompt, audio_file_pth, account_name=None):
         # Using current character audio without printing to CLI
         pass
         
+    audio_url, error_msg = await _synthesize_reply_audio(prompt, acc)
+    if audio_url:
+        print(f"TTS generated audio ({API_PROVIDER}), sending audio URL to clients")
+        await send_message_to_clients(json.dumps({
+            "action": "ai_audio",
+            "audio_url": audio_url,
+            "character": current_character
+        }), account_name=acc)
+    else:
+        print(error_msg)
+        await send_message_to_clients(json.dumps({
+            "action": "error",
+            "message": error_msg
+        }), account_name=acc)
+    finish_turn()
+
+
+async def _synthesize_reply_audio(text, acc):
+    """用全局 API_PROVIDER 合成一段 AI 回复语音，写入 outputs/tts/ 的分片目录。返回 (audio_url, None)，失败返回 (None, 错误信息)。
+    格式按该账号客户端声明的 audio_format（默认 AUDIO_OUTPUT_FORMAT，mp3），由供应商直接产出，不再转成 WAV。"""
+    import uuid, time
+    from .audio_storage import audio_path
+    from .audio_format import audio_extension, get_account_audio_format
+    # 保存到独立文件，供前端播放（旧文件由 audio_storage 后台回收）
+    ext = audio_extension(get_account_audio_format(acc))
+    filename = f"ai_{uuid.uuid4().hex[:8]}_{int(time.time() * 1000)}.{ext}"
+    output_path, audio_url = audio_path("tts", filename)
     # 只使用全局API_PROVIDER指定的TTS供应商
     if API_PROVIDER == 'openai':
-        # 保存到独立文件，供前端播放
-        import uuid, time
-        filename = f"ai_{uuid.uuid4().hex[:8]}_{int(time.time() * 1000)}.wav"
-        tts_dir = os.path.join(output_dir, "tts")
-        os.makedirs(tts_dir, exist_ok=True)
-        output_path = os.path.join(tts_dir, filename)
         try:
-            await openai_text_to_speech(prompt, output_path)
-            if os.path.exists(output_path):
-                print("TTS generated audio, sending audio URL to clients")
-                audio_url = f"/audio/tts/{filename}"
-                await send_message_to_clients(json.dumps({
-                    "action": "ai_audio",
-                    "audio_url": audio_url,
-                    "character": current_character
-                }))
-            else:
-                error_msg = "Error: OpenAI TTS生成失败，音频文件未找到"
-                print(error_msg)
-                await send_message_to_clients(json.dumps({
-                    "action": "error",
-                    "message": error_msg
-                }))
+            await openai_text_to_speech(text, output_path)
         except Exception as e:
-            error_msg = f"Error: OpenAI TTS API调用失败 - {str(e)}"
-            print(error_msg)
-            await send_message_to_clients(json.dumps({
-                "action": "error",
-                "message": error_msg
-            }))
+            return None, f"Error: OpenAI TTS API调用失败 - {str(e)}"
+        if os.path.exists(output_path):
+            return audio_url, None
+        return None, "Error: OpenAI TTS生成失败，音频文件未找到"
     elif API_PROVIDER == 'doubao':
-        # 保存到独立文件，供前端播放
-        import uuid, time
-        filename = f"ai_{uuid.uuid4().hex[:8]}_{int(time.time() * 1000)}.wav"
-        tts_dir = os.path.join(output_dir, "tts")
-        os.makedirs(tts_dir, exist_ok=True)
-        output_path = os.path.join(tts_dir, filename)
         # 中文对话阶段必须用中文专用音色 TTS_VOICE_TYPE_ZH（仅说中文）；英文学习阶段用 TTS_VOICE_TYPE
-        stage = get_learning_stage()
+        stage = get_learning_stage(acc)
         if stage == "chinese_chat":
             doubao_voice = os.getenv("TTS_VOICE_TYPE_ZH", "").strip() or "zh_female_cancan_mars_bigtts"
         else:
             doubao_voice = os.getenv("TTS_VOICE_TYPE") or "zh_female_cancan_mars_bigtts"
-        success = await doubao_text_to_speech(prompt, output_path, voice_type=doubao_voice)
+        success = await doubao_text_to_speech(text, output_path, voice_type=doubao_voice)
         if success and os.path.exists(output_path):
-            print("TTS generated audio (doubao), sending audio URL to clients")
-            audio_url = f"/audio/tts/{filename}"
-            await send_message_to_clients(json.dumps({
-                "action": "ai_audio",
-                "audio_url": audio_url,
-                "character": current_character
-            }))
-        else:
-            error_msg = "Error: 豆包TTS API调用失败，请检查环境变量配置"
-            print(error_msg)
-            await send_message_to_clients(json.dumps({
-                "action": "error",
-                "message": error_msg
-            }))
-    else:
-        error_msg = f"Error: 不支持的API供应商 '{API_PROVIDER}'，仅支持 'doubao' 或 'openai'"
-        print(error_msg)
+            return audio_url, None
+        return None, "Error: 豆包TTS API调用失败，请检查环境变量配置"
+    return None, f"Error: 不支持的API供应商 '{API_PROVIDER}'，仅支持 'doubao' 或 'openai'"
+
+
+# 后台发送音频分段的任务（持有引用，避免任务被垃圾回收）
+_reply_audio_tasks = set()
+
+
+async def stream_reply_and_play(deltas, account_name=None):
+    """边收 LLM 回复增量边断句合成语音：每凑齐一句立即提交 TTS（多句并行合成），
+    并按句子顺序向客户端推送 ai_audio_chunk（seq 从 0 递增），全部推送后发送 ai_audio_end。
+
+    deltas 为 chatgpt_stream_deltas 返回的异步迭代器；返回完整回复文本（语音推送在后台继续）。
+    首段语音的等待时间从"完整回复 + 整段合成"缩短为"第一句生成 + 第一句合成"。
+    """
+    import uuid
+    from .shared import DEFAULT_ACCOUNT
+    from .sentence_segmenter import SentenceSegmenter
+    acc = (account_name or "").strip() or DEFAULT_ACCOUNT
+    current_character = get_current_character(acc)
+    reply_id = uuid.uuid4().hex[:12]
+    segmenter = SentenceSegmenter()
+    # 按提交顺序排队的合成任务，None 表示回复结束
+    synth_queue = asyncio.Queue()
+    # 与整段合成时一致：朗读内容总长不超过 MAX_CHAR_LENGTH
+    remaining = MAX_CHAR_LENGTH
+
+    def submit(sentence):
+        nonlocal remaining
+        text = sanitize_response(sentence)
+        if not text or remaining <= 0:
+            return
+        if len(text) > remaining:
+            text = text[:remaining] + "..."
+        remaining -= len(text)
+        synth_queue.put_nowait(asyncio.create_task(_synthesize_reply_audio(text, acc)))
+
+    async def send_in_order():
+        seq = 0
+        error_sent = False
+        while True:
+            task = await synth_queue.get()
+            if task is None:
+                break
+            try:
+                audio_url, error_msg = await task
+            except Exception as e:
+                audio_url, error_msg = None, f"Error: TTS分段合成失败 - {e}"
+            if audio_url:
+                await send_message_to_clients(json.dumps({
+                    "action": "ai_audio_chunk",
+                    "reply_id": reply_id,
+                    "seq": seq,
+                    "audio_url": audio_url,
+                    "character": current_character
+                }), account_name=acc)
+                seq += 1
+            elif not error_sent:
+                # 同一条回复只报一次错，其余分段照常播放
+                print(error_msg)
+                await send_message_to_clients(json.dumps({
+                    "action": "error",
+                    "message": error_msg
+                }), account_name=acc)
+                error_sent = True
         await send_message_to_clients(json.dumps({
-            "action": "error",
-            "message": error_msg
-        }))
+            "action": "ai_audio_end",
+            "reply_id": reply_id,
+            "count": seq,
+            "character": current_character
+        }), account_name=acc)
+        # 最后一段语音已推送：本轮结束
+        finish_turn()
+
+    sender = asyncio.create_task(send_in_order())
+    _reply_audio_tasks.add(sender)
+    sender.add_done_callback(_reply_audio_tasks.discard)
+
+    parts = []
+    try:
+        async for delta in deltas:
+            parts.append(delta)
+            for sentence in segmenter.feed(delta):
+                submit(sentence)
+        for sentence in segmenter.flush():
+            submit(sentence)
+    finally:
+        synth_queue.put_nowait(None)
+    return "".join(parts)
 
 
-async def send_message_to_clients(message):
-    """Send a message to all connected clients
-    
+async def send_message_to_clients(message, account_name=None):
+    """Send a message to connected clients
+
     Args:
         message: Either a string or a dictionary to send to clients
+        account_name: 指定时只发给绑定到该账号的连接；为 None 时广播给所有连接（兼容无账号上下文的调用）
     """
     # Convert dictionary to JSON string if needed
     if isinstance(message, dict):
         message_str = json.dumps(message)
     else:
         message_str = message
-    
-    print(f"📤 Sending message to clients. Total clients: {len(clients)}")
-    print(f"📤 Message content: {message_str[:100]}...")  # 只打印前100个字符
-    
-    if len(clients) == 0:
+
+    # 放入各连接的发送队列后立即返回，由每个连接的发送协程并发发送（见 ws_router）
+    delivered = route_message(message_str, account_name)
+    print(f"📤 Queued message for {delivered} client(s) (account={account_name or '*'}): {message_str[:100]}...")
+    if delivered == 0:
         print("⚠️ Warning: No clients connected!")
-        return
-        
-    for client in clients:
-        try:
-            print(f"📤 Sending to client: {client}")
-            await client.send_text(message_str)
-            print(f"✅ Message sent successfully to client")
-        except Exception as e:
-            print(f"❌ Error sending message to client: {e}")
-            import traceback
-            traceback.print_exc()
 
 def save_pcm_as_wav(pcm_data: bytes, file_path: str, sample_rate: int = 24000, channels: int = 1, sample_width: int = 2):
     with wave.open(file_path, 'wb') as wav_file:
@@ -527,31 +581,49 @@ def save_pcm_as_wav(pcm_data: bytes, file_path: str, sample_rate: int = 24000, c
 
 async def openai_text_to_speech(prompt, output_path, voice=None):
     """voice: 可选，不传则用 OPENAI_TTS_VOICE。用于对话卡片 A/NPC 与 B/用户 不同人声。"""
+    from .audio_format import provider_encoding
     voice = voice or OPENAI_TTS_VOICE
     file_extension = Path(output_path).suffix.lstrip('.').lower()
 
     voice_speed = float(os.getenv("VOICE_SPEED", "1.0"))
 
-    async with aiohttp.ClientSession() as session:
-        if file_extension == 'wav':
-            pcm_data = await fetch_pcm_audio(OPENAI_MODEL_TTS, voice, prompt, OPENAI_TTS_URL, session)
-            save_pcm_as_wav(pcm_data, output_path)
-        else:
-            try:
-                async with session.post(
-                    url=OPENAI_TTS_URL,
-                    headers={"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"},
-                    json={"model": OPENAI_MODEL_TTS, "voice": voice, "input": prompt, "response_format": file_extension, "speed": voice_speed},
-                    timeout=30
-                ) as response:
-                    response.raise_for_status()
-                    with open(output_path, 'wb') as f:
-                        async for chunk in response.content.iter_chunked(8192):
-                            f.write(chunk)
+    # 相同文本/人声/格式/语速已合成过则直接从缓存复制
+    from .tts_cache import tts_cache_key, afetch_cached_audio, astore_cached_audio
+    cache_key = tts_cache_key(prompt, voice, file_extension, voice_speed, f"openai:{OPENAI_MODEL_TTS}")
+    if await afetch_cached_audio(cache_key, file_extension, output_path):
+        print("Audio served from TTS cache (OpenAI).")
+        return
 
-                print("Audio generated successfully with OpenAI.")
-            except aiohttp.ClientError as e:
-                print(f"Error during OpenAI TTS: {e}")
+    session = get_http_session()
+    if file_extension == 'wav':
+        try:
+            with TTS_SECONDS.time(provider="openai"):
+                pcm_data = await fetch_pcm_audio(OPENAI_MODEL_TTS, voice, prompt, OPENAI_TTS_URL, session)
+        except Exception:
+            PROVIDER_ERRORS.inc(provider="openai", stage="tts")
+            raise
+        save_pcm_as_wav(pcm_data, output_path)
+        await astore_cached_audio(cache_key, file_extension, output_path)
+    else:
+        try:
+            tts_start = time.perf_counter()
+            async with session.post(
+                url=OPENAI_TTS_URL,
+                headers={"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"},
+                json={"model": OPENAI_MODEL_TTS, "voice": voice, "input": prompt, "response_format": provider_encoding("openai", file_extension), "speed": voice_speed},
+                timeout=30
+            ) as response:
+                response.raise_for_status()
+                with open(output_path, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(8192):
+                        f.write(chunk)
+            TTS_SECONDS.observe(time.perf_counter() - tts_start, provider="openai")
+
+            await astore_cached_audio(cache_key, file_extension, output_path)
+            print("Audio generated successfully with OpenAI.")
+        except aiohttp.ClientError as e:
+            PROVIDER_ERRORS.inc(provider="openai", stage="tts")
+            print(f"Error during OpenAI TTS: {e}")
 
 async def fetch_pcm_audio(model: str, voice: str, input_text: str, api_url: str, session: aiohttp.ClientSession) -> bytes:
     pcm_data = io.BytesIO()
@@ -597,46 +669,29 @@ async def elevenlabs_text_to_speech(text, output_path):
     }
 
     try:
-        async with aiohttp.ClientSession() as session:
-            try:
-                # Increase timeout for longer content
-                timeout = aiohttp.ClientTimeout(total=60)  # 60 seconds timeout for larger audio files
-                async with session.post(tts_url, headers=headers, json=data, timeout=timeout) as response:
-                    if response.status == 200:
-                        with open(output_path, "wb") as f:
-                            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
-                                f.write(chunk)
-                        print("Audio stream saved successfully.")
-                        return True
-                    else:
-                        error_text = await response.text()
-                        print(f"Error generating speech (HTTP {response.status}): {error_text}")
-                        # Notify clients about the error
-                        await send_message_to_clients(json.dumps({
-                            "action": "error",
-                            "message": f"ElevenLabs TTS error: {response.status}"
-                        }))
-                        return False
-            except asyncio.TimeoutError:
-                print("ElevenLabs TTS request timed out. Try a shorter text or check your connection.")
-                await send_message_to_clients(json.dumps({
-                    "action": "error",
-                    "message": "ElevenLabs TTS request timed out. Text may be too long."
-                }))
-                return False
-            except Exception as e:
-                print(f"Error during ElevenLabs TTS API call: {str(e)}")
-                await send_message_to_clients(json.dumps({
-                    "action": "error",
-                    "message": f"ElevenLabs TTS error: {str(e)}"
-                }))
-                return False
+        session = get_http_session()
+        try:
+            # Increase timeout for longer content
+            timeout = aiohttp.ClientTimeout(total=60)  # 60 seconds timeout for larger audio files
+            async with session.post(tts_url, headers=headers, json=data, timeout=timeout) as response:
+                if response.status == 200:
+                    with open(output_path, "wb") as f:
+                        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                            f.write(chunk)
+                    print("Audio stream saved successfully.")
+                    return True
+                else:
+                    error_text = await response.text()
+                    print(f"Error generating speech (HTTP {response.status}): {error_text}")
+                    return False
+        except asyncio.TimeoutError:
+            print("ElevenLabs TTS request timed out. Try a shorter text or check your connection.")
+            return False
+        except Exception as e:
+            print(f"Error during ElevenLabs TTS API call: {str(e)}")
+            return False
     except Exception as e:
         print(f"Critical error in ElevenLabs TTS: {str(e)}")
-        await send_message_to_clients(json.dumps({
-            "action": "error",
-            "message": "Failed to connect to ElevenLabs TTS service"
-        }))
         return False
 
 def sanitize_response(response):
@@ -930,8 +985,8 @@ def chatgpt_streamed(user_input, system_message, mood_prompt, conversation_histo
 async def chatgpt_streamed_async(user_input, system_message, mood_prompt, conversation_history):
     """异步版本的LLM调用函数：只支持全局API_PROVIDER指定的供应商，失败时直接返回错误
     
-    这个异步版本可以避免阻塞事件循环，特别是对于豆包这种同步API调用。
-    对于OpenAI，保持流式响应；对于豆包，使用asyncio.to_thread包装同步调用，并启用流式响应。
+    这个异步版本可以避免阻塞事件循环。
+    对于OpenAI，保持流式响应（线程池中执行）；对于豆包，使用 DoubaoLLMClient.achat 原生异步流式调用。
     """
     import time
     start_time = time.time()
@@ -971,6 +1026,7 @@ async def chatgpt_streamed_async(user_input, system_message, mood_prompt, conver
                 
                 full_response = ""
                 line_buffer = ""
+                first_token = True
                 for line in response.iter_lines(decode_unicode=True):
                     if line.startswith("data:"):
                         line = line[5:].strip()
@@ -979,6 +1035,9 @@ async def chatgpt_streamed_async(user_input, system_message, mood_prompt, conver
                             chunk = json.loads(line)
                             delta_content = chunk['choices'][0]['delta'].get('content', '')
                             if delta_content:
+                                if first_token:
+                                    LLM_TTFT_SECONDS.observe(time.time() - start_time, provider="openai")
+                                    first_token = False
                                 line_buffer += delta_content
                                 if '\n' in line_buffer:
                                     lines = line_buffer.split('\n')
@@ -999,9 +1058,11 @@ async def chatgpt_streamed_async(user_input, system_message, mood_prompt, conver
             full_response = await asyncio.to_thread(_openai_stream_sync)
             
             total_time = time.time() - start_time
+            LLM_SECONDS.observe(total_time, provider="openai")
             print(f"Debug: OpenAI total time: {total_time:.2f}s, response length: {len(full_response)}")
 
         except Exception as e:
+            PROVIDER_ERRORS.inc(provider="openai", stage="llm")
             full_response = f"Error connecting to OpenAI model: {e}"
             print(f"Debug: OpenAI error - {e}")
             
@@ -1018,23 +1079,14 @@ async def chatgpt_streamed_async(user_input, system_message, mood_prompt, conver
             
             print(f"Debug: Sending request to Doubao LLM (async)")
             
-            # 使用asyncio.to_thread包装同步调用，避免阻塞事件循环
-            def _doubao_chat_sync():
-                """同步的豆包LLM调用，将在线程池中执行"""
-                # 与OpenAI保持一致的参数设置
-                # 关键优化：启用流式响应，边接收边处理，提升响应速度
-                # 注意：豆包API使用max_tokens（对应OpenAI的max_completion_tokens）
-                # temperature设置为0.7（OpenAI默认值通常是1.0，但0.7是更常用的值，保持现有设置）
-                return doubao_llm_client.chat(
-                    messages,
-                    temperature=0.7,  # 保持现有设置
-                    max_tokens=token_limit,  # 添加token限制，与OpenAI保持一致
-                    stream=True  # 启用流式响应，关键优化点！
-                )
-            
-            # 在线程池中执行同步调用，不阻塞事件循环
+            # 原生异步调用：共享 aiohttp 长连接会话，不占用线程池、不必每次重新握手
             api_start_time = time.time()
-            response = await asyncio.to_thread(_doubao_chat_sync)
+            response = await doubao_llm_client.achat(
+                messages,
+                temperature=0.7,  # 保持现有设置
+                max_tokens=token_limit,  # 添加token限制，与OpenAI保持一致
+                stream=True  # 启用流式响应，关键优化点！
+            )
             api_time = time.time() - api_start_time
             
             if response:
@@ -1071,6 +1123,97 @@ async def chatgpt_streamed_async(user_input, system_message, mood_prompt, conver
     print(f"streaming complete. Response length: {PINK}{len(full_response)}{RESET_COLOR}")
     return full_response
 
+async def chatgpt_stream_deltas(user_input, system_message, mood_prompt, conversation_history):
+    """流式版LLM调用：以异步迭代器逐段产出回复增量（供 stream_reply_and_play 边生成边合成语音）。
+
+    供应商选择、参数与 chatgpt_streamed_async 一致；豆包直接迭代 DoubaoLLMClient.astream，
+    OpenAI 的同步流式请求在线程池中执行，增量经队列转交事件循环。
+    出错时产出一条 "Error: ..." 文本（与 chatgpt_streamed_async 的返回约定相同）。
+    """
+    import time
+    start_time = time.time()
+    print(f"Debug: stream_deltas started. API_PROVIDER: {API_PROVIDER}")
+    token_limit = min(4000, MAX_CHAR_LENGTH * 4 // 3)
+    messages = [{"role": "system", "content": system_message + "\n" + mood_prompt}] + conversation_history + [{"role": "user", "content": user_input}]
+    provider = API_PROVIDER
+
+    if provider == 'doubao':
+        if doubao_llm_client is None:
+            yield "Error: 豆包LLM客户端未初始化，请检查环境变量配置（DOUBAO_API_KEY, LLM_MODEL）"
+            return
+        emitted = False
+        try:
+            async for delta in doubao_llm_client.astream(messages, temperature=0.7, max_tokens=token_limit):
+                emitted = True
+                yield delta
+        except Exception as e:
+            PROVIDER_ERRORS.inc(provider="doubao", stage="llm")
+            print(f"Debug: 豆包LLM错误 - {e!r}")
+            if not emitted:
+                yield f"Error: 豆包LLM API调用失败 - {e}"
+            return
+        if not emitted:
+            yield "Error: 豆包LLM返回空响应，请检查API配置"
+        return
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    end_marker = object()
+    emitted = False
+
+    def emit(text):
+        nonlocal emitted
+        if text:
+            emitted = True
+            loop.call_soon_threadsafe(queue.put_nowait, text)
+
+    def _stream_sync():
+        try:
+            if provider == 'openai':
+                headers = {'Authorization': f'Bearer {OPENAI_API_KEY}', 'Content-Type': 'application/json'}
+                payload = {
+                    "model": OPENAI_MODEL,
+                    "messages": messages,
+                    "stream": True,
+                    "max_completion_tokens": token_limit
+                }
+                response = requests.post(OPENAI_BASE_URL, headers=headers, json=payload, stream=True, timeout=45)
+                response.raise_for_status()
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith("data:"):
+                        line = line[5:].strip()
+                    if not line or line == "[DONE]":
+                        continue
+                    try:
+                        chunk = json.loads(line)
+                        emit(chunk['choices'][0]['delta'].get('content', ''))
+                    except (json.JSONDecodeError, KeyError, IndexError):
+                        continue
+            else:
+                emit(f"Error: 不支持的API供应商 '{provider}'，仅支持 'doubao' 或 'openai'")
+        except Exception as e:
+            PROVIDER_ERRORS.inc(provider=provider, stage="llm")
+            print(f"Debug: LLM stream error - {e}")
+            if not emitted:
+                emit(f"Error: LLM API调用失败 - {e}")
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, end_marker)
+
+    worker = loop.run_in_executor(None, _stream_sync)
+    first_delta_time = None
+    while True:
+        item = await queue.get()
+        if item is end_marker:
+            break
+        if first_delta_time is None:
+            first_delta_time = time.time()
+            LLM_TTFT_SECONDS.observe(first_delta_time - start_time, provider=provider)
+            print(f"Debug: first LLM delta in {first_delta_time - start_time:.2f}s")
+        yield item
+    await worker
+    LLM_SECONDS.observe(time.time() - start_time, provider=provider)
+    print(f"Debug: LLM stream total time: {time.time() - start_time:.2f}s")
+
 # save_conversation_history 函数已移除（conversation_history.txt 功能已移除）
 
 def transcribe_with_whisper(audio_file):
@@ -1168,8 +1311,7 @@ async def execute_once(question_prompt):
     if TTS_PROVIDER == 'elevenlabs':
         # Convert MP3 to WAV if ElevenLabs is used
         temp_wav_path = os.path.join(output_dir, 'temp_output.wav')
-        audio = AudioSegment.from_mp3(temp_audio_path)
-        audio.export(temp_wav_path, format="wav")
+        await run_audio_job(mp3_to_wav_file, temp_audio_path, temp_wav_path)
         await play_audio(temp_wav_path)
     else:
         await play_audio(temp_audio_path)
@@ -1195,7 +1337,7 @@ async def execute_screenshot_and_analyze(account_name=None):
     # 不再保存全局历史文件（conversation_history.txt 已移除）
     
     # Send the response to any connected websocket clients
-    await send_message_to_clients(f"{current_character}: {text_response}")
+    await send_message_to_clients(f"{current_character}: {text_response}", account_name=acc)
     
     print("\nReady for the next question....")
 
@@ -1224,17 +1366,17 @@ async def analyze_image(image_path, question_prompt):
             "stream": False
         }
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(f'{OLLAMA_BASE_URL}/api/generate', headers=headers, json=payload, timeout=30) as response:
-                    print(f"Response status code: {response.status}")
-                    if response.status == 200:
-                        print("Using ollama for image analysis")
-                        response_json = await response.json()
-                        return {"choices": [{"message": {"content": response_json.get('response', 'No response received.')}}]}
-                    elif response.status == 404:
-                        return {"choices": [{"message": {"content": "The llava model is not available on this server."}}]}
-                    else:
-                        response.raise_for_status()
+            session = get_http_session()
+            async with session.post(f'{OLLAMA_BASE_URL}/api/generate', headers=headers, json=payload, timeout=30) as response:
+                print(f"Response status code: {response.status}")
+                if response.status == 200:
+                    print("Using ollama for image analysis")
+                    response_json = await response.json()
+                    return {"choices": [{"message": {"content": response_json.get('response', 'No response received.')}}]}
+                elif response.status == 404:
+                    return {"choices": [{"message": {"content": "The llava model is not available on this server."}}]}
+                else:
+                    response.raise_for_status()
         except aiohttp.ClientError as e:
             print(f"Request failed: {e}")
             return {"choices": [{"message": {"content": "Failed to process the image with the llava model."}}]}
@@ -1259,16 +1401,16 @@ async def analyze_image(image_path, question_prompt):
         }
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(f"{XAI_BASE_URL}/chat/completions", headers=headers, json=payload, timeout=30) as response:
-                    if response.status == 200:
-                        print("Using xAI for image analysis")
-                        return await response.json()
-                    else:
-                        # If XAI returns an error,
-                        # fall back to OpenAI's image analysis
-                        print("XAI image analysis failed or not supported, falling back to OpenAI")
-                        return await fallback_to_openai_image_analysis(encoded_image, question_prompt)
+            session = get_http_session()
+            async with session.post(f"{XAI_BASE_URL}/chat/completions", headers=headers, json=payload, timeout=30) as response:
+                if response.status == 200:
+                    print("Using xAI for image analysis")
+                    return await response.json()
+                else:
+                    # If XAI returns an error,
+                    # fall back to OpenAI's image analysis
+                    print("XAI image analysis failed or not supported, falling back to OpenAI")
+                    return await fallback_to_openai_image_analysis(encoded_image, question_prompt)
         except aiohttp.ClientError as e:
             print(f"XAI image analysis failed: {e}, falling back to OpenAI")
             return await fallback_to_openai_image_analysis(encoded_image, question_prompt)
@@ -1287,7 +1429,7 @@ async def analyze_image(image_path, question_prompt):
             messages = [{"role": "user", "content": prompt_with_image}]
             # 图片分析也使用max_tokens限制，与OpenAI保持一致
             image_analysis_token_limit = min(4000, MAX_CHAR_LENGTH * 4 // 3)
-            response = doubao_llm_client.chat(messages, temperature=0.7, max_tokens=image_analysis_token_limit)
+            response = await doubao_llm_client.achat(messages, temperature=0.7, max_tokens=image_analysis_token_limit, stream=False)
             if response:
                 return {"choices": [{"message": {"content": response}}]}
             else:
@@ -1320,11 +1462,11 @@ async def fallback_to_openai_image_analysis(encoded_image, question_prompt):
     }
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload, timeout=30) as response:
-                response.raise_for_status()
-                print("Using OpenAI for image analysis")
-                return await response.json()
+        session = get_http_session()
+        async with session.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload, timeout=30) as response:
+            response.raise_for_status()
+            print("Using OpenAI for image analysis")
+            return await response.json()
     except aiohttp.ClientError as e:
         print(f"OpenAI fallback request failed: {e}")
         return {"choices": [{"message": {"content": "Failed to process the image with both XAI and OpenAI models."}}]}
@@ -1337,19 +1479,22 @@ async def generate_speech(text, temp_audio_path):
         if not OPENAI_API_KEY:
             print("Error: OpenAI API密钥未配置")
             return False
+        from .audio_format import provider_encoding
+        # 按输出路径扩展名请求对应格式（.mp3 / .ogg 为压缩格式，.wav 为 PCM）
+        response_format = provider_encoding("openai", Path(temp_audio_path).suffix.lstrip('.').lower())
         headers = {"Content-Type": "application/json", "Authorization": f"Bearer {OPENAI_API_KEY}"}
-        payload = {"model": OPENAI_MODEL_TTS, "voice": OPENAI_TTS_VOICE, "speed": float(VOICE_SPEED), "input": text, "response_format": "wav"}
+        payload = {"model": OPENAI_MODEL_TTS, "voice": OPENAI_TTS_VOICE, "speed": float(VOICE_SPEED), "input": text, "response_format": response_format}
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(OPENAI_TTS_URL, headers=headers, json=payload, timeout=30) as response:
-                    if response.status == 200:
-                        with open(temp_audio_path, "wb") as audio_file:
-                            audio_file.write(await response.read())
-                        return True
-                    else:
-                        error_text = await response.text()
-                        print(f"Error: OpenAI TTS API调用失败 - HTTP {response.status}: {error_text}")
-                        return False
+            session = get_http_session()
+            async with session.post(OPENAI_TTS_URL, headers=headers, json=payload, timeout=30) as response:
+                if response.status == 200:
+                    with open(temp_audio_path, "wb") as audio_file:
+                        audio_file.write(await response.read())
+                    return True
+                else:
+                    error_text = await response.text()
+                    print(f"Error: OpenAI TTS API调用失败 - HTTP {response.status}: {error_text}")
+                    return False
         except Exception as e:
             print(f"Error: OpenAI TTS API调用失败 - {str(e)}")
             return False
@@ -1363,9 +1508,8 @@ async def generate_speech(text, temp_audio_path):
             temp_mp3_path = temp_audio_path.replace('.wav', '.mp3')
             success = await doubao_text_to_speech(text, temp_mp3_path)
             if success and os.path.exists(temp_mp3_path):
-                # 转换mp3到wav
-                audio = AudioSegment.from_mp3(temp_mp3_path)
-                audio.export(temp_audio_path, format="wav")
+                # 转换mp3到wav（音频进程池）
+                await run_audio_job(mp3_to_wav_file, temp_mp3_path, temp_audio_path)
                 os.remove(temp_mp3_path)  # 删除临时mp3文件
                 return True
             else:
@@ -1413,92 +1557,79 @@ async def kokoro_text_to_speech(text, output_path):
             base64_auth = base64.b64encode(auth_bytes).decode('ascii')
             headers["Authorization"] = f"Basic {base64_auth}"
         
-        # Make the request with SSL verification disabled
-        connector = aiohttp.TCPConnector(ssl=False)
-        async with aiohttp.ClientSession(connector=connector) as session:
-            async with session.post(kokoro_url, json=payload, headers=headers) as response:
-                if response.status == 200:
-                    # Save the audio data to file
-                    with open(output_path, 'wb') as f:
-                        async for chunk in response.content.iter_chunked(1024):
-                            f.write(chunk)
+        # Make the request with SSL verification disabled (shared pooled session)
+        session = get_http_session(verify_ssl=False)
+        async with session.post(kokoro_url, json=payload, headers=headers) as response:
+            if response.status == 200:
+                # Save the audio data to file
+                with open(output_path, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(1024):
+                        f.write(chunk)
                     
-                    print("Audio generated successfully with Kokoro.")
-                    return True
-                else:
-                    error_text = await response.text()
-                    print(f"Error from Kokoro API: HTTP {response.status} - {error_text}")
-                    await send_message_to_clients(json.dumps({
-                        "action": "error",
-                        "message": f"Kokoro TTS error: HTTP {response.status}"
-                    }))
-                    return False
+                print("Audio generated successfully with Kokoro.")
+                return True
+            else:
+                error_text = await response.text()
+                print(f"Error from Kokoro API: HTTP {response.status} - {error_text}")
+                return False
                 
     except Exception as e:
         print(f"Error during Kokoro TTS generation: {e}")
-        await send_message_to_clients(json.dumps({
-            "action": "error",
-            "message": f"Kokoro TTS error: {str(e)}"
-        }))
         return False
 
 async def doubao_text_to_speech(text, output_path, voice_type=None):
-    """Convert text to speech using Doubao TTS API. voice_type: 可选，用于对话卡片 A/NPC 与 B/用户 不同人声。"""
+    """Convert text to speech using Doubao TTS API. voice_type: 可选，用于对话卡片 A/NPC 与 B/用户 不同人声。
+    失败时只记日志并返回 False，由调用方按账号向对应连接报错（这里没有账号上下文，不能广播）。"""
     global doubao_tts_client
     
+    # 相同文本/人声/格式已合成过则直接从缓存复制，不再请求豆包
+    from .tts_cache import tts_cache_key, afetch_cached_audio, astore_cached_audio
+    file_extension = Path(output_path).suffix.lstrip('.').lower()
+    voice = voice_type or (doubao_tts_client.voice_type if doubao_tts_client is not None else os.getenv("TTS_VOICE_TYPE"))
+    cache_key = tts_cache_key(text, voice, file_extension, None, "doubao")
+    if await afetch_cached_audio(cache_key, file_extension, output_path):
+        print("Audio served from TTS cache (Doubao).")
+        return True
+    
     if doubao_tts_client is None:
         print("豆包TTS客户端未初始化")
-        await send_message_to_clients(json.dumps({
-            "action": "error",
-            "message": "豆包TTS客户端未初始化，请检查环境变量配置"
-        }))
         return False
     
     try:
-        # 调用豆包TTS API（可传入 voice_type 区分 A/B 人声）
-        audio_data = await asyncio.to_thread(
-            doubao_tts_client.synthesize,
-            text,
-            voice_type
-        )
+        # 调用豆包TTS API（可传入 voice_type 区分 A/B 人声）；在当前事件循环上复用连接池，不再每句新建连接
+        tts_start = time.perf_counter()
+        # 压缩格式（.mp3 / .ogg）直接按扩展名请求对应编码并原样保存；.wav 沿用配置的编码，必要时转码
+        if file_extension in ('mp3', 'ogg'):
+            from .audio_format import provider_encoding
+            audio_data = await doubao_tts_client.synthesize_async(text, voice_type, provider_encoding("doubao", file_extension))
+        else:
+            audio_data = await doubao_tts_client.synthesize_async(text, voice_type)
         
         if audio_data:
-            # 根据输出路径的扩展名确定格式
-            file_extension = Path(output_path).suffix.lstrip('.').lower()
-            
-            # 如果输出格式是mp3，直接保存
-            if file_extension == 'mp3':
+            TTS_SECONDS.observe(time.perf_counter() - tts_start, provider="doubao")
+            # 根据输出路径的扩展名确定格式（file_extension 已在上方取得）
+            # 如果输出格式是mp3 / ogg，直接保存
+            if file_extension in ('mp3', 'ogg'):
                 with open(output_path, 'wb') as f:
                     f.write(audio_data)
             else:
                 # 如果输出格式是wav，需要转换
-                # 豆包TTS默认返回mp3，需要转换为wav
-                from pydub import AudioSegment
-                import io
-                
-                # 从内存中读取mp3数据
-                audio_segment = AudioSegment.from_mp3(io.BytesIO(audio_data))
-                # 导出为wav
-                audio_segment.export(output_path, format="wav")
+                # 豆包TTS默认返回mp3，在音频进程池中从内存数据转换为wav
+                await run_audio_job(mp3_to_wav_file, audio_data, output_path)
             
+            await astore_cached_audio(cache_key, file_extension, output_path)
             print("Audio generated successfully with Doubao TTS.")
             return True
         else:
+            PROVIDER_ERRORS.inc(provider="doubao", stage="tts")
             print("豆包TTS返回空数据")
-            await send_message_to_clients(json.dumps({
-                "action": "error",
-                "message": "豆包TTS生成失败：返回空数据"
-            }))
             return False
             
     except Exception as e:
+        PROVIDER_ERRORS.inc(provider="doubao", stage="tts")
         print(f"Error during Doubao TTS generation: {e}")
         import traceback
         traceback.print_exc()
-        await send_message_to_clients(json.dumps({
-            "action": "error",
-            "message": f"豆包TTS错误: {str(e)}"
-        }))
         return False
 
 async def user_chatbot_conversation():
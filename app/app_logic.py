@@ -61,6 +61,9 @@ characters_folder = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath
 # Maximum character length for audio generation
 MAX_CHAR_LENGTH = int(os.getenv('MAX_CHAR_LENGTH', 500))
 
+# 流式语音：LLM 边生成边按句合成并推送 ai_audio_chunk；关闭后恢复为整段回复生成完再合成一次
+STREAM_TTS_ENABLED = os.getenv('STREAM_TTS_ENABLED', 'true').lower() == 'true'
+
 # Global variable to store the current transcription model
 FASTER_WHISPER_LOCAL = os.getenv("FASTER_WHISPER_LOCAL", "true").lower() == "true"
 current_transcription_model = "gpt-4o-mini-transcribe"
@@ -77,14 +80,14 @@ def set_transcription_model(model_name):
     print(f"Transcription set to: {'Local Whisper' if use_local_whisper else current_transcription_model}")
     return {"status": "success", "message": f"Transcription model set to: {'Local Whisper' if use_local_whisper else current_transcription_model}"}
 
-async def record_audio_and_transcribe():
-    """Record audio and transcribe it using the selected method"""
+async def record_audio_and_transcribe(account_name=None):
+    """Record audio and transcribe it using the selected method（状态消息只发给 account_name 的连接）"""
     
     # Create a custom callback that works with our clients set
     async def status_callback(status_data):
         message = json.dumps(status_data) if isinstance(status_data, dict) else status_data
         # Use the existing send_message_to_clients function from shared
-        await send_message_to_clients(message)
+        await send_message_to_clients(message, account_name=account_name)
         
     # Use our new unified transcription module
     user_input = await transcribe_audio(
@@ -168,7 +171,7 @@ async def process_text(user_input, account_name=None):
             await send_message_to_clients({
                 "action": "ai_message",
                 "text": "好的，让我为你生成一段个性化的英文对话！"
-            })
+            }, account_name=acc)
     
     elif learning_stage == "english_learning":
         # 英文学习阶段
@@ -231,14 +234,23 @@ async def process_text(user_input, account_name=None):
             import traceback
             traceback.print_exc()
 
-    # 使用异步版本的LLM调用，避免阻塞事件循环
-    from .app import chatgpt_streamed_async
-    chatbot_response = await chatgpt_streamed_async(user_input, base_system_message, mood_prompt, conversation_history)
-    sanitized_response = sanitize_response(chatbot_response)
-    # Limit the response length to the MAX_CHAR_LENGTH for audio generation
-    if len(sanitized_response) > MAX_CHAR_LENGTH:
-        sanitized_response = sanitized_response[:MAX_CHAR_LENGTH] + "..."
-    prompt2 = sanitized_response
+    if STREAM_TTS_ENABLED:
+        # 流式：每生成完一句就提交 TTS，语音分段在后台按顺序推送，这里拿到完整回复后继续保存/显示文字
+        from .app import chatgpt_stream_deltas, stream_reply_and_play
+        chatbot_response = await stream_reply_and_play(
+            chatgpt_stream_deltas(user_input, base_system_message, mood_prompt, conversation_history),
+            account_name=acc,
+        )
+        prompt2 = None
+    else:
+        # 使用异步版本的LLM调用，避免阻塞事件循环
+        from .app import chatgpt_streamed_async
+        chatbot_response = await chatgpt_streamed_async(user_input, base_system_message, mood_prompt, conversation_history)
+        sanitized_response = sanitize_response(chatbot_response)
+        # Limit the response length to the MAX_CHAR_LENGTH for audio generation
+        if len(sanitized_response) > MAX_CHAR_LENGTH:
+            sanitized_response = sanitized_response[:MAX_CHAR_LENGTH] + "..."
+        prompt2 = sanitized_response
 
     conversation_history.append({"role": "assistant", "content": chatbot_response})
     
@@ -264,7 +276,7 @@ async def process_text(user_input, account_name=None):
         "action": "ai_message",
         "text": chatbot_response,
         "character": current_character
-    })
+    }, account_name=acc)
     
     # 让出控制权，确保WebSocket消息已经真正发送到网络
     # 这确保消息发送完成后再创建音频任务
@@ -272,7 +284,8 @@ async def process_text(user_input, account_name=None):
     
     # 再异步执行 process_and_play（语音处理/播放），按用户传 account
     # 不阻塞主流程，文字已经显示，音频在后台处理
-    asyncio.create_task(process_and_play(prompt2, character_audio_file, account_name=acc))
+    if prompt2 is not None:
+        asyncio.create_task(process_and_play(prompt2, character_audio_file, account_name=acc))
     
     # 继续执行保存历史等操作（不等待音频播放完成）
     # Check if this is a story or game character
@@ -356,7 +369,7 @@ async def start_conversation(account_name=None):
 
     print(f"Starting conversation with character {current_character}, history size: {len(conversation_history)} (account={acc})")
 
-    await send_message_to_clients({"type": "waiting"})
+    await send_message_to_clients({"type": "waiting"}, account_name=acc)
     Thread(target=asyncio.run, args=(conversation_loop(acc),)).start()
     return {"status": "started"}
 
@@ -373,7 +386,7 @@ async def conversation_loop(account_name=None):
     conversation_history = get_conversation_history(acc)
 
     while get_continue_conversation(acc):
-        user_input = await record_audio_and_transcribe()
+        user_input = await record_audio_and_transcribe(acc)
 
         if user_input is None:
             print("Warning: Received None input from transcription")
@@ -387,7 +400,7 @@ async def conversation_loop(account_name=None):
             save_character_specific_history(conversation_history, current_character)
             print(f"Saved user input to character-specific history for {current_character}")
 
-        await send_message_to_clients(f"You: {user_input}")
+        await send_message_to_clients(f"You: {user_input}", account_name=acc)
         print(CYAN + f"You: {user_input}" + RESET_COLOR)
 
         words = user_input.lower().split()
@@ -407,7 +420,7 @@ async def conversation_loop(account_name=None):
             print(chatbot_response)
 
         current_character = get_current_character(acc)
-        await send_message_to_clients(chatbot_response)
+        await send_message_to_clients(chatbot_response, account_name=acc)
 
 def set_env_variable(key: str, value: str):
     os.environ[key] = value
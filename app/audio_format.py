@@ -0,0 +1,107 @@
+# 回复语音的输出格式协商：AI 回复、沉浸式对话等发给浏览器的语音默认用压缩格式（MP3 / Ogg Opus），
+# 由 TTS 供应商直接产出，不再先合成 MP3 再解码成 WAV（省一次转码，文件约小 10 倍）。
+# 客户端可在请求中带 audio_format（mp3 / opus / wav）能力字段，或通过 Accept 头声明可播放的格式；
+# 都没有时用 AUDIO_OUTPUT_FORMAT。WAV 只留给确实需要 PCM 的场景（ASR、练习录音归档、本地播放）。
+import os
+from typing import Optional
+
+# 默认输出格式：mp3（所有浏览器可播）/ opus（Ogg 封装，更小，旧版 Safari 不支持）/ wav
+AUDIO_OUTPUT_FORMAT = os.getenv("AUDIO_OUTPUT_FORMAT", "mp3").strip().lower()
+
+# 格式 -> 文件扩展名
+FORMAT_EXTENSIONS = {"mp3": "mp3", "opus": "ogg", "wav": "wav"}
+
+# Accept 中的 MIME -> 格式
+_ACCEPT_TYPES = {
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/ogg": "opus",
+    "audio/opus": "opus",
+    "audio/wav": "wav",
+    "audio/x-wav": "wav",
+    "audio/wave": "wav",
+}
+
+# 各 TTS 供应商请求对应格式时使用的参数值
+_PROVIDER_ENCODINGS = {
+    "doubao": {"mp3": "mp3", "opus": "ogg_opus", "wav": "wav"},
+    "openai": {"mp3": "mp3", "opus": "opus", "wav": "wav"},
+}
+
+
+def normalize_audio_format(value: Optional[str]) -> Optional[str]:
+    """把 mp3 / opus / ogg / wav 等写法统一为格式名，无法识别返回 None"""
+    value = (value or "").strip().lower()
+    if value in ("ogg", "ogg_opus", "webm", "opus"):
+        return "opus"
+    return value if value in FORMAT_EXTENSIONS else None
+
+
+def default_audio_format() -> str:
+    return normalize_audio_format(AUDIO_OUTPUT_FORMAT) or "mp3"
+
+
+def negotiate_audio_format(accept: Optional[str] = None, capability: Optional[str] = None) -> str:
+    """按能力字段 > Accept（q 值最高且可产出的格式）> 默认格式 选出输出格式"""
+    fmt = normalize_audio_format(capability)
+    if fmt:
+        return fmt
+    best, best_q = None, 0.0
+    for part in (accept or "").split(","):
+        media, _, params = part.strip().partition(";")
+        fmt = _ACCEPT_TYPES.get(media.strip().lower())
+        if fmt is None:
+            continue
+        q = 1.0
+        for p in params.split(";"):
+            k, _, v = p.strip().partition("=")
+            if k == "q":
+                try:
+                    q = float(v)
+                except ValueError:
+                    q = 0.0
+        # 同分时优先服务端默认格式
+        if q > best_q or (q == best_q and q > 0 and fmt == default_audio_format()):
+            best, best_q = fmt, q
+    return best or default_audio_format()
+
+
+def audio_extension(fmt: Optional[str]) -> str:
+    return FORMAT_EXTENSIONS[normalize_audio_format(fmt) or default_audio_format()]
+
+
+def provider_encoding(provider: str, ext: str) -> str:
+    """按输出文件扩展名给出供应商请求参数（豆包 encoding / OpenAI response_format）"""
+    fmt = normalize_audio_format(ext) or "wav"
+    return _PROVIDER_ENCODINGS.get(provider, {}).get(fmt, fmt)
+
+
+# ---------- 按账号记住客户端声明的格式（WebSocket 推送的回复语音没有可协商的 HTTP 请求） ----------
+
+def set_account_audio_format(account_name: Optional[str], fmt: Optional[str]) -> None:
+    from .shared import get_user_state, _save_user_state
+    fmt = normalize_audio_format(fmt)
+    if fmt is None:
+        return
+    state = get_user_state(account_name)
+    if state.get("audio_format") != fmt:
+        state["audio_format"] = fmt
+        _save_user_state(account_name)
+
+
+def get_account_audio_format(account_name: Optional[str]) -> str:
+    from .shared import get_user_state
+    return normalize_audio_format(get_user_state(account_name).get("audio_format")) or default_audio_format()
+
+
+def remember_request_audio_format(request, account_name: Optional[str], capability: Optional[str] = None) -> str:
+    """从请求的 audio_format 字段 / Accept 头协商格式，显式声明时记到账号上，供之后的 WebSocket 回复语音使用；
+    两者都没有声明具体音频格式时沿用该账号之前声明的格式"""
+    accept = request.headers.get("accept") if request is not None else None
+    declared = normalize_audio_format(capability) or negotiate_audio_format(accept, None)
+    if normalize_audio_format(capability) is None and not any(
+        part.split(";")[0].strip().lower() in _ACCEPT_TYPES for part in (accept or "").split(",")
+    ):
+        return get_account_audio_format(account_name)
+    set_account_audio_format(account_name, declared)
+    return declared
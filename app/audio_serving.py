@@ -0,0 +1,149 @@
+# /audio/ 下生成音频的 HTTP 响应：按扩展名给出正确的 MIME，强 ETag（内容 sha1）+ If-None-Match 返回 304，
+# 单段 Range 请求返回 206（前端拖动进度条不必重新下载整个文件），完整文件用 FileResponse 发送
+# （服务器支持 pathsend / sendfile 扩展时零拷贝）。
+# 写入后不再修改的目录（文件名带随机串或内容哈希）加 Cache-Control: immutable；其余目录每次用 ETag 协商。
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+# 一次生成、文件名唯一或按内容寻址的目录（相对 outputs/ 的第一级）
+IMMUTABLE_PREFIXES = ("tts", "immersive", "practice", "prerendered_tts", "tts_cache")
+# immutable 文件的缓存时长（秒）
+AUDIO_CACHE_MAX_AGE = int(os.getenv("AUDIO_CACHE_MAX_AGE", str(365 * 24 * 3600)))
+# 缓存 ETag 的文件数上限
+_ETAG_CACHE_SIZE = 4096
+_RANGE_CHUNK = 64 * 1024
+
+_MEDIA_TYPES = {
+    ".wav": "audio/wav",
+    ".mp3": "audio/mpeg",
+    ".ogg": "audio/ogg",
+    ".opus": "audio/ogg",
+    ".oga": "audio/ogg",
+    ".webm": "audio/webm",
+    ".m4a": "audio/mp4",
+    ".aac": "audio/aac",
+    ".flac": "audio/flac",
+    ".pcm": "audio/L16",
+}
+
+_etag_lock = threading.Lock()
+# (路径, mtime_ns, 大小) -> ETag，最久未用在前
+_etags: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+
+
+def audio_media_type(path: str) -> Optional[str]:
+    """音频文件的 MIME；不是已知音频扩展名时返回 None（调用方按 404 处理，不对外提供 outputs/ 下的其他文件）"""
+    return _MEDIA_TYPES.get(os.path.splitext(path)[1].lower())
+
+
+def _file_etag(path: str, st: os.stat_result) -> str:
+    """内容 sha1 作为强 ETag；按 (路径, mtime, 大小) 缓存，文件被覆盖写后自动重新计算"""
+    key = (path, st.st_mtime_ns, st.st_size)
+    with _etag_lock:
+        etag = _etags.get(key)
+        if etag is not None:
+            _etags.move_to_end(key)
+            return etag
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    etag = f'"{h.hexdigest()}"'
+    with _etag_lock:
+        _etags[key] = etag
+        while len(_etags) > _ETAG_CACHE_SIZE:
+            _etags.popitem(last=False)
+    return etag
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """解析单段 bytes Range，返回 (start, end)（含 end）；无 / 多段 / 无法识别时返回 None（按完整文件响应）。
+    范围越界时抛 ValueError（416）。"""
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    spec = header[len("bytes="):].strip()
+    start_s, sep, end_s = spec.partition("-")
+    if not sep:
+        return None
+    start_s, end_s = start_s.strip(), end_s.strip()
+    if not (start_s.isdigit() or start_s == "") or not (end_s.isdigit() or end_s == "") or not (start_s or end_s):
+        return None
+    if start_s == "":
+        # bytes=-N：最后 N 个字节
+        length = int(end_s)
+        if length <= 0 or size == 0:
+            raise ValueError(header)
+        return max(0, size - length), size - 1
+    start = int(start_s)
+    end = int(end_s) if end_s else size - 1
+    if start >= size:
+        raise ValueError(header)
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def _iter_range(path: str, start: int, end: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            block = f.read(min(_RANGE_CHUNK, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+def _cache_control(relpath: str) -> str:
+    top = relpath.replace("\\", "/").split("/", 1)[0]
+    if top in IMMUTABLE_PREFIXES:
+        return f"public, max-age={AUDIO_CACHE_MAX_AGE}, immutable"
+    return "no-cache"
+
+
+async def audio_file_response(request: Request, path: str, relpath: str) -> Response:
+    """对已确认存在的音频文件生成响应（ETag / 304 / 206 / 完整文件）。relpath 为相对 outputs/ 的路径，决定缓存策略。
+    调用方需先用 audio_media_type 确认是音频文件。"""
+    import asyncio
+    media_type = audio_media_type(path)
+    st = os.stat(path)
+    etag = await asyncio.to_thread(_file_etag, path, st)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": _cache_control(relpath),
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f"inline; filename={os.path.basename(path)}",
+    }
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and if_range and if_range.strip() != etag:
+        # 文件已变化：忽略 Range，返回完整新文件
+        range_header = None
+    try:
+        byte_range = parse_range(range_header, st.st_size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{st.st_size}"})
+    if byte_range is None:
+        return FileResponse(path, media_type=media_type, headers=headers, stat_result=st)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(_iter_range(path, start, end), status_code=206, media_type=media_type, headers=headers)
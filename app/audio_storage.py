@@ -0,0 +1,224 @@
+# outputs/ 下生成音频的存储管理：每次 AI 回复、沉浸式对话、练习录音、复习对话都会写入新的 WAV，
+# 这里统一分配分片目录，并由后台线程按类别的保留时长与容量上限回收旧文件。
+#
+# - 分片：文件放到 outputs/<类别>/<hh>/ 下（hh 为文件名 / 对话 ID 哈希前两位），单目录文件数保持在可控范围；
+#   复习对话按对话 ID 分片：outputs/english_dialogue/<hh>/<dialogue_id>/。旧的未分片文件仍可访问，照常参与回收。
+# - 回收：先删除最近使用时间（atime 与 mtime 取较大者）早于保留时长的文件，再在超出容量时按最久未用删除；
+#   生成不足 AUDIO_STORAGE_MIN_AGE 秒的文件不删，避免前端还没播放就被回收。
+# - 报告：storage_usage_report() 返回各类别文件数、占用字节、最旧文件年龄与累计回收量，/metrics 与 /api/storage/usage 使用。
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+_PROJECT_DIR = Path(__file__).resolve().parent.parent
+OUTPUTS_DIR = _PROJECT_DIR / "outputs"
+
+# 后台回收间隔（秒），0 关闭后台回收
+AUDIO_STORAGE_GC_INTERVAL = float(os.getenv("AUDIO_STORAGE_GC_INTERVAL", "600"))
+# 新文件保护期（秒）：超出容量时也不删除
+AUDIO_STORAGE_MIN_AGE = float(os.getenv("AUDIO_STORAGE_MIN_AGE", "600"))
+
+
+def _category(name: str, max_mb: str, retention_hours: str) -> dict:
+    prefix = f"AUDIO_STORAGE_{name.upper()}"
+    return {
+        "max_bytes": int(float(os.getenv(f"{prefix}_MAX_MB", max_mb)) * 1024 * 1024),
+        "retention": float(os.getenv(f"{prefix}_RETENTION_HOURS", retention_hours)) * 3600,
+    }
+
+
+# 类别 -> 容量上限 / 保留时长；<=0 表示不限
+CATEGORIES: Dict[str, dict] = {
+    "tts": _category("tts", "1024", "24"),
+    "immersive": _category("immersive", "512", "24"),
+    "practice": _category("practice", "1024", "168"),
+    # 复习对话的音频 URL 会随对话记录保存，默认保留更久
+    "english_dialogue": _category("english_dialogue", "2048", "720"),
+}
+
+_lock = threading.Lock()
+_usage: Dict[str, dict] = {}
+_stats: Dict[str, Dict[str, int]] = {c: {"removed_files": 0, "removed_bytes": 0, "expired": 0, "over_quota": 0} for c in CATEGORIES}
+_last_gc: Optional[float] = None
+
+
+def _shard(key: str) -> str:
+    return hashlib.md5(key.encode("utf-8")).hexdigest()[:2]
+
+
+def shard_dir(category: str, key: str) -> Tuple[str, str]:
+    """返回 (目录绝对路径, 对应的 /audio URL 前缀) 并确保目录存在。
+    tts / immersive / practice 的 key 为文件名；english_dialogue 的 key 为对话 ID（该对话的音频放同一目录）。"""
+    if category not in CATEGORIES:
+        raise ValueError(f"未知的音频类别: {category}")
+    shard = _shard(key)
+    if category == "english_dialogue":
+        rel = f"{category}/{shard}/{key}"
+    else:
+        rel = f"{category}/{shard}"
+    path = OUTPUTS_DIR / rel
+    path.mkdir(parents=True, exist_ok=True)
+    return str(path), f"/audio/{rel}"
+
+
+def audio_path(category: str, filename: str) -> Tuple[str, str]:
+    """为单个音频文件分配路径，返回 (文件绝对路径, 播放 URL)"""
+    directory, prefix = shard_dir(category, filename)
+    return os.path.join(directory, filename), f"{prefix}/{filename}"
+
+
+def _scan(root: Path):
+    """遍历类别目录，返回 [(最近使用时间, 大小, 路径)]（跳过写入中的 .tmp）"""
+    files = []
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if name.endswith(".tmp"):
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((max(st.st_atime, st.st_mtime), st.st_size, path))
+    return files
+
+
+def _remove_empty_dirs(root: Path) -> None:
+    for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+        if dirpath != str(root) and not dirnames and not filenames:
+            try:
+                os.rmdir(dirpath)
+            except OSError:
+                pass
+
+
+def collect_garbage(dry_run: bool = False) -> Dict[str, dict]:
+    """按保留时长与容量上限回收各类别旧文件并刷新用量，返回本次各类别删除的文件数 / 字节数"""
+    global _last_gc
+    now = time.time()
+    result = {}
+    for category, conf in CATEGORIES.items():
+        root = OUTPUTS_DIR / category
+        files = sorted(_scan(root)) if root.is_dir() else []
+        total = sum(size for _, size, _ in files)
+        removed, removed_bytes, expired, over_quota = 0, 0, 0, 0
+        kept = []
+        for last_used, size, path in files:
+            reason = None
+            if conf["retention"] > 0 and now - last_used > conf["retention"]:
+                reason = "expired"
+            elif conf["max_bytes"] > 0 and total > conf["max_bytes"] and now - last_used > AUDIO_STORAGE_MIN_AGE:
+                reason = "over_quota"
+            if reason is None:
+                kept.append((last_used, size, path))
+                continue
+            if not dry_run:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"⚠️ 删除过期音频失败 {path}: {e}")
+                    kept.append((last_used, size, path))
+                    continue
+            total -= size
+            removed += 1
+            removed_bytes += size
+            if reason == "expired":
+                expired += 1
+            else:
+                over_quota += 1
+        if removed and not dry_run and root.is_dir():
+            _remove_empty_dirs(root)
+        result[category] = {"removed_files": removed, "removed_bytes": removed_bytes}
+        if dry_run:
+            continue
+        with _lock:
+            s = _stats[category]
+            s["removed_files"] += removed
+            s["removed_bytes"] += removed_bytes
+            s["expired"] += expired
+            s["over_quota"] += over_quota
+            _usage[category] = {
+                "files": len(kept),
+                "bytes": sum(size for _, size, _ in kept),
+                "oldest_age": int(now - kept[0][0]) if kept else 0,
+            }
+    if not dry_run:
+        with _lock:
+            _last_gc = now
+    return result
+
+
+def storage_usage_report(refresh: bool = False) -> dict:
+    """各类别文件数、占用字节、容量上限、保留时长、最旧文件年龄（秒）与累计回收量；refresh=True 时先重新扫描（不删除）"""
+    if refresh or _last_gc is None:
+        now = time.time()
+        for category in CATEGORIES:
+            root = OUTPUTS_DIR / category
+            files = _scan(root) if root.is_dir() else []
+            oldest = min((t for t, _, _ in files), default=now)
+            with _lock:
+                _usage[category] = {"files": len(files), "bytes": sum(s for _, s, _ in files), "oldest_age": int(now - oldest)}
+    with _lock:
+        return {
+            "last_gc": _last_gc,
+            "categories": {
+                c: {
+                    **_usage.get(c, {"files": 0, "bytes": 0, "oldest_age": 0}),
+                    "max_bytes": conf["max_bytes"],
+                    "retention_seconds": conf["retention"],
+                    **_stats[c],
+                }
+                for c, conf in CATEGORIES.items()
+            },
+        }
+
+
+# ---------- 后台回收 ----------
+
+_gc_thread: Optional[threading.Thread] = None
+_gc_stop = threading.Event()
+
+
+def _gc_loop() -> None:
+    # 启动后先回收一次，清掉停机期间积累的旧文件
+    while True:
+        try:
+            result = collect_garbage()
+            removed = sum(r["removed_files"] for r in result.values())
+            if removed:
+                print(f"🧹 已回收 {removed} 个旧音频文件")
+        except Exception as e:
+            print(f"⚠️ 音频存储回收失败: {e}")
+        if _gc_stop.wait(AUDIO_STORAGE_GC_INTERVAL):
+            return
+
+
+def start_storage_gc() -> bool:
+    """启动后台回收线程（AUDIO_STORAGE_GC_INTERVAL<=0 时不启动），返回是否启动"""
+    global _gc_thread
+    if AUDIO_STORAGE_GC_INTERVAL <= 0:
+        return False
+    if _gc_thread is not None and _gc_thread.is_alive():
+        return True
+    _gc_stop.clear()
+    _gc_thread = threading.Thread(target=_gc_loop, name="audio-storage-gc", daemon=True)
+    _gc_thread.start()
+    return True
+
+
+def stop_storage_gc() -> None:
+    _gc_stop.set()
+
+
+if __name__ == "__main__":
+    # python -m app.audio_storage [--gc] [--dry-run]：查看用量，或立即回收一次
+    import json
+    import sys
+    if "--gc" in sys.argv:
+        print(json.dumps(collect_garbage(dry_run="--dry-run" in sys.argv), ensure_ascii=False, indent=2))
+    print(json.dumps(storage_usage_report(refresh="--gc" not in sys.argv), ensure_ascii=False, indent=2))
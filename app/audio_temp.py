@@ -1,26 +1,34 @@
-# 临时音频 token 存储，供豆包录音文件识别 API 通过 URL 拉取音频
+# 临时音频 token 存储，供豆包录音文件识别 API 通过 URL 拉取音频（STATE_BACKEND=sqlite 时任一 worker 都能取到）
 import os
-import time
 import uuid
 
-_audio_temp_store = {}
+from .session_state import create_session_store
+
 _audio_temp_ttl = 300
+# 同时登记的临时音频上限（内存中的 WAV 可达数 MB），超出时淘汰最早登记的
+AUDIO_TEMP_MAX_ENTRIES = int(os.getenv("AUDIO_TEMP_MAX_ENTRIES", "256"))
+_audio_temp_store = create_session_store(
+    "audio_temp",
+    ttl=_audio_temp_ttl,
+    max_entries=max(1, AUDIO_TEMP_MAX_ENTRIES),
+    sliding=False,
+    sizeof=lambda audio: len(audio) if isinstance(audio, (bytes, bytearray)) else 0,
+)
 
 
-def register_audio_temp(file_path: str) -> str:
-    """注册临时音频路径，返回 token。用于豆包录音文件识别 API 的 audio.url。"""
+def register_audio_temp(audio) -> str:
+    """注册临时音频，返回 token。用于豆包录音文件识别 API 的 audio.url。
+    audio 为 WAV 文件路径，或内存中的 WAV 数据（bytes，上传录音转码后不落盘）。"""
     token = uuid.uuid4().hex
-    _audio_temp_store[token] = (file_path, time.time() + _audio_temp_ttl)
+    _audio_temp_store[token] = audio
     return token
 
 
 def get_audio_temp_path(token: str):
-    """根据 token 取路径与是否过期。返回 (path, expired: bool)。"""
-    if token not in _audio_temp_store:
-        return None, True
-    path, expiry = _audio_temp_store[token]
-    expired = time.time() > expiry
-    return path, expired
+    """根据 token 取登记的音频（路径或 bytes）与是否过期。返回 (path_or_bytes, expired: bool)。"""
+    path = _audio_temp_store.get(token)
+    # 过期条目已由存储回收，与未登记一样视为过期
+    return path, path is None
 
 
 def unregister_audio_temp(token: str) -> None:
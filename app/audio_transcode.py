@@ -0,0 +1,87 @@
+# 上传录音的内存转码：WebM/Opus 等经 ffmpeg 管道（stdin -> stdout）直接解码为 16kHz 单声道 16bit PCM，
+# 不落临时文件；解码在音频进程池（audio_workers）中执行，不阻塞事件循环。得到的 PCM 直接交给 ASR 与练习音频归档。
+# 本模块的同步函数会在工作进程中运行，只依赖标准库（pydub 按需导入），保持轻量。
+import io
+import os
+import subprocess
+import wave
+
+PCM_SAMPLE_RATE = 16000
+PCM_CHANNELS = 1
+PCM_SAMPLE_WIDTH = 2
+
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+# 单次转码超时（秒），防止损坏的输入让 ffmpeg 长时间挂起
+AUDIO_TRANSCODE_TIMEOUT = float(os.getenv("AUDIO_TRANSCODE_TIMEOUT", "30"))
+
+
+def _wav_pcm_if_compatible(data: bytes):
+    """输入已是 16kHz 单声道 16bit WAV 时直接取出 PCM，省去一次 ffmpeg；否则返回 None"""
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return None
+    try:
+        with wave.open(io.BytesIO(data), "rb") as wf:
+            if (wf.getframerate(), wf.getnchannels(), wf.getsampwidth()) != (PCM_SAMPLE_RATE, PCM_CHANNELS, PCM_SAMPLE_WIDTH):
+                return None
+            return wf.readframes(wf.getnframes())
+    except (wave.Error, EOFError):
+        return None
+
+
+def decode_to_pcm(data: bytes) -> bytes:
+    """把任意 ffmpeg 可识别的音频（前端录音为 webm/opus）解码为 16kHz 单声道 s16le PCM（同步，勿在事件循环中直接调用）"""
+    if not data:
+        raise ValueError("音频数据为空")
+    pcm = _wav_pcm_if_compatible(data)
+    if pcm is not None:
+        return pcm
+    cmd = [
+        FFMPEG_BIN, "-nostdin", "-hide_banner", "-loglevel", "error",
+        "-i", "pipe:0",
+        "-vn", "-ac", str(PCM_CHANNELS), "-ar", str(PCM_SAMPLE_RATE),
+        "-f", "s16le", "-acodec", "pcm_s16le", "pipe:1",
+    ]
+    try:
+        proc = subprocess.run(cmd, input=data, capture_output=True, timeout=AUDIO_TRANSCODE_TIMEOUT)
+    except FileNotFoundError:
+        raise ValueError(f"未找到 ffmpeg（{FFMPEG_BIN}），请安装 ffmpeg 或设置 FFMPEG_BIN")
+    except subprocess.TimeoutExpired:
+        raise ValueError(f"音频转码超时（>{AUDIO_TRANSCODE_TIMEOUT:.0f}s）")
+    if proc.returncode != 0:
+        err = proc.stderr.decode("utf-8", errors="replace").strip()
+        raise ValueError(f"音频转码失败: {err[-300:] or proc.returncode}")
+    if not proc.stdout:
+        raise ValueError("音频转码结果为空（录音可能过短或已损坏）")
+    return proc.stdout
+
+
+async def transcode_to_pcm(data: bytes) -> bytes:
+    """异步版 decode_to_pcm：提交到音频进程池执行"""
+    from .audio_workers import run_audio_job
+    return await run_audio_job(decode_to_pcm, data)
+
+
+def mp3_to_wav_file(src, wav_path: str) -> None:
+    """MP3 转 WAV 并写入 wav_path。src 为 MP3 文件路径或内存中的 MP3 数据（bytes）；在音频进程池中执行"""
+    from pydub import AudioSegment
+    audio = AudioSegment.from_mp3(io.BytesIO(src) if isinstance(src, bytes) else src)
+    audio.export(wav_path, format="wav")
+
+
+def pcm_to_wav_bytes(pcm: bytes) -> bytes:
+    """为 PCM 加上 WAV 头（内存中），供需要 WAV 的 OpenAI 转写、录音文件识别拉取与归档使用"""
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(PCM_CHANNELS)
+        wf.setsampwidth(PCM_SAMPLE_WIDTH)
+        wf.setframerate(PCM_SAMPLE_RATE)
+        wf.writeframes(pcm)
+    return buf.getvalue()
+
+
+def write_wav(path: str, pcm: bytes) -> None:
+    """把 PCM 一次写成 WAV 文件（先写临时文件再替换，避免读到半个文件）"""
+    tmp = f"{path}.part"
+    with open(tmp, "wb") as f:
+        f.write(pcm_to_wav_bytes(pcm))
+    os.replace(tmp, path)
@@ -0,0 +1,123 @@
+# 音频处理进程池：MP3 -> WAV、上传录音解码等 CPU 密集的音频转换统一提交到独立进程执行，
+# 不占用事件循环，也不挤占默认线程池；多核上并行，互不拖慢其它请求。
+# 提交前做背压：排队 + 执行中的任务数达到 AUDIO_QUEUE_LIMIT 时直接拒绝（AudioPoolBusy），而不是无限堆积。
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .metrics import AUDIO_CONVERSION_SECONDS
+
+# 工作进程数：默认等于 CPU 核数；设为 0 时退回线程执行（无法使用多进程的环境）
+AUDIO_WORKERS = int(os.getenv("AUDIO_WORKERS", str(os.cpu_count() or 2)))
+# 允许同时挂起（执行中 + 排队）的任务上限，默认每个工作进程 4 个
+AUDIO_QUEUE_LIMIT = int(os.getenv("AUDIO_QUEUE_LIMIT", str(max(1, AUDIO_WORKERS) * 4)))
+
+_executor = None
+_executor_lock = threading.Lock()
+# 计数在 uvicorn 事件循环与对话线程各自的 asyncio.run 循环中都会修改，统一用锁保护
+_state_lock = threading.Lock()
+_pending = 0
+_counters = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+
+
+class AudioPoolBusy(RuntimeError):
+    """音频进程池已满（背压），调用方可稍后重试或返回 503"""
+
+
+def _get_executor():
+    global _executor
+    if AUDIO_WORKERS <= 0:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            # spawn：子进程不继承事件循环、线程与连接等父进程状态
+            _executor = ProcessPoolExecutor(
+                max_workers=AUDIO_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def _reset_executor(broken) -> None:
+    """工作进程异常退出后整个池不可用，丢弃后下次提交重建"""
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+async def run_audio_job(fn, *args):
+    """把音频转换函数提交到进程池并等待结果。fn 与参数需可 pickle（模块级函数、bytes / str）。
+    池已满时抛出 AudioPoolBusy。"""
+    global _pending
+    with _state_lock:
+        if _pending >= AUDIO_QUEUE_LIMIT:
+            _counters["rejected"] += 1
+            raise AudioPoolBusy(f"音频处理繁忙（{_pending} 个任务待处理），请稍后重试")
+        _pending += 1
+        _counters["submitted"] += 1
+    start = time.perf_counter()
+    try:
+        executor = _get_executor()
+        if executor is None:
+            result = await asyncio.to_thread(fn, *args)
+        else:
+            try:
+                result = await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+            except BrokenProcessPool:
+                _reset_executor(executor)
+                raise
+        with _state_lock:
+            _counters["completed"] += 1
+        AUDIO_CONVERSION_SECONDS.observe(time.perf_counter() - start, job=getattr(fn, "__name__", "job"))
+        return result
+    except BaseException:
+        with _state_lock:
+            _counters["failed"] += 1
+        raise
+    finally:
+        with _state_lock:
+            _pending -= 1
+
+
+def audio_pool_stats() -> dict:
+    """进程池状态：工作进程数、执行中 / 排队任务数、队列上限，以及累计提交 / 完成 / 失败 / 拒绝次数"""
+    workers = max(0, AUDIO_WORKERS)
+    with _state_lock:
+        pending = _pending
+        counters = dict(_counters)
+    running = min(pending, workers) if workers else pending
+    return {
+        "workers": workers,
+        "running": running,
+        "queued": pending - running,
+        "queue_limit": AUDIO_QUEUE_LIMIT,
+        **counters,
+    }
+
+
+def _warmup() -> int:
+    return os.getpid()
+
+
+async def start_audio_workers() -> None:
+    """应用启动时预先拉起工作进程，避免首个请求承担进程启动开销"""
+    executor = _get_executor()
+    if executor is None:
+        return
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(executor, _warmup) for _ in range(AUDIO_WORKERS)))
+
+
+def shutdown_audio_workers() -> None:
+    """关闭进程池（应用关闭时调用），未开始的任务直接取消"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -7,11 +7,22 @@
 - user_chunk_progress: 用户语块学习进度（多用户）
 
 卡片生成优先级：先按场景权重（三级→二级→一级层级），再按语块 weight / difficulty / last_correct。
+
+连接来自进程内的有界连接池（借出前对空闲过久的连接做 ping 健康检查）。
+推荐语块使用按 (场景, 难度上限) 预排序的内存索引（ChunkRankingIndex，文件后端共用），
+请求时只把用户的学习进度插回预切好的分组，开销与 limit 和用户进度条数成正比而不是与语块总量成正比；
+表的外部变化由后台线程按 CHUNK_DB_INDEX_TTL 检查摘要后重建，不占用请求路径。
+同步方法会阻塞，事件循环中经 KnowledgeDatabase 的 a* 异步包装（在线程中执行）调用。
 """
 from __future__ import annotations
 
+import bisect
 import os
-from typing import List, Dict, Optional, Any
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Any, Tuple
 
 # 难度枚举：1=最低，2=中等，3=最高
 DIFFICULTY_MIN = 1
@@ -51,9 +62,383 @@ def _get_connection():
         database=cfg["database"],
         charset=cfg["charset"],
         cursorclass=DictCursor,
+        # 池化连接长期复用：自动提交，避免只读查询停留在旧的事务快照里
+        autocommit=True,
     )
 
 
+# 连接池上限（同时借出的连接数）
+CHUNK_DB_POOL_SIZE = int(os.environ.get("CHUNK_DB_POOL_SIZE", "5"))
+# 连接池已满时等待空闲连接的秒数，超时抛出 TimeoutError
+CHUNK_DB_POOL_TIMEOUT = float(os.environ.get("CHUNK_DB_POOL_TIMEOUT", "10"))
+# 空闲超过该秒数的连接借出前先 ping（断线自动重连）
+CHUNK_DB_PING_INTERVAL = float(os.environ.get("CHUNK_DB_PING_INTERVAL", "30"))
+# 推荐前补全用户场景权重后，多少秒内不再重复补全（新增场景最迟在该间隔后同步到用户）
+CHUNK_DB_WEIGHTS_SYNC_INTERVAL = float(os.environ.get("CHUNK_DB_WEIGHTS_SYNC_INTERVAL", "300"))
+# 语块排序索引的后台检查间隔（秒）：后台线程查 chunk_core / chunk_scene_mapping 的摘要，有变化才重建；<=0 不检查
+CHUNK_DB_INDEX_TTL = float(os.environ.get("CHUNK_DB_INDEX_TTL", "60"))
+
+
+class _ConnectionPool:
+    """有界连接池：空闲连接后进先出复用，连接数上限由信号量控制"""
+
+    def __init__(self, connect, size: int):
+        self._connect = connect
+        self._size = max(1, size)
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self._size)
+        self._lock = threading.Lock()
+        self._open = 0
+        self.stats = {"acquired": 0, "created": 0, "reused": 0, "pings": 0, "discarded": 0, "timeouts": 0}
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=CHUNK_DB_POOL_TIMEOUT):
+            with self._lock:
+                self.stats["timeouts"] += 1
+            raise TimeoutError(f"语块数据库连接池已满（{self._size} 个连接均在使用），请稍后重试")
+        try:
+            conn = self._take_idle()
+            if conn is None:
+                conn = self._connect()
+                with self._lock:
+                    self._open += 1
+                    self.stats["created"] += 1
+            with self._lock:
+                self.stats["acquired"] += 1
+            return conn
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _take_idle(self):
+        while True:
+            try:
+                conn, idle_since = self._idle.get_nowait()
+            except queue.Empty:
+                return None
+            if time.monotonic() - idle_since < CHUNK_DB_PING_INTERVAL:
+                with self._lock:
+                    self.stats["reused"] += 1
+                return conn
+            try:
+                with self._lock:
+                    self.stats["pings"] += 1
+                conn.ping(reconnect=True)
+                with self._lock:
+                    self.stats["reused"] += 1
+                return conn
+            except Exception:
+                self._close(conn)
+
+    def release(self, conn, broken: bool = False) -> None:
+        try:
+            if broken:
+                self._close(conn)
+            else:
+                self._idle.put((conn, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def _close(self, conn) -> None:
+        with self._lock:
+            self._open -= 1
+            self.stats["discarded"] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close_all(self) -> None:
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._close(conn)
+
+    def snapshot_stats(self) -> dict:
+        with self._lock:
+            return {"size": self._size, "open": self._open, "idle": self._idle.qsize(), **self.stats}
+
+
+_weights_synced: Dict[str, float] = {}
+
+_pool: Optional[_ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> _ConnectionPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _ConnectionPool(_get_connection, CHUNK_DB_POOL_SIZE)
+        return _pool
+
+
+def set_connection_factory(connect) -> None:
+    """替换建立连接的函数（压测 / 本地替身数据库用），关闭现有连接池"""
+    global _pool
+    with _pool_lock:
+        old, _pool = _pool, _ConnectionPool(connect, CHUNK_DB_POOL_SIZE)
+    if old is not None:
+        old.close_all()
+
+
+def close_chunk_db_pool() -> None:
+    """停止排序索引的后台刷新并关闭连接池中的空闲连接（应用关闭时调用）"""
+    _stop_ranking_index_refresh()
+    with _pool_lock:
+        pool = _pool
+    if pool is not None:
+        pool.close_all()
+
+
+def chunk_db_pool_stats() -> dict:
+    """连接池状态：上限、已打开 / 空闲连接数，以及累计借出 / 新建 / 复用 / ping / 丢弃 / 等待超时次数"""
+    return _get_pool().snapshot_stats()
+
+
+def _is_connection_error(e: Exception) -> bool:
+    try:
+        import pymysql
+    except ImportError:
+        return False
+    return isinstance(e, (pymysql.err.OperationalError, pymysql.err.InterfaceError))
+
+
+@contextmanager
+def _pooled_connection():
+    """从连接池借出连接；出错时回滚，连接层错误的连接直接丢弃"""
+    pool = _get_pool()
+    conn = pool.acquire()
+    broken = False
+    try:
+        yield conn
+    except Exception as e:
+        broken = _is_connection_error(e)
+        if not broken:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+        raise
+    finally:
+        pool.release(conn, broken)
+
+
+# ---------- 预排序索引 ----------
+
+class ChunkRankingIndex:
+    """
+    按 (label_id, 难度上限) 预排序的语块列表，加载数据时构建一次。
+    场景内排序规则 weight DESC, difficulty ASC, last_correct ASC 中，只有 last_correct 与用户有关：
+    预先按 (weight, difficulty) 排好并切成「同分组」，每组再按语块自身的 last_correct 切段（错误在前）。
+    查询时只把用户做过的语块（学习进度）插回所在组，开销与 limit 和该用户的进度条数成正比，与组大小无关。
+    组内原有顺序即传入 mapping_by_label 的顺序（文件后端为映射文件顺序，MySQL 为 chunk_id 升序）。
+    """
+
+    def __init__(self, chunks_by_id: Dict[int, Dict], mapping_by_label: Dict[int, List[int]]):
+        self.chunks_by_id = chunks_by_id
+        # 难度上限取实际出现过的难度值；查询时取不超过 user_difficulty_max 的最大值
+        self.ceilings: List[int] = sorted({int(c["difficulty"]) for c in chunks_by_id.values()})
+        self._groups: Dict[Tuple[int, int], List[List[int]]] = {}
+        # 与 _groups 一一对应：每组按语块自身 last_correct 升序切段 [(last_correct, [组内位置, ...]), ...]
+        self._parts: Dict[Tuple[int, int], List[List[Tuple[Any, List[int]]]]] = {}
+        # 难度上限 -> chunk_id -> [(label_id, 组序号, 组内位置)]，叠加用户进度时按语块直接定位
+        self._locations: Dict[int, Dict[int, List[Tuple[int, int, int]]]] = {c: {} for c in self.ceilings}
+        for label_id, cids in mapping_by_label.items():
+            label_id = int(label_id)
+            ordered = [cid for cid in dict.fromkeys(cids) if cid in chunks_by_id]
+            ordered.sort(key=lambda cid: self._base_key(chunks_by_id[cid]))
+            for ceiling in self.ceilings:
+                groups: List[List[int]] = []
+                last_key = None
+                for cid in ordered:
+                    chunk = chunks_by_id[cid]
+                    if int(chunk["difficulty"]) > ceiling:
+                        continue
+                    key = self._base_key(chunk)
+                    if key != last_key:
+                        groups.append([])
+                        last_key = key
+                    self._locations[ceiling].setdefault(cid, []).append((label_id, len(groups) - 1, len(groups[-1])))
+                    groups[-1].append(cid)
+                self._groups[(label_id, ceiling)] = groups
+                self._parts[(label_id, ceiling)] = [self._split_by_last_correct(g) for g in groups]
+
+    @staticmethod
+    def _base_key(chunk: Dict) -> Tuple[float, int]:
+        return (-float(chunk.get("weight") or 0), int(chunk["difficulty"]))
+
+    def _split_by_last_correct(self, group: List[int]) -> List[Tuple[Any, List[int]]]:
+        parts: Dict[Any, List[int]] = {}
+        for pos, cid in enumerate(group):
+            parts.setdefault(self.chunks_by_id[cid].get("last_correct", 1), []).append(pos)
+        return sorted(parts.items(), key=lambda kv: kv[0])
+
+    @staticmethod
+    def _iter_group(group: List[int], parts, touched: Optional[List[Tuple[int, Any]]]):
+        """组内按有效 last_correct 稳定排序后的 chunk_id（惰性生成）。
+        touched 为用户进度覆盖的 (组内位置, last_correct)：这些语块从原分段中跳过，按位置归并进对应值的分段。"""
+        if not touched:
+            for _, positions in parts:
+                for pos in positions:
+                    yield group[pos]
+            return
+        touched.sort(key=lambda t: t[0])
+        skipped = {pos for pos, _ in touched}
+        base = dict(parts)
+        for value in sorted(set(base) | {v for _, v in touched}):
+            extra = [pos for pos, v in touched if v == value]
+            j = 0
+            for pos in base.get(value, ()):
+                if pos in skipped:
+                    continue
+                while j < len(extra) and extra[j] < pos:
+                    yield group[extra[j]]
+                    j += 1
+                yield group[pos]
+            for pos in extra[j:]:
+                yield group[pos]
+
+    def top_chunk_ids(
+        self,
+        label_ids: List[int],
+        user_difficulty_max: int,
+        limit: int,
+        progress_last_correct: Optional[Dict[int, Any]] = None,
+        default_last_correct: Any = None,
+    ) -> List[int]:
+        """按 label 顺序逐个取（label 之间是严格优先级，多路归并退化为按序拼接），组内按 last_correct 稳定排序，
+        同一语块只保留最靠前的一次，凑满 limit 即停止。
+        progress_last_correct 为用户进度里的 {chunk_id: last_correct}，覆盖语块自身的值；
+        default_last_correct 不为 None 时，没有进度的语块一律按该值排序（不看语块自身的 last_correct）。"""
+        i = bisect.bisect_right(self.ceilings, user_difficulty_max)
+        if i == 0 or limit <= 0:
+            return []
+        ceiling = self.ceilings[i - 1]
+        # 用户进度按所在组归类：{(label_id, 组序号): [(组内位置, last_correct), ...]}
+        touched: Dict[Tuple[int, int], List[Tuple[int, Any]]] = {}
+        if progress_last_correct:
+            locations = self._locations[ceiling]
+            for cid, value in progress_last_correct.items():
+                for label_id, gi, pos in locations.get(cid, ()):
+                    touched.setdefault((label_id, gi), []).append((pos, value))
+        result: List[int] = []
+        seen = set()
+        for label_id in label_ids:
+            key = (int(label_id), ceiling)
+            groups = self._groups.get(key, ())
+            for gi, group in enumerate(groups):
+                if default_last_correct is not None:
+                    parts = [(default_last_correct, range(len(group)))]
+                else:
+                    parts = self._parts[key][gi]
+                for cid in self._iter_group(group, parts, touched.get((key[0], gi))):
+                    if cid in seen:
+                        continue
+                    seen.add(cid)
+                    result.append(cid)
+                    if len(result) >= limit:
+                        return result
+        return result
+
+
+_index: Optional[ChunkRankingIndex] = None
+_index_sig: Optional[Tuple] = None
+# 只串行化构建 / 替换；请求路径读取已有的 _index 不加锁
+_index_lock = threading.Lock()
+_refresh_thread: Optional[threading.Thread] = None
+_refresh_stop = threading.Event()
+
+
+def _table_signature(conn) -> Tuple:
+    """语块与映射表的摘要：行数、最大 id，以及索引用到的每一列（chunk、difficulty、category、weight、last_correct、
+    映射关系）按行 CRC32 求和；任一行任一列变化即重建索引（单纯按列求和发现不了 0/1 互换、文本修改）。
+    要扫全表，只在后台刷新线程里调用。"""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT (SELECT COUNT(*) FROM chunk_core) AS chunks,
+                   (SELECT MAX(chunk_id) FROM chunk_core) AS max_id,
+                   (SELECT SUM(CRC32(CONCAT_WS('|', chunk_id, chunk, difficulty, category, weight, last_correct)))
+                      FROM chunk_core) AS chunk_digest,
+                   (SELECT COUNT(*) FROM chunk_scene_mapping) AS mappings,
+                   (SELECT SUM(CRC32(CONCAT_WS('|', chunk_id, label_id))) FROM chunk_scene_mapping) AS mapping_digest
+            """
+        )
+        row = cur.fetchone()
+    return tuple(str(v) for v in row.values())
+
+
+def _build_ranking_index(conn) -> ChunkRankingIndex:
+    with conn.cursor() as cur:
+        cur.execute("SELECT chunk_id, chunk, difficulty, category, weight, last_correct FROM chunk_core")
+        chunks_by_id = {int(r["chunk_id"]): dict(r) for r in cur.fetchall()}
+        cur.execute("SELECT chunk_id, label_id FROM chunk_scene_mapping ORDER BY label_id, chunk_id")
+        mapping_by_label: Dict[int, List[int]] = {}
+        for r in cur.fetchall():
+            mapping_by_label.setdefault(int(r["label_id"]), []).append(int(r["chunk_id"]))
+    return ChunkRankingIndex(chunks_by_id, mapping_by_label)
+
+
+def _get_ranking_index(conn) -> ChunkRankingIndex:
+    """返回 MySQL 语块的排序索引：只在首次加载（或本进程写入后失效）时同步构建，
+    表的外部变化由后台线程每 CHUNK_DB_INDEX_TTL 秒检查摘要后整体替换"""
+    global _index, _index_sig
+    index = _index
+    if index is not None:
+        return index
+    with _index_lock:
+        if _index is None:
+            # 先取摘要再读表：读表期间的改动会让下一轮摘要不一致，从而再重建一次
+            _index_sig = _table_signature(conn) if CHUNK_DB_INDEX_TTL > 0 else None
+            _index = _build_ranking_index(conn)
+        index = _index
+    _start_ranking_index_refresh()
+    return index
+
+
+def _invalidate_ranking_index() -> None:
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def _refresh_loop() -> None:
+    global _index, _index_sig
+    while not _refresh_stop.wait(CHUNK_DB_INDEX_TTL):
+        try:
+            with _pooled_connection() as conn:
+                sig = _table_signature(conn)
+                if sig == _index_sig or _index is None:
+                    continue
+                index = _build_ranking_index(conn)
+            with _index_lock:
+                # 构建期间索引被写入路径作废的，交给下一个请求同步重建
+                if _index is not None:
+                    _index, _index_sig = index, sig
+        except Exception as e:
+            print(f"⚠️ 刷新语块排序索引失败: {e}")
+
+
+def _start_ranking_index_refresh() -> None:
+    """首次构建索引后启动后台刷新线程（CHUNK_DB_INDEX_TTL<=0 时不启动，只在本进程写入后重建）"""
+    global _refresh_thread
+    if CHUNK_DB_INDEX_TTL <= 0:
+        return
+    with _index_lock:
+        if _refresh_thread is not None and _refresh_thread.is_alive():
+            return
+        _refresh_stop.clear()
+        _refresh_thread = threading.Thread(target=_refresh_loop, name="chunk-index-refresh", daemon=True)
+        _refresh_thread.start()
+
+
+def _stop_ranking_index_refresh() -> None:
+    _refresh_stop.set()
+
+
 class ChunkDatabase:
     """
     语块/句型数据库：卡片生成优先级逻辑
@@ -156,50 +541,38 @@ class ChunkDatabase:
         按 label 顺序，从每个 label 下取语块/句型，直到凑满 limit。
         同一场景内排序：chunk_core.weight DESC, difficulty ASC, last_correct ASC（错误优先）。
         难度过滤：只取 difficulty <= user_difficulty_max。
+        排序来自预构建的 ChunkRankingIndex，数据库只查该用户的学习进度（一次往返）。
         """
-        result = []
-        seen_chunk_ids = set()
-
-        for label_id in label_ids:
-            if len(result) >= limit:
-                break
+        index = _get_ranking_index(conn)
+        chunks_by_id = index.chunks_by_id
+        # 多用户时用 user_chunk_progress 的 last_correct（没学过的按 1）；单用户可用 chunk_core 的 last_correct
+        if user_id:
             with conn.cursor() as cur:
-                # 多用户时用 user_chunk_progress 的 last_correct；单用户可用 chunk_core 的 last_correct
-                if user_id:
-                    cur.execute(
-                        """
-                        SELECT c.chunk_id, c.chunk, c.difficulty, c.category, c.weight,
-                               COALESCE(p.last_correct, 1) AS last_correct,
-                               COALESCE(p.learn_count, 0) AS learn_count
-                        FROM chunk_core c
-                        INNER JOIN chunk_scene_mapping m ON m.chunk_id = c.chunk_id AND m.label_id = %s
-                        LEFT JOIN user_chunk_progress p ON p.chunk_id = c.chunk_id AND p.user_id = %s
-                        WHERE c.difficulty <= %s
-                        ORDER BY c.weight DESC, c.difficulty ASC, COALESCE(p.last_correct, 1) ASC
-                        """,
-                        (label_id, user_id, user_difficulty_max),
-                    )
-                else:
-                    cur.execute(
-                        """
-                        SELECT c.chunk_id, c.chunk, c.difficulty, c.category, c.weight, c.last_correct
-                        FROM chunk_core c
-                        INNER JOIN chunk_scene_mapping m ON m.chunk_id = c.chunk_id AND m.label_id = %s
-                        WHERE c.difficulty <= %s
-                        ORDER BY c.weight DESC, c.difficulty ASC, c.last_correct ASC
-                        """,
-                        (label_id, user_difficulty_max),
-                    )
-                rows = cur.fetchall()
-            for r in rows:
-                cid = r["chunk_id"]
-                if cid in seen_chunk_ids:
-                    continue
-                seen_chunk_ids.add(cid)
-                result.append(dict(r))
-                if len(result) >= limit:
-                    break
+                cur.execute(
+                    "SELECT chunk_id, last_correct, learn_count FROM user_chunk_progress WHERE user_id = %s",
+                    (user_id,),
+                )
+                progress = {int(r["chunk_id"]): r for r in cur.fetchall()}
+            top_ids = index.top_chunk_ids(
+                label_ids, user_difficulty_max, limit,
+                progress_last_correct={cid: p["last_correct"] for cid, p in progress.items()},
+                default_last_correct=1,
+            )
+        else:
+            progress = None
+            top_ids = index.top_chunk_ids(label_ids, user_difficulty_max, limit)
 
+        result = []
+        for cid in top_ids:
+            c = chunks_by_id[cid]
+            row = {"chunk_id": c["chunk_id"], "chunk": c["chunk"], "difficulty": c["difficulty"], "category": c["category"], "weight": c["weight"]}
+            if progress is not None:
+                p = progress.get(cid)
+                row["last_correct"] = p["last_correct"] if p is not None else 1
+                row["learn_count"] = p["learn_count"] if p is not None else 0
+            else:
+                row["last_correct"] = c["last_correct"]
+            result.append(row)
         return result
 
     def get_recommended_chunks(
@@ -219,15 +592,15 @@ class ChunkDatabase:
         - selected_label_id: 用户手动选择的场景（三级 label_id），为 None 则按权重最高的三级场景为起点
         - first_scene + second_scene: 用户选了一级+二级时，用该二级下所有三级的语块/句型生成卡片（与 selected_label_id 二选一）
         - limit: 最多返回条数
+        整个推荐只借用一个连接。
         """
-        # 懒同步：确保该用户对当前所有场景都有 user_scene_weight 行（新增场景后首次推荐时补全）
-        if user_id:
-            self.init_user_scene_weights(user_id)
-        conn = _get_connection()
-        try:
+        with _pooled_connection() as conn:
+            # 懒同步：确保该用户对当前所有场景都有 user_scene_weight 行（新增场景后首次推荐时补全）
+            if user_id and time.monotonic() - _weights_synced.get(user_id, float("-inf")) >= CHUNK_DB_WEIGHTS_SYNC_INTERVAL:
+                self._init_user_scene_weights(conn, user_id)
             if first_scene and second_scene:
                 # 一级+二级已定：取该二级下所有三级的 label_id，用这些语块生成卡片
-                opts = self.get_second_level_options(first_scene.strip(), limit=100)
+                opts = self._second_level_options(conn, first_scene.strip(), limit=100)
                 opt = next((o for o in opts if (o.get("second_scene") or "").strip() == second_scene.strip()), None)
                 ordered_label_ids = (opt["label_ids"] if opt else [])
             else:
@@ -241,8 +614,6 @@ class ChunkDatabase:
                 prefer_wrong_first=prefer_wrong_first,
             )
             return chunks
-        finally:
-            conn.close()
 
     def get_second_level_options(self, first_scene: str, limit: int = 3) -> List[Dict]:
         """
@@ -250,45 +621,44 @@ class ChunkDatabase:
         每个选项包含该 (一级, 二级) 下所有三级的 label_id，用于后续生成卡片。
         返回格式：[{"first_scene", "second_scene", "label_ids": [id1, id2, ...]}, ...]
         """
-        conn = _get_connection()
-        try:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """SELECT label_id, first_scene, second_scene, third_scene
-                       FROM scene_label WHERE first_scene = %s ORDER BY second_scene, third_scene""",
-                    (first_scene.strip(),),
-                )
-                rows = cur.fetchall()
-            # 按 second_scene 分组，每组收集所有 label_id
-            by_second: Dict[str, List[int]] = {}
-            for r in rows:
-                sec = r["second_scene"]
-                if sec not in by_second:
-                    by_second[sec] = []
-                by_second[sec].append(int(r["label_id"]))
-            # 取前 limit 个二级
-            result = []
-            for i, (second_scene, label_ids) in enumerate(by_second.items()):
-                if i >= limit:
-                    break
-                result.append({
-                    "first_scene": first_scene,
-                    "second_scene": second_scene,
-                    "label_ids": label_ids,
-                    "scene_primary": first_scene,
-                    "scene_secondary": second_scene,
-                })
-            return result
-        finally:
-            conn.close()
+        with _pooled_connection() as conn:
+            return self._second_level_options(conn, first_scene, limit)
+
+    def _second_level_options(self, conn, first_scene: str, limit: int) -> List[Dict]:
+        with conn.cursor() as cur:
+            cur.execute(
+                """SELECT label_id, first_scene, second_scene, third_scene
+                   FROM scene_label WHERE first_scene = %s ORDER BY second_scene, third_scene""",
+                (first_scene.strip(),),
+            )
+            rows = cur.fetchall()
+        # 按 second_scene 分组，每组收集所有 label_id
+        by_second: Dict[str, List[int]] = {}
+        for r in rows:
+            sec = r["second_scene"]
+            if sec not in by_second:
+                by_second[sec] = []
+            by_second[sec].append(int(r["label_id"]))
+        # 取前 limit 个二级
+        result = []
+        for i, (second_scene, label_ids) in enumerate(by_second.items()):
+            if i >= limit:
+                break
+            result.append({
+                "first_scene": first_scene,
+                "second_scene": second_scene,
+                "label_ids": label_ids,
+                "scene_primary": first_scene,
+                "scene_secondary": second_scene,
+            })
+        return result
 
     def get_available_scenes(self) -> List[Dict]:
         """
         返回所有可用场景（层级：一级/二级/三级），供前端选择与手动切换。
         返回格式：[{"label_id", "first_scene", "second_scene", "third_scene"}, ...]
         """
-        conn = _get_connection()
-        try:
+        with _pooled_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute(
                     "SELECT label_id, first_scene, second_scene, third_scene FROM scene_label ORDER BY first_scene, second_scene, third_scene"
@@ -307,13 +677,10 @@ class ChunkDatabase:
                 }
                 for r in rows
             ]
-        finally:
-            conn.close()
 
     def update_chunk_progress(self, user_id: str, chunk_id: int, is_correct: bool) -> None:
         """更新用户语块学习进度（练习后调用）"""
-        conn = _get_connection()
-        try:
+        with _pooled_connection() as conn:
             with conn.cursor() as cur:
                 inc_correct = 1 if is_correct else 0
                 last_ok = 1 if is_correct else 0
@@ -330,8 +697,6 @@ class ChunkDatabase:
                     (user_id, chunk_id, inc_correct, last_ok, inc_correct, last_ok),
                 )
             conn.commit()
-        finally:
-            conn.close()
 
     def update_scene_weight(self, user_id: str, label_id: int, weight_delta: Optional[float] = None, weight_absolute: Optional[float] = None) -> None:
         """
@@ -339,8 +704,7 @@ class ChunkDatabase:
         - weight_delta: 在原有基础上增加（可为负）
         - weight_absolute: 直接设为该值（与 weight_delta 二选一）
         """
-        conn = _get_connection()
-        try:
+        with _pooled_connection() as conn:
             with conn.cursor() as cur:
                 if weight_absolute is not None:
                     cur.execute(
@@ -362,8 +726,6 @@ class ChunkDatabase:
                         (user_id, label_id, current + (weight_delta or 0), weight_delta or 0),
                     )
             conn.commit()
-        finally:
-            conn.close()
 
     def increment_scene_choice(self, user_id: str, label_id: int, choice_weight_increment: float = 0.5) -> None:
         """用户手动选择某场景时调用，增加该场景权重"""
@@ -376,19 +738,20 @@ class ChunkDatabase:
         为新用户初始化场景权重：为所有 scene_label 在 user_scene_weight 中插入一行（weight=0），
         保证该用户参与场景排序时有一致的权重来源。
         """
-        conn = _get_connection()
-        try:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    INSERT IGNORE INTO user_scene_weight (user_id, label_id, weight)
-                    SELECT %s, label_id, 0.00 FROM scene_label
-                    """,
-                    (user_id,),
-                )
-            conn.commit()
-        finally:
-            conn.close()
+        with _pooled_connection() as conn:
+            self._init_user_scene_weights(conn, user_id)
+
+    def _init_user_scene_weights(self, conn, user_id: str) -> None:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT IGNORE INTO user_scene_weight (user_id, label_id, weight)
+                SELECT %s, label_id, 0.00 FROM scene_label
+                """,
+                (user_id,),
+            )
+        conn.commit()
+        _weights_synced[user_id] = time.monotonic()
 
     def get_label_id_by_scenes(
         self,
@@ -400,8 +763,7 @@ class ChunkDatabase:
         根据一级/二级/三级场景名解析 label_id。
         若 third_scene 未传，则返回该 (first, second) 下任意一个三级场景的 label_id（取第一个）。
         """
-        conn = _get_connection()
-        try:
+        with _pooled_connection() as conn:
             with conn.cursor() as cur:
                 if third_scene:
                     cur.execute(
@@ -415,16 +777,13 @@ class ChunkDatabase:
                     )
                 row = cur.fetchone()
                 return int(row["label_id"]) if row else None
-        finally:
-            conn.close()
 
     def find_chunk_by_text(self, text: str, category: Optional[int] = None) -> Optional[Dict]:
         """
         按语块/句型原文查找 chunk_core 记录（忽略大小写）。
         若传入 category，则同时过滤类型。返回包含 chunk_id, chunk, category, difficulty 等的字典。
         """
-        conn = _get_connection()
-        try:
+        with _pooled_connection() as conn:
             with conn.cursor() as cur:
                 if category is not None:
                     cur.execute(
@@ -438,8 +797,6 @@ class ChunkDatabase:
                     )
                 row = cur.fetchone()
                 return dict(row) if row else None
-        finally:
-            conn.close()
 
     def add_chunk(
         self,
@@ -454,8 +811,7 @@ class ChunkDatabase:
         category: 1=语块, 2=句型；difficulty: 1/2/3。
         若 chunk 已存在（同文同类型），则返回已有记录并确保 mapping 存在；否则插入并返回新记录。
         """
-        conn = _get_connection()
-        try:
+        with _pooled_connection() as conn:
             with conn.cursor() as cur:
                 chunk_text = chunk_text.strip()
                 cur.execute(
@@ -470,6 +826,7 @@ class ChunkDatabase:
                         (cid, label_id),
                     )
                     conn.commit()
+                    _invalidate_ranking_index()
                     cur.execute("SELECT chunk_id, chunk, difficulty, category, weight FROM chunk_core WHERE chunk_id = %s", (cid,))
                     return dict(cur.fetchone())
                 cur.execute(
@@ -483,15 +840,13 @@ class ChunkDatabase:
                 cid = cur.lastrowid
                 cur.execute("INSERT INTO chunk_scene_mapping (chunk_id, label_id) VALUES (%s, %s)", (cid, label_id))
                 conn.commit()
+                _invalidate_ranking_index()
                 cur.execute("SELECT chunk_id, chunk, difficulty, category, weight FROM chunk_core WHERE chunk_id = %s", (cid,))
                 return dict(cur.fetchone())
-        finally:
-            conn.close()
 
     def get_user_chunk_progress(self, user_id: str) -> List[Dict]:
         """获取某用户所有语块学习进度（用于统计或 UI）。"""
-        conn = _get_connection()
-        try:
+        with _pooled_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute(
                     """
@@ -505,5 +860,3 @@ class ChunkDatabase:
                     (user_id,),
                 )
                 return [dict(r) for r in cur.fetchall()]
-        finally:
-            conn.close()
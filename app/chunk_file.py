@@ -5,15 +5,21 @@
 - data/chunk_scene_mapping.json: 语块-场景多对多
 - memory/accounts/<user_id>/scene_weights.json: 用户场景权重
 - memory/accounts/<user_id>/chunk_progress.json: 用户语块学习进度
+
+三个数据文件在进程内只解析一次，连同预建索引（标签 -> 语块、语块 id -> 行、一级/二级场景层级、
+按 (标签, 难度上限) 预排序的语块）
+组成共享快照，文件 mtime 变化时才重新加载；用户权重 / 进度文件同样按 mtime 缓存，推荐计算不再读盘。
 """
 from __future__ import annotations
 
 import json
 import os
+import threading
 from pathlib import Path
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
 
 from .chunk_db import (
+    ChunkRankingIndex,
     DIFFICULTY_MIN,
     DIFFICULTY_MAX,
     CATEGORY_CHUNK,
@@ -35,9 +41,122 @@ def _load_json(path: Path, default: Any) -> Any:
 
 
 def _save_json(path: Path, data: Any) -> None:
+    """先写临时文件再替换，并发读取时不会读到半截 JSON（也就不会把残缺内容缓存进快照）"""
     path.parent.mkdir(parents=True, exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    _file_cache_invalidate(path)
+
+
+def _file_sig(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        st = path.stat()
+        return st.st_mtime_ns, st.st_size
+    except OSError:
+        return None
+
+
+# ---------- 用户权重 / 进度文件缓存 ----------
+# path -> (文件签名, 解析结果)；解析结果只读共享，需要修改的调用方先拷贝
+
+_file_cache: Dict[Path, Tuple[Optional[Tuple[int, int]], Any]] = {}
+_file_cache_lock = threading.Lock()
+
+
+def _file_cache_invalidate(path: Path) -> None:
+    with _file_cache_lock:
+        _file_cache.pop(path, None)
+
+
+def _cached_json(path: Path, parse) -> Any:
+    """按 mtime + size 缓存 parse(json 内容) 的结果；文件不存在时按空 dict 解析"""
+    sig = _file_sig(path)
+    with _file_cache_lock:
+        hit = _file_cache.get(path)
+        if hit is not None and hit[0] == sig:
+            return hit[1]
+    value = parse(_load_json(path, {}) if sig is not None else {})
+    with _file_cache_lock:
+        _file_cache[path] = (sig, value)
+    return value
+
+
+def _parse_weights(data: Dict) -> Dict[int, float]:
+    return {int(k): float(v) for k, v in data.items()}
+
+
+def _parse_progress(data: Dict) -> Dict[int, Dict]:
+    return {int(k): v for k, v in data.items()}
+
+
+# ---------- 场景 / 语块快照 ----------
+
+class _ChunkSnapshot:
+    """scenes / chunks / mapping 的一次解析结果与索引；只读，文件变化时整体替换"""
+
+    def __init__(self, data_dir: Path):
+        self.scenes_path = data_dir / "scenes.json"
+        self.chunks_path = data_dir / "chunks.json"
+        self.mapping_path = data_dir / "chunk_scene_mapping.json"
+        self.sigs = self.current_sigs()
+        self.scenes: List[Dict] = _load_json(self.scenes_path, [])
+        self.chunks: List[Dict] = _load_json(self.chunks_path, [])
+        self.mapping: List[Dict] = _load_json(self.mapping_path, [])
+
+        self.scenes_by_id: Dict[int, Dict] = {int(s["label_id"]): s for s in self.scenes}
+        # 一级场景 -> [(二级场景, [label_id, ...])]，二级按名称排序、label 保持文件顺序
+        by_first: Dict[str, Dict[str, List[int]]] = {}
+        # (一级, 二级) -> [(三级, label_id)]
+        self.labels_by_second: Dict[Tuple[str, str], List[Tuple[str, int]]] = {}
+        for s in self.scenes:
+            first, second = s.get("first_scene"), s.get("second_scene", "")
+            by_first.setdefault(first, {}).setdefault(second, []).append(int(s["label_id"]))
+            self.labels_by_second.setdefault((first, s.get("second_scene")), []).append((s.get("third_scene"), int(s["label_id"])))
+        self.second_levels: Dict[str, List[Tuple[str, List[int]]]] = {
+            first: sorted(seconds.items()) for first, seconds in by_first.items()
+        }
+
+        self.chunks_by_id: Dict[int, Dict] = {int(c["chunk_id"]): c for c in self.chunks}
+        # 小写文本 -> 同文本的语块（文件顺序），用于按文本查找
+        self.chunks_by_text: Dict[str, List[Dict]] = {}
+        for c in self.chunks:
+            self.chunks_by_text.setdefault(c.get("chunk", "").strip().lower(), []).append(c)
+        self.mapping_by_label: Dict[int, List[int]] = {}
+        self.mapping_pairs = set()
+        for m in self.mapping:
+            lid, cid = int(m["label_id"]), int(m["chunk_id"])
+            self.mapping_by_label.setdefault(lid, []).append(cid)
+            self.mapping_pairs.add((cid, lid))
+        # (label, 难度上限) -> 预排序语块，推荐时只叠加用户的 last_correct
+        self.ranking = ChunkRankingIndex(self.chunks_by_id, self.mapping_by_label)
+
+    def current_sigs(self):
+        return (_file_sig(self.scenes_path), _file_sig(self.chunks_path), _file_sig(self.mapping_path))
+
+
+_snapshots: Dict[Path, _ChunkSnapshot] = {}
+_snapshots_lock = threading.Lock()
+
+
+def _get_snapshot(data_dir: Path) -> _ChunkSnapshot:
+    """返回 data_dir 的共享快照；任一文件 mtime / 大小变化时重新加载"""
+    key = data_dir.resolve()
+    snap = _snapshots.get(key)
+    if snap is not None and snap.sigs == snap.current_sigs():
+        return snap
+    with _snapshots_lock:
+        snap = _snapshots.get(key)
+        if snap is None or snap.sigs != snap.current_sigs():
+            snap = _ChunkSnapshot(key)
+            _snapshots[key] = snap
+        return snap
+
+
+def _invalidate_snapshot(data_dir: Path) -> None:
+    with _snapshots_lock:
+        _snapshots.pop(data_dir.resolve(), None)
 
 
 class ChunkDatabaseFile:
@@ -66,32 +185,36 @@ class ChunkDatabaseFile:
     def _user_chunk_progress_path(self, user_id: str) -> Path:
         return self._memory_dir / user_id / "chunk_progress.json"
 
+    def _snapshot(self) -> _ChunkSnapshot:
+        return _get_snapshot(self._data_dir)
+
     def _load_scenes(self) -> List[Dict]:
-        return _load_json(self._scenes_path(), [])
+        """快照中的场景列表（共享只读）"""
+        return self._snapshot().scenes
 
-    def _load_chunks(self) -> List[Dict]:
-        return _load_json(self._chunks_path(), [])
+    def _user_scene_weights(self, user_id: str) -> Dict[int, float]:
+        """只读：缓存中的用户场景权重"""
+        return _cached_json(self._user_scene_weights_path(user_id), _parse_weights)
 
-    def _load_mapping(self) -> List[Dict]:
-        return _load_json(self._mapping_path(), [])
+    def _user_chunk_progress(self, user_id: str) -> Dict[int, Dict]:
+        """只读：缓存中的用户语块进度"""
+        return _cached_json(self._user_chunk_progress_path(user_id), _parse_progress)
 
     def _load_user_scene_weights(self, user_id: str) -> Dict[int, float]:
-        data = _load_json(self._user_scene_weights_path(user_id), {})
-        return {int(k): float(v) for k, v in data.items()}
+        return dict(self._user_scene_weights(user_id))
 
     def _save_user_scene_weights(self, user_id: str, data: Dict[int, float]) -> None:
         _save_json(self._user_scene_weights_path(user_id), {str(k): v for k, v in data.items()})
 
     def _load_user_chunk_progress(self, user_id: str) -> Dict[int, Dict]:
-        data = _load_json(self._user_chunk_progress_path(user_id), {})
-        return {int(k): v for k, v in data.items()}
+        return {k: dict(v) for k, v in self._user_chunk_progress(user_id).items()}
 
     def _save_user_chunk_progress(self, user_id: str, data: Dict[int, Dict]) -> None:
         _save_json(self._user_chunk_progress_path(user_id), {str(k): v for k, v in data.items()})
 
     def _get_scene_weight(self, user_id: Optional[str], label_id: int, scenes_by_id: Dict[int, Dict]) -> float:
         if user_id:
-            weights = self._load_user_scene_weights(user_id)
+            weights = self._user_scene_weights(user_id)
             if label_id in weights:
                 return weights[label_id]
         s = scenes_by_id.get(label_id)
@@ -101,7 +224,7 @@ class ChunkDatabaseFile:
         scenes = self._load_scenes()
         if not scenes:
             return []
-        weights = self._load_user_scene_weights(user_id or "") if user_id else {}
+        weights = self._user_scene_weights(user_id) if user_id else {}
         result = []
         for s in scenes:
             row = dict(s)
@@ -145,42 +268,17 @@ class ChunkDatabaseFile:
         limit: int,
         prefer_wrong_first: bool = True,
     ) -> List[Dict]:
-        chunks = self._load_chunks()
-        mapping = self._load_mapping()
-        mapping_by_label: Dict[int, List[int]] = {}
-        for m in mapping:
-            lid = int(m["label_id"])
-            cid = int(m["chunk_id"])
-            if lid not in mapping_by_label:
-                mapping_by_label[lid] = []
-            mapping_by_label[lid].append(cid)
-        chunks_by_id = {int(c["chunk_id"]): c for c in chunks}
-        progress = self._load_user_chunk_progress(user_id or "") if user_id else {}
+        snap = self._snapshot()
+        chunks_by_id = snap.chunks_by_id
+        progress = self._user_chunk_progress(user_id) if user_id else {}
+        # 进度里的 last_correct 覆盖语块自身的值，没有进度的语块按自身的值排序
+        progress_last_correct = {cid: p["last_correct"] for cid, p in progress.items() if "last_correct" in p}
+
         result = []
-        seen = set()
-        for label_id in label_ids:
-            if len(result) >= limit:
-                break
-            cids = mapping_by_label.get(label_id, [])
-            rows = []
-            for cid in cids:
-                c = chunks_by_id.get(cid)
-                if not c or c["difficulty"] > user_difficulty_max:
-                    continue
-                row = dict(c)
-                p = progress.get(cid, {})
-                row["last_correct"] = p.get("last_correct", row.get("last_correct", 1))
-                row["learn_count"] = p.get("learn_count", row.get("learn_count", 0))
-                rows.append(row)
-            rows.sort(key=lambda r: (-float(r.get("weight", 0)), r["difficulty"], r["last_correct"]))
-            for r in rows:
-                cid = r["chunk_id"]
-                if cid in seen:
-                    continue
-                seen.add(cid)
-                result.append({"chunk_id": cid, "chunk": r["chunk"], "difficulty": r["difficulty"], "category": r["category"], "weight": r.get("weight", 0), "last_correct": r["last_correct"], "learn_count": r["learn_count"]})
-                if len(result) >= limit:
-                    break
+        for cid in snap.ranking.top_chunk_ids(label_ids, user_difficulty_max, limit, progress_last_correct):
+            c = chunks_by_id[cid]
+            p = progress.get(cid, {})
+            result.append({"chunk_id": c["chunk_id"], "chunk": c["chunk"], "difficulty": c["difficulty"], "category": c["category"], "weight": c.get("weight", 0), "last_correct": p.get("last_correct", c.get("last_correct", 1)), "learn_count": p.get("learn_count", c.get("learn_count", 0))})
         return result
 
     def get_recommended_chunks(
@@ -204,24 +302,16 @@ class ChunkDatabaseFile:
         return self._get_chunks_for_labels(ordered_label_ids, user_id, user_difficulty_max, limit, prefer_wrong_first)
 
     def get_second_level_options(self, first_scene: str, limit: int = 3) -> List[Dict]:
-        scenes = self._load_scenes()
         first_scene = first_scene.strip()
-        by_second: Dict[str, List[int]] = {}
-        for s in scenes:
-            if s.get("first_scene") != first_scene:
-                continue
-            sec = s.get("second_scene", "")
-            if sec not in by_second:
-                by_second[sec] = []
-            by_second[sec].append(int(s["label_id"]))
+        seconds = self._snapshot().second_levels.get(first_scene, [])
         result = []
-        for i, (second_scene, label_ids) in enumerate(sorted(by_second.items())):
+        for i, (second_scene, label_ids) in enumerate(seconds):
             if i >= limit:
                 break
             result.append({
                 "first_scene": first_scene,
                 "second_scene": second_scene,
-                "label_ids": label_ids,
+                "label_ids": list(label_ids),
                 "scene_primary": first_scene,
                 "scene_secondary": second_scene,
             })
@@ -270,11 +360,14 @@ class ChunkDatabaseFile:
 
     def init_user_scene_weights(self, user_id: str) -> None:
         scenes = self._load_scenes()
-        weights = self._load_user_scene_weights(user_id)
-        for s in scenes:
-            lid = s["label_id"]
-            if lid not in weights:
-                weights[lid] = 0.0
+        current = self._user_scene_weights(user_id)
+        missing = [s["label_id"] for s in scenes if s["label_id"] not in current]
+        # 已有全部场景的权重时不再重写文件（每次推荐都会调用）
+        if not missing and self._user_scene_weights_path(user_id).exists():
+            return
+        weights = dict(current)
+        for lid in missing:
+            weights[lid] = 0.0
         self._save_user_scene_weights(user_id, weights)
 
     def get_label_id_by_scenes(
@@ -283,23 +376,15 @@ class ChunkDatabaseFile:
         second_scene: str,
         third_scene: Optional[str] = None,
     ) -> Optional[int]:
-        scenes = self._load_scenes()
-        first_scene = first_scene.strip()
-        second_scene = second_scene.strip()
-        for s in scenes:
-            if s.get("first_scene") != first_scene or s.get("second_scene") != second_scene:
-                continue
-            if third_scene and s.get("third_scene") != third_scene.strip():
+        labels = self._snapshot().labels_by_second.get((first_scene.strip(), second_scene.strip()), [])
+        for third, label_id in labels:
+            if third_scene and third != third_scene.strip():
                 continue
-            return int(s["label_id"])
+            return label_id
         return None
 
     def find_chunk_by_text(self, text: str, category: Optional[int] = None) -> Optional[Dict]:
-        chunks = self._load_chunks()
-        key = text.strip().lower()
-        for c in chunks:
-            if c.get("chunk", "").strip().lower() != key:
-                continue
+        for c in self._snapshot().chunks_by_text.get(text.strip().lower(), []):
             if category is not None and c.get("category") != category:
                 continue
             return {"chunk_id": c["chunk_id"], "chunk": c["chunk"], "difficulty": c["difficulty"], "category": c["category"], "weight": c.get("weight", 0)}
@@ -313,16 +398,19 @@ class ChunkDatabaseFile:
         label_id: int,
         weight: float = 0.0,
     ) -> Dict:
-        chunks = self._load_chunks()
-        mapping = self._load_mapping()
+        snap = self._snapshot()
+        # 快照只读：在副本上追加后整份写回，写回后快照失效
+        chunks = list(snap.chunks)
+        mapping = list(snap.mapping)
         chunk_text = chunk_text.strip()
         key = chunk_text.lower()
-        for c in chunks:
-            if c.get("chunk", "").strip().lower() == key and c.get("category") == category:
+        for c in snap.chunks_by_text.get(key, []):
+            if c.get("category") == category:
                 cid = c["chunk_id"]
-                if not any(m.get("chunk_id") == cid and m.get("label_id") == label_id for m in mapping):
+                if (int(cid), int(label_id)) not in snap.mapping_pairs:
                     mapping.append({"chunk_id": cid, "label_id": label_id})
                     _save_json(self._mapping_path(), mapping)
+                    _invalidate_snapshot(self._data_dir)
                 return {"chunk_id": cid, "chunk": c["chunk"], "difficulty": c["difficulty"], "category": c["category"], "weight": c.get("weight", 0)}
         next_id = max((c["chunk_id"] for c in chunks), default=0) + 1
         new_chunk = {
@@ -339,12 +427,12 @@ class ChunkDatabaseFile:
         mapping.append({"chunk_id": next_id, "label_id": label_id})
         _save_json(self._chunks_path(), chunks)
         _save_json(self._mapping_path(), mapping)
+        _invalidate_snapshot(self._data_dir)
         return {"chunk_id": next_id, "chunk": chunk_text, "difficulty": difficulty, "category": category, "weight": weight}
 
     def get_user_chunk_progress(self, user_id: str) -> List[Dict]:
-        progress = self._load_user_chunk_progress(user_id)
-        chunks = self._load_chunks()
-        chunks_by_id = {c["chunk_id"]: c for c in chunks}
+        progress = self._user_chunk_progress(user_id)
+        chunks_by_id = self._snapshot().chunks_by_id
         result = []
         for cid, p in progress.items():
             c = chunks_by_id.get(cid)
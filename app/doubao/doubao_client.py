@@ -9,12 +9,15 @@ import asyncio
 import struct
 import gzip
 import io
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple, AsyncIterator
+import weakref
 import websockets
 import aiohttp
 import os
 from dotenv import load_dotenv
 
+from ..metrics import LLM_SECONDS, LLM_TTFT_SECONDS, PROVIDER_ERRORS
+
 # Load environment variables
 load_dotenv()
 
@@ -34,6 +37,17 @@ VOLCENGINE_ASR_APP_ID = os.getenv("VOLCENGINE_ASR_APP_ID")
 VOLCENGINE_ASR_ACCESS_TOKEN = os.getenv("VOLCENGINE_ASR_ACCESS_TOKEN")
 ASR_ENDPOINT = os.getenv("ASR_ENDPOINT", "wss://openspeech.bytedance.com/api/v3/sauc/bigmodel")
 ASR_SEGMENT_DURATION = int(os.getenv("ASR_SEGMENT_DURATION", "200"))
+# 流式识别发帧节奏：相对实时的倍数（1.0=每帧间隔 ASR_SEGMENT_DURATION 毫秒，0.5=两倍速，0=不等待）
+ASR_STREAM_PACE = float(os.getenv("ASR_STREAM_PACE", "1.0"))
+# TTS WebSocket 连接池：每个事件循环内最多并发的连接数、空闲连接保留秒数、建连超时
+TTS_POOL_SIZE = int(os.getenv("TTS_POOL_SIZE", "4"))
+TTS_POOL_IDLE_TIMEOUT = float(os.getenv("TTS_POOL_IDLE_TIMEOUT", "50"))
+TTS_CONNECT_TIMEOUT = float(os.getenv("TTS_CONNECT_TIMEOUT", "60"))
+# LLM 异步 HTTP 连接池：每个事件循环一个长连接会话，最多并发连接数、keep-alive 秒数、
+# 建连 / 两次读取之间的超时（与原 requests timeout=45 一致，不限制整个流式回复的总时长）
+LLM_HTTP_POOL_SIZE = int(os.getenv("LLM_HTTP_POOL_SIZE", "32"))
+LLM_HTTP_KEEPALIVE = float(os.getenv("LLM_HTTP_KEEPALIVE", "60"))
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "45"))
 
 
 class DoubaoLLMClient:
@@ -43,23 +57,14 @@ class DoubaoLLMClient:
         self.api_key = api_key or DOUBAO_API_KEY
         self.base_url = base_url or DOUBAO_API_BASE_URL
         self.model = model or LLM_MODEL
+        # aiohttp 会话绑定创建它的事件循环，按循环分开保存（与 TTS 连接池一致）
+        self._sessions = weakref.WeakKeyDictionary()
         
         if not self.api_key:
             raise ValueError("请设置DOUBAO_API_KEY环境变量")
     
-    def chat(self, messages: List[Dict[str, str]], temperature: float = 0.7, max_tokens: int = None, stream: bool = False) -> Optional[str]:
-        """
-        发送聊天请求
-        
-        Args:
-            messages: 消息列表，格式为 [{"role": "user", "content": "..."}]
-            temperature: 温度参数，控制回复的随机性（与OpenAI保持一致）
-            max_tokens: 最大生成token数（对应OpenAI的max_completion_tokens，用于控制输出长度）
-            stream: 是否使用流式响应（与OpenAI保持一致，提升响应速度）
-        
-        Returns:
-            AI回复内容（流式模式下返回完整内容）
-        """
+    def _build_request(self, messages: List[Dict[str, str]], temperature: float, max_tokens: Optional[int], stream: bool) -> Tuple[str, Dict[str, str], Dict]:
+        """构建 chat/completions 请求的 (url, headers, data)，并打印请求摘要（同步 chat 与异步 achat/astream 共用）"""
         url = f"{self.base_url}/chat/completions"
         
         headers = {
@@ -97,6 +102,23 @@ class DoubaoLLMClient:
         if messages:
             print(f"  - System message length: {len(messages[0].get('content', ''))} chars")
             print(f"  - User message: {messages[-1].get('content', '')[:100]}..." if len(messages) > 0 and len(messages[-1].get('content', '')) > 100 else f"  - User message: {messages[-1].get('content', '') if messages else ''}")
+        return url, headers, data
+
+    def chat(self, messages: List[Dict[str, str]], temperature: float = 0.7, max_tokens: int = None, stream: bool = False, on_delta=None) -> Optional[str]:
+        """
+        发送聊天请求
+        
+        Args:
+            messages: 消息列表，格式为 [{"role": "user", "content": "..."}]
+            temperature: 温度参数，控制回复的随机性（与OpenAI保持一致）
+            max_tokens: 最大生成token数（对应OpenAI的max_completion_tokens，用于控制输出长度）
+            stream: 是否使用流式响应（与OpenAI保持一致，提升响应速度）
+            on_delta: 流式模式下每收到一段回复增量即回调 on_delta(text)（边生成边断句合成语音用）
+        
+        Returns:
+            AI回复内容（流式模式下返回完整内容）
+        """
+        url, headers, data = self._build_request(messages, temperature, max_tokens, stream)
         
         try:
             import time
@@ -117,6 +139,7 @@ class DoubaoLLMClient:
                 for line_bytes in response.iter_lines(decode_unicode=False):
                     if first_chunk_time is None:
                         first_chunk_time = time.time()
+                        LLM_TTFT_SECONDS.observe(first_chunk_time - start_time, provider="doubao")
                         print(f"Debug: Doubao first chunk received in {first_chunk_time - start_time:.2f}s")
                     
                     if not line_bytes:
@@ -141,6 +164,8 @@ class DoubaoLLMClient:
                                 
                                 if delta_content:
                                     full_response += delta_content
+                                    if on_delta:
+                                        on_delta(delta_content)
                             except json.JSONDecodeError:
                                 pass
                         continue
@@ -185,6 +210,8 @@ class DoubaoLLMClient:
                             
                             if delta_content:
                                 full_response += delta_content
+                                if on_delta:
+                                    on_delta(delta_content)
                         except json.JSONDecodeError:
                             # 解析失败，继续累积
                             pass
@@ -199,10 +226,13 @@ class DoubaoLLMClient:
                                 delta_content = choice["delta"].get("content", "")
                                 if delta_content:
                                     full_response += delta_content
+                                    if on_delta:
+                                        on_delta(delta_content)
                     except json.JSONDecodeError:
                         pass
                 
                 total_time = time.time() - start_time
+                LLM_SECONDS.observe(total_time, provider="doubao")
                 print(f"Debug: Doubao stream complete in {total_time:.2f}s, response length: {len(full_response)}")
                 return full_response
             else:
@@ -213,6 +243,7 @@ class DoubaoLLMClient:
                 result = response.json()
                 
                 total_time = time.time() - start_time
+                LLM_SECONDS.observe(total_time, provider="doubao")
                 print(f"Debug: Doubao non-stream complete in {total_time:.2f}s")
                 
                 # 提取回复内容
@@ -223,6 +254,7 @@ class DoubaoLLMClient:
                     return None
                 
         except requests.exceptions.RequestException as e:
+            PROVIDER_ERRORS.inc(provider="doubao", stage="llm")
             print(f"API请求失败: {e}")
             if hasattr(e, 'response') and e.response is not None:
                 try:
@@ -233,6 +265,110 @@ class DoubaoLLMClient:
             return None
 
 
+    # ---------- 异步接口：每个事件循环一个长连接 aiohttp 会话，不占用线程池 ----------
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=LLM_HTTP_POOL_SIZE,
+                keepalive_timeout=LLM_HTTP_KEEPALIVE,
+                ttl_dns_cache=300,
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                # 不设 total：SSE 回复可以超过 LLM_REQUEST_TIMEOUT 秒，只要分片之间不停顿这么久
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=LLM_REQUEST_TIMEOUT, sock_read=LLM_REQUEST_TIMEOUT),
+            )
+            self._sessions[loop] = session
+        return session
+
+    async def aclose(self) -> None:
+        """关闭当前事件循环的 HTTP 会话（应用关闭时调用）"""
+        session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None and not session.closed:
+            await session.close()
+
+    @staticmethod
+    def _delta_content(chunk: Dict) -> str:
+        """从流式分片中取回复增量；只取 content，忽略 reasoning_content（推理过程）"""
+        choices = chunk.get("choices") or []
+        if not choices:
+            return ""
+        choice = choices[0]
+        content = (choice.get("delta") or {}).get("content") or ""
+        if not content and "message" in choice:
+            content = (choice.get("message") or {}).get("content") or ""
+        return content
+
+    async def astream(self, messages: List[Dict[str, str]], temperature: float = 0.7, max_tokens: int = None) -> AsyncIterator[str]:
+        """流式聊天：以异步迭代器逐段产出回复增量。请求失败时抛 aiohttp.ClientError / asyncio.TimeoutError。"""
+        url, headers, data = self._build_request(messages, temperature, max_tokens, True)
+        start_time = time.time()
+        first_chunk_time = None
+        total_len = 0
+        async with self._get_session().post(url, headers=headers, json=data) as response:
+            if response.status >= 400:
+                print(f"API请求失败: HTTP {response.status}")
+                print(f"响应内容: {(await response.text())[:500]}")
+                response.raise_for_status()
+            json_buffer = ""  # SSE 单条 data 偶尔跨行，累积到能解析为止
+            async for raw_line in response.content:
+                line = raw_line.decode("utf-8", errors="ignore").strip()
+                if not line:
+                    continue
+                if line.startswith("data:"):
+                    line = line[5:].strip()
+                    json_buffer = ""
+                if line == "[DONE]":
+                    break
+                json_buffer += line
+                try:
+                    chunk = json.loads(json_buffer)
+                except json.JSONDecodeError:
+                    continue
+                json_buffer = ""
+                delta_content = self._delta_content(chunk)
+                if delta_content:
+                    if first_chunk_time is None:
+                        first_chunk_time = time.time()
+                        LLM_TTFT_SECONDS.observe(first_chunk_time - start_time, provider="doubao")
+                        print(f"Debug: Doubao first chunk received in {first_chunk_time - start_time:.2f}s (async)")
+                    total_len += len(delta_content)
+                    yield delta_content
+        LLM_SECONDS.observe(time.time() - start_time, provider="doubao")
+        print(f"Debug: Doubao stream complete in {time.time() - start_time:.2f}s (async), response length: {total_len}")
+
+    async def achat(self, messages: List[Dict[str, str]], temperature: float = 0.7, max_tokens: int = None, stream: bool = True) -> Optional[str]:
+        """异步版 chat：参数与返回值约定相同（失败返回 None），stream 默认开启。"""
+        try:
+            if stream:
+                parts = []
+                async for delta_content in self.astream(messages, temperature, max_tokens):
+                    parts.append(delta_content)
+                return "".join(parts)
+            url, headers, data = self._build_request(messages, temperature, max_tokens, False)
+            start_time = time.time()
+            async with self._get_session().post(url, headers=headers, json=data) as response:
+                if response.status >= 400:
+                    PROVIDER_ERRORS.inc(provider="doubao", stage="llm")
+                    print(f"API请求失败: HTTP {response.status}")
+                    print(f"响应内容: {(await response.text())[:500]}")
+                    return None
+                result = await response.json(content_type=None)
+            LLM_SECONDS.observe(time.time() - start_time, provider="doubao")
+            print(f"Debug: Doubao non-stream complete in {time.time() - start_time:.2f}s (async)")
+            if "choices" in result and len(result["choices"]) > 0:
+                return result["choices"][0]["message"]["content"]
+            print(f"API响应格式异常: {result}")
+            return None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            PROVIDER_ERRORS.inc(provider="doubao", stage="llm")
+            print(f"API请求失败: {e!r}")
+            return None
+
+
 class DoubaoASRClient:
     """豆包ASR客户端（火山引擎 - WebSocket）"""
     
@@ -279,8 +415,8 @@ class DoubaoASRClient:
         header.append(0x00)  # reserved
         return bytes(header)
     
-    def _build_full_client_request(self, seq: int) -> bytes:
-        """构建完整客户端请求"""
+    def _build_full_client_request(self, seq: int, audio_format: str = "wav") -> bytes:
+        """构建完整客户端请求（audio_format: wav=完整 WAV 文件分段发送，pcm=裸 PCM 帧）"""
         header = self._build_header(
             self.MSG_TYPE_CLIENT_FULL_REQUEST,
             self.FLAGS_POS_SEQUENCE,
@@ -298,7 +434,7 @@ class DoubaoASRClient:
                 "uid": "demo_uid"
             },
             "audio": {
-                "format": "wav",
+                "format": audio_format,
                 "codec": "raw",
                 "rate": 16000,
                 "bits": 16,
@@ -555,6 +691,26 @@ class DoubaoASRClient:
         if len(audio_segments) > 0:
             print(f"第一段大小: {len(audio_segments[0])}字节, 最后一段大小: {len(audio_segments[-1])}字节")
         
+        return await self._recognize_segments(audio_segments, "wav")
+
+    async def transcribe_pcm_async(self, pcm_data: bytes, pace: float = None) -> Optional[str]:
+        """
+        流式识别裸 PCM（16kHz, 16bit, 单声道），按 segment_duration 切帧直接走 WebSocket 发送，
+        不需要先写 WAV 文件、也不需要公网可访问的音频 URL。
+
+        Args:
+            pcm_data: PCM 音频数据
+            pace: 发帧间隔相对实时的倍数（1.0=按实时节奏，0.5=两倍速发送，0=不等待）；默认取 ASR_STREAM_PACE
+        """
+        if not pcm_data:
+            return None
+        segment_size = 16000 * 2 * self.segment_duration // 1000
+        return await self._recognize_segments(self._split_audio(pcm_data, segment_size), "pcm", pace)
+
+    async def _recognize_segments(self, audio_segments: List[bytes], audio_format: str, pace: float = None) -> Optional[str]:
+        """建立 ASR WebSocket，发送完整客户端请求后逐帧发送音频并接收最终结果"""
+        if pace is None:
+            pace = ASR_STREAM_PACE
         # 构建认证头
         headers = {
             "X-Api-Resource-Id": "volc.bigasr.sauc.duration",
@@ -573,7 +729,7 @@ class DoubaoASRClient:
                 async with session.ws_connect(self.endpoint, headers=headers) as ws:
                     print("WebSocket连接成功")
                     # 1. 发送完整客户端请求
-                    full_request = self._build_full_client_request(seq)
+                    full_request = self._build_full_client_request(seq, audio_format)
                     print(f"发送完整客户端请求，大小={len(full_request)}字节")
                     await ws.send_bytes(full_request)
                     seq += 1
@@ -612,8 +768,9 @@ class DoubaoASRClient:
                             print(f"发送音频段 {i+1}/{len(audio_segments)}, 大小={len(segment)}字节, is_last={is_last}, seq={original_seq}")
                             await ws.send_bytes(audio_request)
                             
-                            # 每个包发送后都等待（包括最后一个），模拟实时流
-                            await asyncio.sleep(self.segment_duration / 1000)
+                            # 每个包发送后都等待（包括最后一个），模拟实时流；pace<1 时按倍速发送
+                            if pace > 0:
+                                await asyncio.sleep(self.segment_duration / 1000 * pace)
                             
                             if not is_last:
                                 seq += 1
@@ -762,16 +919,117 @@ class DoubaoASRClient:
             raise Exception(f"ASR转录失败: {str(e)}") from e
 
 
+def _ws_is_open(websocket) -> bool:
+    """兼容 websockets 新旧实现：close_code 为 None 且 state 为 OPEN 视为可用"""
+    if getattr(websocket, "close_code", None) is not None:
+        return False
+    state = getattr(websocket, "state", None)
+    return state is None or getattr(state, "name", "") == "OPEN"
+
+
+class _TTSConnectionPool:
+    """单个事件循环内的 TTS WebSocket 连接池。
+
+    - 信号量限制同时占用的连接数（即对厂商的并发上限），突发请求排队而不是各自建连；
+    - 用完的连接若协议正常结束且仍打开则放回空闲队列，下次取用前检查健康与空闲时长；
+    - 建连失败按指数退避（0.5s 起，最长 30s），避免对限流中的服务反复握手。
+    """
+
+    def __init__(self, connect, size: int, idle_timeout: float):
+        self._connect = connect
+        self._sem = asyncio.Semaphore(max(1, size))
+        self._idle: List[Tuple[object, float]] = []
+        self._idle_timeout = idle_timeout
+        self._backoff = 0.0
+        self._next_connect_at = 0.0
+        self.in_use = 0
+        self.created = 0
+        self.reused = 0
+        self.failed_connects = 0
+
+    def _healthy(self, websocket, last_used: float) -> bool:
+        return _ws_is_open(websocket) and (time.monotonic() - last_used) < self._idle_timeout
+
+    async def acquire(self) -> Tuple[object, bool]:
+        """取一条连接，返回 (websocket, 是否复用)。调用方必须配对调用 release。"""
+        await self._sem.acquire()
+        try:
+            while self._idle:
+                websocket, last_used = self._idle.pop()
+                if self._healthy(websocket, last_used):
+                    self.in_use += 1
+                    self.reused += 1
+                    return websocket, True
+                await self._close(websocket)
+            websocket = await self._open()
+            self.in_use += 1
+            return websocket, False
+        except BaseException:
+            self._sem.release()
+            raise
+
+    async def release(self, websocket, reusable: bool) -> None:
+        self.in_use -= 1
+        try:
+            if reusable and _ws_is_open(websocket):
+                self._idle.append((websocket, time.monotonic()))
+            else:
+                await self._close(websocket)
+        finally:
+            self._sem.release()
+
+    async def _open(self):
+        delay = self._next_connect_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        try:
+            websocket = await self._connect()
+        except Exception:
+            self.failed_connects += 1
+            self._backoff = min(max(self._backoff * 2, 0.5), 30.0)
+            self._next_connect_at = time.monotonic() + self._backoff
+            raise
+        self._backoff = 0.0
+        self._next_connect_at = 0.0
+        self.created += 1
+        return websocket
+
+    @staticmethod
+    async def _close(websocket) -> None:
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+
+    async def close(self) -> None:
+        idle, self._idle = self._idle, []
+        for websocket, _ in idle:
+            await self._close(websocket)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "idle": len(self._idle),
+            "in_use": self.in_use,
+            "created": self.created,
+            "reused": self.reused,
+            "failed_connects": self.failed_connects,
+        }
+
+
 class DoubaoTTSClient:
-    """豆包TTS客户端（火山引擎 - WebSocket）"""
+    """豆包TTS客户端（火山引擎 - WebSocket）。异步调用走按事件循环的连接池，复用已握手的连接。"""
     
     def __init__(self, app_id: str = None, access_token: str = None, 
-                 endpoint: str = None, voice_type: str = None, encoding: str = None):
+                 endpoint: str = None, voice_type: str = None, encoding: str = None,
+                 pool_size: int = None):
         self.app_id = app_id or VOLCENGINE_APP_ID
         self.access_token = access_token or VOLCENGINE_ACCESS_TOKEN
         self.endpoint = endpoint or TTS_ENDPOINT
         self.voice_type = voice_type or TTS_VOICE_TYPE
         self.encoding = encoding or TTS_ENCODING
+        self.pool_size = pool_size or TTS_POOL_SIZE
+        # WebSocket 绑定创建它的事件循环，连接池按循环分开保存
+        self._pools = weakref.WeakKeyDictionary()
         
         if not self.app_id or not self.access_token:
             raise ValueError("请设置VOLCENGINE_APP_ID和VOLCENGINE_ACCESS_TOKEN环境变量")
@@ -781,8 +1039,102 @@ class DoubaoTTSClient:
         if voice.startswith("S_"):
             return "volcano_icl"
         return "volcano_tts"
+
+    async def _connect(self):
+        headers = {
+            "Authorization": f"Bearer;{self.access_token}",
+        }
+        # 豆包 TTS 服务建连可能较慢，延长连接超时时间
+        return await websockets.connect(
+            self.endpoint,
+            additional_headers=headers,
+            max_size=10 * 1024 * 1024,
+            open_timeout=TTS_CONNECT_TIMEOUT,
+            close_timeout=10
+        )
+
+    def _get_pool(self) -> _TTSConnectionPool:
+        loop = asyncio.get_running_loop()
+        pool = self._pools.get(loop)
+        if pool is None:
+            pool = _TTSConnectionPool(self._connect, self.pool_size, TTS_POOL_IDLE_TIMEOUT)
+            self._pools[loop] = pool
+        return pool
+
+    def pool_stats(self) -> Dict[str, int]:
+        """当前事件循环连接池的统计（无运行中的循环或尚未建池时为空）"""
+        try:
+            pool = self._pools.get(asyncio.get_running_loop())
+        except RuntimeError:
+            pool = None
+        return pool.stats() if pool else {}
+
+    async def aclose(self) -> None:
+        """关闭当前事件循环连接池中的空闲连接（应用关闭时调用）"""
+        pool = self._pools.pop(asyncio.get_running_loop(), None)
+        if pool is not None:
+            await pool.close()
+
+    async def _request_on(self, websocket, text: str, voice_type: str, encoding: str, cluster: str) -> Tuple[Optional[bytes], bool]:
+        """在一条已建立的连接上完成一次合成，返回 (音频数据, 连接是否可复用)"""
+        from .protocols import MsgType, full_client_request, receive_message
+        
+        # 构建请求
+        request = {
+            "app": {
+                "appid": self.app_id,
+                "token": self.access_token,
+                "cluster": cluster,
+            },
+            "user": {
+                "uid": str(uuid.uuid4()),
+            },
+            "audio": {
+                "voice_type": voice_type,
+                "encoding": encoding,
+            },
+            "request": {
+                "reqid": str(uuid.uuid4()),
+                "text": text,
+                "operation": "submit",  # 关键：必须包含operation字段
+                "with_timestamp": "1",
+                "extra_param": json.dumps({
+                    "disable_markdown_filter": False,
+                }),
+            },
+        }
+        
+        # 发送请求
+        await full_client_request(websocket, json.dumps(request).encode())
+        
+        # 接收音频数据
+        audio_data = bytearray()
+        while True:
+            msg = await receive_message(websocket)
+            
+            if msg.type == MsgType.FrontEndResultServer:
+                continue
+            elif msg.type == MsgType.AudioOnlyServer:
+                audio_data.extend(msg.payload)
+                if msg.sequence < 0:  # 最后一条消息
+                    break
+            elif msg.type == MsgType.Error:
+                error_msg = msg.payload.decode('utf-8', errors='ignore') if msg.payload else "未知错误"
+                print(f"TTS API错误: {error_msg}, 错误码: {msg.error_code}")
+                return None, False
+            else:
+                print(f"TTS收到未知消息类型: {msg.type}, 消息: {msg}")
+                # 继续接收，可能还有音频数据
+                continue
+        
+        # 检查是否收到音频数据
+        if not audio_data:
+            print("未收到音频数据")
+            return None, False
+        
+        return bytes(audio_data), True
     
-    async def _synthesize_async(self, text: str, voice_type: str = None, encoding: str = None) -> Optional[bytes]:
+    async def _synthesize_async(self, text: str, voice_type: str = None, encoding: str = None, use_pool: bool = True) -> Optional[bytes]:
         """
         文字转语音（异步WebSocket实现）
         
@@ -790,6 +1142,7 @@ class DoubaoTTSClient:
             text: 要合成的文本
             voice_type: 音色类型（可选，默认使用配置）
             encoding: 编码格式（可选，默认使用配置）
+            use_pool: 是否使用连接池；临时事件循环（asyncio.run）中应关闭，避免循环结束后遗留空闲连接
         
         Returns:
             音频数据（bytes）
@@ -808,89 +1161,44 @@ class DoubaoTTSClient:
             print("错误: 无法导入protocols模块，请确保protocols目录存在")
             return None
         
-        # 连接WebSocket
-        headers = {
-            "Authorization": f"Bearer;{self.access_token}",
-        }
-        
         try:
-            # 豆包 TTS 服务建连可能较慢，延长连接超时时间
-            websocket = await websockets.connect(
-                self.endpoint,
-                additional_headers=headers,
-                max_size=10 * 1024 * 1024,
-                open_timeout=60,
-                close_timeout=10
-            )
+            if not use_pool:
+                websocket = await self._connect()
+                try:
+                    audio, _ = await self._request_on(websocket, text, voice_type, encoding, cluster)
+                    return audio
+                finally:
+                    await websocket.close()
             
-            try:
-                # 构建请求
-                request = {
-                    "app": {
-                        "appid": self.app_id,
-                        "token": self.access_token,
-                        "cluster": cluster,
-                    },
-                    "user": {
-                        "uid": str(uuid.uuid4()),
-                    },
-                    "audio": {
-                        "voice_type": voice_type,
-                        "encoding": encoding,
-                    },
-                    "request": {
-                        "reqid": str(uuid.uuid4()),
-                        "text": text,
-                        "operation": "submit",  # 关键：必须包含operation字段
-                        "with_timestamp": "1",
-                        "extra_param": json.dumps({
-                            "disable_markdown_filter": False,
-                        }),
-                    },
-                }
-                
-                # 发送请求
-                await full_client_request(websocket, json.dumps(request).encode())
-                
-                # 接收音频数据
-                audio_data = bytearray()
-                while True:
-                    msg = await receive_message(websocket)
-                    
-                    if msg.type == MsgType.FrontEndResultServer:
-                        continue
-                    elif msg.type == MsgType.AudioOnlyServer:
-                        audio_data.extend(msg.payload)
-                        if msg.sequence < 0:  # 最后一条消息
-                            break
-                    elif msg.type == MsgType.Error:
-                        error_msg = msg.payload.decode('utf-8', errors='ignore') if msg.payload else "未知错误"
-                        print(f"TTS API错误: {error_msg}, 错误码: {msg.error_code}")
-                        return None
-                    else:
-                        print(f"TTS收到未知消息类型: {msg.type}, 消息: {msg}")
-                        # 继续接收，可能还有音频数据
+            pool = self._get_pool()
+            # 复用的连接可能已被服务端关闭：失败时换一条新连接重试一次
+            for attempt in range(2):
+                websocket, reused = await pool.acquire()
+                reusable = False
+                try:
+                    audio, reusable = await self._request_on(websocket, text, voice_type, encoding, cluster)
+                    return audio
+                except Exception:
+                    if reused and attempt == 0:
                         continue
-                
-                # 检查是否收到音频数据
-                if not audio_data:
-                    print("未收到音频数据")
-                    return None
-                
-                return bytes(audio_data)
-                
-            finally:
-                await websocket.close()
+                    raise
+                finally:
+                    await pool.release(websocket, reusable)
+            return None
                 
         except Exception as e:
             import traceback
             error_trace = traceback.format_exc()
             print(f"TTS WebSocket连接失败:\n{error_trace}")
             return None
+
+    async def synthesize_async(self, text: str, voice_type: str = None, encoding: str = None) -> Optional[bytes]:
+        """文字转语音（异步，使用当前事件循环的连接池）。在事件循环中优先使用本方法而非 synthesize。"""
+        return await self._synthesize_async(text, voice_type, encoding)
     
     def synthesize(self, text: str, voice_type: str = None, encoding: str = None) -> Optional[bytes]:
         """
-        文字转语音（同步包装器）
+        文字转语音（同步包装器，每次新建连接；事件循环中请使用 synthesize_async 以复用连接池）
         
         Args:
             text: 要合成的文本
@@ -914,14 +1222,15 @@ class DoubaoTTSClient:
             # 如果事件循环正在运行（比如在Flask中），需要使用nest_asyncio
             # 或者使用线程来运行异步代码
             try:
-                return loop.run_until_complete(self._synthesize_async(text, voice_type, encoding))
+                # 同步调用多在临时线程/循环中，连接无法跨循环复用，不走连接池
+                return loop.run_until_complete(self._synthesize_async(text, voice_type, encoding, use_pool=False))
             except RuntimeError as e:
                 if "This event loop is already running" in str(e):
                     # 在已有事件循环中运行，需要使用线程
                     import concurrent.futures
                     with concurrent.futures.ThreadPoolExecutor() as executor:
                         future = executor.submit(
-                            lambda: asyncio.run(self._synthesize_async(text, voice_type, encoding))
+                            lambda: asyncio.run(self._synthesize_async(text, voice_type, encoding, use_pool=False))
                         )
                         return future.result(timeout=30)
                 else:
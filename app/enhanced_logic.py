@@ -142,7 +142,14 @@ async def enhanced_text_to_speech(text, detected_mood=None, account_name=None):
                 success = await elevenlabs_text_to_speech(text, enhanced_audio_filename)
             elif TTS_PROVIDER == 'kokoro':
                 success = await kokoro_text_to_speech(text, enhanced_audio_filename)
-            
+
+            if not success:
+                # TTS 函数本身不再广播错误，这里只报给当前账号
+                from .app import send_message_to_clients
+                await send_message_to_clients(json.dumps({
+                    "action": "error",
+                    "message": f"{TTS_PROVIDER} TTS 生成失败"
+                }), account_name=acc)
             if success and os.path.exists(enhanced_audio_filename):
                 # 通知开始播放
                 await send_message_to_enhanced_clients({"action": "ai_start_speaking"})
@@ -0,0 +1,59 @@
+# 应用级共享 HTTP 客户端：OpenAI TTS / 转写、Kokoro、ElevenLabs、豆包录音文件识别、Varta 代理等外呼统一复用
+# 同一个 aiohttp.ClientSession（连接池、keep-alive、DNS 缓存、超时集中配置），不再每次调用新建会话重新握手。
+# 启动时 start_http_clients 预建会话，关闭时 close_http_clients 释放；未启动时（脚本等）首次调用自动创建。
+import asyncio
+import os
+import weakref
+from typing import Dict
+
+import aiohttp
+
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "16"))
+HTTP_KEEPALIVE = float(os.getenv("HTTP_KEEPALIVE", "60"))
+HTTP_DNS_TTL = int(os.getenv("HTTP_DNS_TTL", "300"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+# 未单独指定超时的请求的总超时（与 aiohttp 默认一致）；各调用仍可传 timeout= 覆盖
+HTTP_TOTAL_TIMEOUT = float(os.getenv("HTTP_TOTAL_TIMEOUT", "300"))
+
+# 会话绑定创建它的事件循环：loop -> {"default" / "insecure": session}
+_sessions = weakref.WeakKeyDictionary()
+
+
+def _new_session(verify_ssl: bool) -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE,
+        ttl_dns_cache=HTTP_DNS_TTL,
+        ssl=None if verify_ssl else False,
+    )
+    timeout = aiohttp.ClientTimeout(total=HTTP_TOTAL_TIMEOUT, sock_connect=HTTP_CONNECT_TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+def get_http_session(verify_ssl: bool = True) -> aiohttp.ClientSession:
+    """返回当前事件循环的共享会话。verify_ssl=False 用于自建的 Kokoro 等自签名证书服务。
+    调用方直接 `async with get_http_session().post(...)`，不要关闭会话。"""
+    loop = asyncio.get_running_loop()
+    by_name: Dict[str, aiohttp.ClientSession] = _sessions.setdefault(loop, {})
+    name = "default" if verify_ssl else "insecure"
+    session = by_name.get(name)
+    if session is None or session.closed:
+        session = _new_session(verify_ssl)
+        by_name[name] = session
+    return session
+
+
+async def start_http_clients() -> None:
+    """应用启动时预建默认会话"""
+    get_http_session()
+
+
+async def close_http_clients() -> None:
+    """关闭当前事件循环的全部共享会话（应用关闭时调用）"""
+    by_name = _sessions.pop(asyncio.get_running_loop(), None) or {}
+    for session in by_name.values():
+        if not session.closed:
+            await session.close()
+
@@ -3,6 +3,7 @@
 - 默认使用文件后端（data/*.json），无需 MySQL；设置 CHUNK_BACKEND=mysql 时使用 MySQL。
 - 数据：场景、语块、语块-场景关联、用户场景权重、用户语块学习进度。
 """
+import asyncio
 from pathlib import Path
 from typing import List, Dict, Optional
 
@@ -127,6 +128,10 @@ class KnowledgeDatabase:
             for c in chunks
         ]
 
+    async def aget_recommended_knowledge(self, *args, **kwargs) -> List[Dict]:
+        """get_recommended_knowledge 的异步版本：在线程中执行（MySQL 查询 / 读文件），不阻塞事件循环"""
+        return await asyncio.to_thread(self.get_recommended_knowledge, *args, **kwargs)
+
     def update_learning_progress(
         self,
         user_id: str,
@@ -29,6 +29,7 @@ from .app_logic import start_conversation, stop_conversation, set_env_variable,
 from .enhanced_logic import start_enhanced_conversation, stop_enhanced_conversation
 from .app import send_message_to_clients
 from . import account_auth
+from .audio_workers import AudioPoolBusy
 import logging
 import subprocess
 import sys
@@ -74,43 +75,27 @@ app = FastAPI()
 @app.on_event("startup")
 async def startup_validate_dialogues():
     """启动时预加载 dialogues.json，并自动刷新场景索引与本地占位图"""
+    # 每次启动自动刷新场景索引与缺失场景的占位图：进程内复用 scripts/build_scene_npc_index.py 的构建逻辑，
+    # 无需再起子进程（从 dialogues 生成索引并同步 app/static/images/scenes/）
     try:
         from .scene_npc_db import get_dialogues, _dialogues_path, reload_dialogues
         path = _dialogues_path()
+        await asyncio.to_thread(reload_dialogues, True)
         data = get_dialogues()
         if data:
-            logger.info("启动: dialogues.json 已加载，路径=%s，条数=%d", path, len(data))
+            logger.info("启动: dialogues.json 已加载，场景索引与本地图已刷新，路径=%s，条数=%d", path, len(data))
         else:
             logger.warning("启动: dialogues.json 为空或未找到，路径=%s。可设置环境变量 VOICE_CHAT_PROJECT_ROOT 指定项目根目录", path)
     except Exception as e:
         logger.warning("启动: 预加载 dialogues 失败: %s", e)
 
-    # 每次启动自动刷新场景索引与缺失场景的占位图（从 dialogues 生成索引并同步 app/static/images/scenes/）
-    try:
-        root = Path(__file__).resolve().parent.parent
-        script = root / "scripts" / "build_scene_npc_index.py"
-        if script.is_file():
-            r = subprocess.run(
-                [sys.executable, str(script)],
-                cwd=str(root),
-                capture_output=True,
-                text=True,
-                timeout=60,
-            )
-            if r.returncode == 0:
-                logger.info("启动: 场景索引与本地图已刷新")
-                reload_dialogues()
-                from .scene_npc_db import _load_scene_index, clear_scene_image_url_cache
-                _load_scene_index()
-                clear_scene_image_url_cache()
-            else:
-                logger.warning("启动: 场景索引脚本执行异常 returncode=%s stderr=%s", r.returncode, (r.stderr or "").strip()[:200])
-        else:
-            logger.debug("启动: 未找到场景索引脚本 %s", script)
-    except subprocess.TimeoutExpired:
-        logger.warning("启动: 场景索引脚本超时")
+    # 后台监听 dialogues.json 变更：内容变化时进程内重建索引并原子替换快照，无需重启
+    try:
+        from .scene_npc_db import start_dialogues_watcher
+        if start_dialogues_watcher():
+            logger.info("启动: 已开启 dialogues.json 变更监听")
     except Exception as e:
-        logger.warning("启动: 执行场景索引脚本失败: %s", e)
+        logger.warning("启动: 开启 dialogues.json 监听失败: %s", e)
 
     # 预加载场景索引（若存在），首请求即可用内存数据；并清空场景图 URL 缓存、打日志
     try:
@@ -124,30 +109,189 @@ async def startup_validate_dialogues():
         logger.debug("启动: 预加载场景索引跳过: %s", e)
 
 
+@app.on_event("startup")
+async def startup_http_clients():
+    """预建应用级共享 HTTP 会话，各供应商外呼复用其连接池"""
+    try:
+        from .http_clients import start_http_clients
+        await start_http_clients()
+    except Exception as e:
+        logger.warning("启动: 创建共享 HTTP 会话失败: %s", e)
+
+
+@app.on_event("startup")
+async def startup_audio_workers():
+    """预先拉起音频处理进程池（MP3 转 WAV、上传录音解码）"""
+    try:
+        from .audio_workers import start_audio_workers
+        await start_audio_workers()
+    except Exception as e:
+        logger.warning("启动: 拉起音频处理进程池失败: %s", e)
+
+
+@app.on_event("startup")
+async def startup_session_sweeper():
+    """启动会话状态清扫线程（回收过期的练习会话、用户状态、临时音频等）"""
+    try:
+        from .session_state import start_session_sweeper
+        start_session_sweeper()
+    except Exception as e:
+        logger.warning("启动: 开启会话状态清扫失败: %s", e)
+
+
+@app.on_event("startup")
+async def startup_state_backend():
+    """STATE_BACKEND=sqlite 时启动共享状态写回与跨 worker 的 WebSocket 消息转发"""
+    try:
+        from .state_backend import start_state_backend, STATE_DB_PATH
+        if start_state_backend():
+            logger.info("启动: 共享状态后端 sqlite 已启用，路径=%s", STATE_DB_PATH)
+    except Exception as e:
+        logger.warning("启动: 开启共享状态后端失败: %s", e)
+
+
+@app.on_event("shutdown")
+async def shutdown_state_backend():
+    """写回本进程未同步的共享状态并停止消息转发"""
+    try:
+        from .state_backend import stop_state_backend
+        stop_state_backend()
+    except Exception as e:
+        logger.debug("关闭: 停止共享状态后端失败: %s", e)
+
+
+@app.on_event("startup")
+async def startup_storage_gc():
+    """启动 outputs/ 生成音频的后台回收（按类别保留时长与容量上限）"""
+    try:
+        from .audio_storage import start_storage_gc
+        start_storage_gc()
+    except Exception as e:
+        logger.warning("启动: 开启音频存储回收失败: %s", e)
+
+
+@app.on_event("shutdown")
+async def shutdown_storage_gc():
+    """停止音频存储回收线程"""
+    try:
+        from .audio_storage import stop_storage_gc
+        stop_storage_gc()
+    except Exception as e:
+        logger.debug("关闭: 停止音频存储回收失败: %s", e)
+
+
+@app.on_event("shutdown")
+async def shutdown_session_sweeper():
+    """停止会话状态清扫线程"""
+    try:
+        from .session_state import stop_session_sweeper
+        stop_session_sweeper()
+    except Exception as e:
+        logger.debug("关闭: 停止会话状态清扫失败: %s", e)
+
+
+@app.on_event("shutdown")
+async def shutdown_dialogues_watcher():
+    """停止 dialogues.json 变更监听线程"""
+    try:
+        from .scene_npc_db import stop_dialogues_watcher
+        stop_dialogues_watcher()
+    except Exception as e:
+        logger.debug("关闭: 停止 dialogues 监听失败: %s", e)
+
+
+@app.on_event("shutdown")
+async def shutdown_tts_pool():
+    """关闭豆包 TTS 连接池中的空闲 WebSocket"""
+    try:
+        from .app import doubao_tts_client
+        if doubao_tts_client is not None:
+            await doubao_tts_client.aclose()
+    except Exception as e:
+        logger.debug("关闭: 释放 TTS 连接池失败: %s", e)
+
+
+@app.on_event("shutdown")
+async def shutdown_audio_workers():
+    """关闭音频处理进程池"""
+    try:
+        from .audio_workers import shutdown_audio_workers as _shutdown
+        _shutdown()
+    except Exception as e:
+        logger.debug("关闭: 关闭音频处理进程池失败: %s", e)
+
+
+@app.on_event("shutdown")
+async def shutdown_http_clients():
+    """关闭应用级共享 HTTP 会话（OpenAI TTS / 转写、Kokoro、ElevenLabs、录音文件识别等）"""
+    try:
+        from .http_clients import close_http_clients
+        await close_http_clients()
+    except Exception as e:
+        logger.debug("关闭: 释放共享 HTTP 会话失败: %s", e)
+
+
+@app.on_event("shutdown")
+async def shutdown_llm_session():
+    """关闭豆包 LLM 的共享 HTTP 会话"""
+    try:
+        from .app import doubao_llm_client
+        if doubao_llm_client is not None:
+            await doubao_llm_client.aclose()
+    except Exception as e:
+        logger.debug("关闭: 释放 LLM 会话失败: %s", e)
+
+
+@app.on_event("shutdown")
+async def shutdown_chunk_db_pool():
+    """关闭语块 MySQL 连接池中的空闲连接"""
+    try:
+        from .chunk_db import close_chunk_db_pool
+        close_chunk_db_pool()
+    except Exception as e:
+        logger.debug("关闭: 释放语块数据库连接池失败: %s", e)
+
+
+@app.on_event("shutdown")
+async def shutdown_flush_memory_stores():
+    """写出记忆文件写回缓存、Supabase 写回队列与 TTS 缓存索引中尚未落盘的数据"""
+    try:
+        from .adapters.file_state_store import flush_all_stores
+        flush_all_stores()
+    except Exception as e:
+        logger.warning("关闭: 写出记忆缓存失败: %s", e)
+    try:
+        from .adapters.supabase_store import flush_supabase_store
+        flush_supabase_store()
+    except Exception as e:
+        logger.warning("关闭: 写出 Supabase 待写数据失败: %s", e)
+    try:
+        from .tts_cache import flush_tts_cache_index
+        flush_tts_cache_index()
+    except Exception as e:
+        logger.warning("关闭: 写出 TTS 缓存索引失败: %s", e)
+
+
 # Mount static files and templates（用项目根绝对路径；禁用 304 便于更新场景图后立即生效）
 _project_root = Path(__file__).resolve().parent.parent
 app.mount("/app/static", StaticFilesNo304(directory=str(_project_root / "app" / "static")), name="static")
 templates = Jinja2Templates(directory=str(_project_root / "app" / "templates"))
 
-# 添加音频文件服务
+# 添加音频文件服务（MIME 按扩展名、强 ETag / 304、Range 206、生成一次的目录加 immutable，见 audio_serving）
+_OUTPUTS_DIR = (_project_root / "outputs").resolve()
+
+
 @app.get("/audio/{file_path:path}")
-async def serve_audio(file_path: str):
+async def serve_audio(file_path: str, request: Request):
     """提供音频文件服务"""
-    import os
-    from pathlib import Path
-    
-    # 构建音频文件路径
-    current_file_dir = os.path.dirname(os.path.abspath(__file__))
-    project_dir = os.path.dirname(current_file_dir)
-    audio_path = os.path.join(project_dir, "outputs", file_path)
+    from .audio_serving import audio_file_response, audio_media_type
+
+    # 构建音频文件路径（不允许跳出 outputs/）
+    audio_path = (_OUTPUTS_DIR / file_path).resolve()
     
-    # 检查文件是否存在
-    if os.path.exists(audio_path) and os.path.isfile(audio_path):
-        return FileResponse(
-            audio_path,
-            media_type="audio/wav",
-            headers={"Content-Disposition": f"inline; filename={os.path.basename(audio_path)}"}
-        )
+    # 检查文件是否存在；只提供音频扩展名的文件（outputs/ 下的索引、清单等其他文件一律 404）
+    if audio_path.is_relative_to(_OUTPUTS_DIR) and audio_media_type(str(audio_path)) and audio_path.is_file():
+        return await audio_file_response(request, str(audio_path), file_path)
     else:
         return JSONResponse(
             {"status": "error", "message": "Audio file not found"},
@@ -155,7 +299,7 @@ async def serve_audio(file_path: str):
         )
 
 # 录音文件识别：临时音频 URL 供火山引擎拉取
-from .audio_temp import register_audio_temp, get_audio_temp_path, unregister_audio_temp
+from .audio_temp import get_audio_temp_path
 
 @app.get("/api/audio/temp/{token}")
 async def serve_audio_temp(token: str):
@@ -163,10 +307,57 @@ async def serve_audio_temp(token: str):
     path, expired = get_audio_temp_path(token)
     if path is None or expired:
         return JSONResponse({"error": "not found" if path is None else "expired"}, status_code=404)
+    if isinstance(path, bytes):
+        return Response(content=path, media_type="audio/wav")
     if not os.path.exists(path) or not os.path.isfile(path):
         return JSONResponse({"error": "file gone"}, status_code=404)
     return FileResponse(path, media_type="audio/wav")
 
+# 记录整轮耗时的对话接口（voicechat_turn_seconds{endpoint=...}）
+METRICS_TURN_ENDPOINTS = {
+    "/api/voice/upload",
+    "/api/text/send",
+    "/api/scene-npc/immersive-chat",
+    "/api/practice/start",
+    "/api/practice/respond",
+    "/api/practice/transcribe",
+}
+
+
+@app.middleware("http")
+async def record_turn_latency(request: Request, call_next):
+    """对话接口按接口记录整轮耗时；回复在后台生成的接口（defer_turn）在回复推送完成时记录"""
+    if request.url.path not in METRICS_TURN_ENDPOINTS:
+        return await call_next(request)
+    from .metrics import start_turn, end_turn
+    token = start_turn(request.url.path)
+    try:
+        return await call_next(request)
+    finally:
+        end_turn(token)
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus 抓取端点：各阶段耗时直方图、供应商错误计数、缓存 / 进程池 / WebSocket 队列状态"""
+    from .metrics import render_prometheus
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/api/metrics/summary")
+async def metrics_summary_api():
+    """最近样本的 p50/p95/p99（秒）与错误计数，便于未接 Prometheus 时直接查看"""
+    from .metrics import metrics_summary
+    return JSONResponse(metrics_summary())
+
+
+@app.get("/api/storage/usage")
+async def storage_usage_api(refresh: bool = False):
+    """outputs/ 各类生成音频的文件数、占用、容量上限、保留时长与累计回收量；refresh=true 时重新扫描目录"""
+    from .audio_storage import storage_usage_report
+    return JSONResponse(await asyncio.to_thread(storage_usage_report, refresh))
+
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -576,12 +767,12 @@ async def api_practice_live_user_count():
         return JSONResponse({"userCount": 0})
     url = f"{base}/user-count"
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=aiohttp.ClientTimeout(total=5)) as resp:
-                if resp.status != 200:
-                    return JSONResponse({"userCount": 0})
-                data = await resp.json()
-                return JSONResponse(data)
+        from .http_clients import get_http_session
+        async with get_http_session().get(url, timeout=aiohttp.ClientTimeout(total=5)) as resp:
+            if resp.status != 200:
+                return JSONResponse({"userCount": 0})
+            data = await resp.json()
+            return JSONResponse(data)
     except Exception as e:
         import logging
         logging.getLogger(__name__).warning("practice-live user-count proxy failed: %s", e)
@@ -812,18 +1003,18 @@ async def api_immersive_chat(request: Request):
             try:
                 import uuid
                 import os
-                current_file_dir = os.path.dirname(os.path.abspath(__file__))
-                project_dir = os.path.dirname(current_file_dir)
-                immersive_dir = os.path.join(project_dir, "outputs", "immersive")
-                os.makedirs(immersive_dir, exist_ok=True)
-                filename = f"reply_{uuid.uuid4().hex[:12]}.wav"
-                path = os.path.join(immersive_dir, filename)
+                from .audio_storage import audio_path
+                from .audio_format import remember_request_audio_format, audio_extension
+                # 按客户端 audio_format / Accept 协商压缩格式，TTS 直接产出该格式
+                fmt = remember_request_audio_format(request, acc, data.get("audio_format"))
+                filename = f"reply_{uuid.uuid4().hex[:12]}.{audio_extension(fmt)}"
+                path, url = audio_path("immersive", filename)
                 text_for_tts = (reply or "")[:500]
                 if text_for_tts:
                     from .app import generate_speech
                     ok = await generate_speech(text_for_tts, path)
                     if ok and os.path.exists(path):
-                        audio_url = f"/audio/immersive/{filename}"
+                        audio_url = url
             except Exception as tts_err:
                 logger.warning(f"Immersive TTS failed: {tts_err}")
 
@@ -1186,6 +1377,10 @@ async def websocket_endpoint(websocket: WebSocket):
             if message["action"] == "set_account":
                 # 绑定该 WebSocket 与账号，后续按用户分状态
                 set_websocket_account(websocket, message.get("account_name") or "")
+                if message.get("audio_format"):
+                    # 客户端可播放的回复语音格式（mp3 / opus / wav）
+                    from .audio_format import set_account_audio_format
+                    set_account_audio_format(get_websocket_account(websocket), message["audio_format"])
                 await websocket.send_json({"action": "account_set", "account_name": get_websocket_account(websocket)})
             elif message["action"] == "stop":
                 acc = get_websocket_account(websocket)
@@ -1380,91 +1575,34 @@ async def upload_voice_audio(
     audio: UploadFile = File(...),
     character: str = Form("english_tutor"),
     account_name: str = Form(None),
+    asr_mode: str = Form(None),
+    audio_format: str = Form(None),
 ):
-    """处理上传的语音文件"""
+    """处理上传的语音文件。asr_mode 可选 file / stream（豆包识别方式，默认取 ASR_MODE）；
+    audio_format 可选 mp3 / opus / wav（回复语音格式，也可用 Accept 头声明）"""
     try:
-        from .transcription import transcribe_with_openai_api, transcribe_with_doubao_file_asr
+        from .transcription import transcribe_with_openai_api, transcribe_with_doubao
+        from .audio_transcode import transcode_to_pcm, pcm_to_wav_bytes
         from .app import API_PROVIDER
-        import tempfile
-        import os
-        
-        # 保存临时文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.webm') as tmp_file:
-            content = await audio.read()
-            tmp_file.write(content)
-            tmp_file_path = tmp_file.name
-        
-        # 前端上传为 webm；录音文件识别/OpenAI 需 wav 等格式，故统一转为 wav（16kHz 单声道）
-        audio_converted = False
-        try:
-            from pydub import AudioSegment
-            audio_seg = AudioSegment.from_file(tmp_file_path, format="webm")
-            audio_seg = audio_seg.set_frame_rate(16000).set_channels(1).set_sample_width(2)
-            wav_path = tmp_file_path.replace('.webm', '.wav')
-            audio_seg.export(wav_path, format="wav")
-            os.unlink(tmp_file_path)
-            tmp_file_path = wav_path
-            audio_converted = True
-            logger.info("Audio converted from webm to wav (16kHz mono) for ASR")
-        except ImportError as e:
-            logger.warning(f"pydub not available, trying to use original file: {e}")
-        except Exception as e:
-            logger.error(f"Error converting audio format: {e}")
-            import traceback
-            logger.error(traceback.format_exc())
-            if not tmp_file_path.endswith('.wav'):
-                logger.warning("Audio conversion failed, but will try to use original file format")
         
-        # 豆包：录音文件识别（需可访问的音频 URL）；OpenAI：本地文件
-        async def _do_transcribe(path):
-            if API_PROVIDER == "doubao":
-                base_url = (os.getenv("PUBLIC_APP_URL") or str(request.base_url)).strip().rstrip("/")
-                token = register_audio_temp(path)
-                try:
-                    audio_url = f"{base_url}/api/audio/temp/{token}"
-                    return await transcribe_with_doubao_file_asr(audio_url)
-                finally:
-                    unregister_audio_temp(token)
-            return await transcribe_with_openai_api(path)
-        transcription = None
-        try:
-            transcription = await _do_transcribe(tmp_file_path)
-            if not transcription or transcription.strip() == "":
-                raise ValueError("转写结果为空")
-            logger.info(f"Transcription successful: {transcription[:50]}...")
-        except Exception as e:
-            logger.error(f"Error during transcription: {e}")
-            import traceback
-            logger.error(traceback.format_exc())
-            if not audio_converted and not tmp_file_path.endswith('.wav'):
-                logger.info("Retrying with alternative conversion method...")
-                try:
-                    import subprocess
-                    wav_path = tmp_file_path.replace('.webm', '.wav').replace('.mp3', '.wav')
-                    subprocess.run(
-                        ['ffmpeg', '-i', tmp_file_path, '-ar', '16000', '-ac', '1', '-y', wav_path],
-                        check=True, capture_output=True
-                    )
-                    os.unlink(tmp_file_path)
-                    tmp_file_path = wav_path
-                    transcription = await _do_transcribe(tmp_file_path)
-                    if not transcription or transcription.strip() == "":
-                        raise ValueError("Transcription returned empty result")
-                    logger.info(f"Transcription successful after ffmpeg conversion: {transcription[:50]}...")
-                except Exception as e2:
-                    logger.error(f"Alternative conversion also failed: {e2}")
-                    raise e  # 抛出原始错误
-            else:
-                raise
-        
-        # 清理临时文件
-        try:
-            os.unlink(tmp_file_path)
-        except:
-            pass
+        # 前端上传为 webm/opus：在内存中经 ffmpeg 管道解码为 16kHz 单声道 PCM（音频进程池中执行，不落临时文件）
+        content = await audio.read()
+        pcm = await transcode_to_pcm(content)
+
+        # 豆包：录音文件识别（内存 WAV 注册临时 URL 供火山拉取）或流式识别（asr_mode=stream，PCM 直接发送）；OpenAI：内存 WAV
+        if API_PROVIDER == "doubao":
+            base_url = (os.getenv("PUBLIC_APP_URL") or str(request.base_url)).strip().rstrip("/")
+            transcription = await transcribe_with_doubao(pcm, base_url, asr_mode)
+        else:
+            transcription = await transcribe_with_openai_api(pcm_to_wav_bytes(pcm))
+        if not transcription or transcription.strip() == "":
+            raise ValueError("转写结果为空")
+        logger.info(f"Transcription successful: {transcription[:50]}...")
         
         acc = _request_account(request, account_name)
         set_current_character(character, acc)
+        from .audio_format import remember_request_audio_format
+        remember_request_audio_format(request, acc, audio_format)
 
         conversation_history = get_conversation_history(acc)
         if len(conversation_history) == 0:
@@ -1480,11 +1618,14 @@ async def upload_voice_audio(
         await send_message_to_clients(json.dumps({
             "action": "user_message",
             "text": transcription
-        }))
+        }), account_name=acc)
 
         conversation_history.append({"role": "user", "content": transcription})
 
         from .app_logic import process_text
+        from .metrics import defer_turn
+        # 回复在后台生成：语音推送完成时才记录本轮耗时
+        defer_turn()
         asyncio.create_task(process_text(transcription, account_name=acc))
         
         return JSONResponse({
@@ -1492,6 +1633,9 @@ async def upload_voice_audio(
             "transcription": transcription
         })
         
+    except AudioPoolBusy as e:
+        logger.warning(f"Voice upload rejected: {e}")
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=503)
     except Exception as e:
         logger.error(f"Error processing voice upload: {e}")
         import traceback
@@ -1509,6 +1653,8 @@ async def send_text_message(request: Request):
         text = data.get("text", "").strip()
         character = data.get("character", "english_tutor")
         acc = _request_account(request, data.get("account_name"))
+        from .audio_format import remember_request_audio_format
+        remember_request_audio_format(request, acc, data.get("audio_format"))
 
         if not text:
             return JSONResponse({
@@ -1536,11 +1682,13 @@ async def send_text_message(request: Request):
         await send_message_to_clients(json.dumps({
             "action": "user_message",
             "text": text
-        }))
+        }), account_name=acc)
 
         conversation_history.append({"role": "user", "content": text})
 
         from .app_logic import process_text
+        from .metrics import defer_turn
+        defer_turn()
         asyncio.create_task(process_text(text, account_name=acc))
         
         return JSONResponse({
@@ -1749,7 +1897,16 @@ async def update_english_level(request: Request):
         }, status_code=500)
 
 # 练习模式会话存储（临时存储，练习完成后保存到文件）
-practice_sessions = {}  # {session_id: {user_inputs: [], dialogue_lines: [], dialogue_topic: ""}}
+# 空闲超过 PRACTICE_SESSION_TTL 秒或超出 PRACTICE_SESSION_MAX_ENTRIES 时回收（配置 SESSION_SPILL_DIR 时落盘）
+from .session_state import create_session_store
+PRACTICE_SESSION_TTL = float(os.getenv("PRACTICE_SESSION_TTL", "3600"))
+PRACTICE_SESSION_MAX_ENTRIES = int(os.getenv("PRACTICE_SESSION_MAX_ENTRIES", "1000"))
+practice_sessions = create_session_store(
+    "practice_session",
+    ttl=PRACTICE_SESSION_TTL,
+    max_entries=max(1, PRACTICE_SESSION_MAX_ENTRIES),
+    spill=True,
+)  # {session_id: {user_inputs: [], dialogue_lines: [], dialogue_topic: ""}}
 
 # 练习模式相关API
 @app.post("/api/practice/start")
@@ -1969,6 +2126,7 @@ async def practice_respond(request: Request):
                 "user_said": user_input,    # 用户说的话
                 "timestamp": datetime.now().isoformat()
             })
+            practice_sessions.save(session_id)
         
         # 验证意思一致性
         validation_result = await check_meaning_consistency(user_input, reference_text)
@@ -2338,7 +2496,7 @@ async def get_recommended_knowledge(request: Request):
                 selected_label_id = None
         
         kb = KnowledgeDatabase()
-        recommended = kb.get_recommended_knowledge(
+        recommended = await kb.aget_recommended_knowledge(
             user_id=account_name,
             user_level=user_level,
             selected_label_id=selected_label_id,
@@ -2467,76 +2625,35 @@ async def mark_unit_mastered_api(request: Request):
 @app.post("/api/practice/transcribe")
 async def practice_transcribe_audio(
     request: Request,
-    audio: UploadFile = File(...)
+    audio: UploadFile = File(...),
+    asr_mode: str = Form(None),
 ):
-    """练习/自由对话模式下只转录音频，不生成AI回复。与全局 API_PROVIDER 一致：豆包用录音文件识别，OpenAI 用 OpenAI。"""
+    """练习/自由对话模式下只转录音频，不生成AI回复。与全局 API_PROVIDER 一致：豆包用录音文件识别（asr_mode=stream 时用流式识别），OpenAI 用 OpenAI。"""
     try:
-        from .transcription import transcribe_with_openai_api, transcribe_with_doubao_file_asr
+        from .transcription import transcribe_with_openai_api, transcribe_with_doubao
+        from .audio_transcode import transcode_to_pcm, pcm_to_wav_bytes, write_wav
         from .app import API_PROVIDER
-        import tempfile
-        import os
-        
-        # 保存临时文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.webm') as tmp_file:
-            content = await audio.read()
-            tmp_file.write(content)
-            tmp_file_path = tmp_file.name
         
-        # 前端上传为 webm；录音文件识别需 wav，故转为 wav（16kHz 单声道）
-        audio_converted = False
-        try:
-            from pydub import AudioSegment
-            audio_seg = AudioSegment.from_file(tmp_file_path, format="webm")
-            audio_seg = audio_seg.set_frame_rate(16000).set_channels(1).set_sample_width(2)
-            wav_path = tmp_file_path.replace('.webm', '.wav')
-            audio_seg.export(wav_path, format="wav")
-            tmp_file_path = wav_path
-            audio_converted = True
-        except Exception as e:
-            logger.warning(f"Could not convert audio format: {e}")
-        # 豆包录音识别必须提供 wav URL；若 pydub 未转成 wav 则用 ffmpeg 兜底
-        if API_PROVIDER == "doubao" and not tmp_file_path.endswith(".wav"):
-            try:
-                import subprocess
-                wav_path = tmp_file_path.replace(".webm", ".wav").replace(".mp3", ".wav")
-                subprocess.run(
-                    ["ffmpeg", "-i", tmp_file_path, "-ar", "16000", "-ac", "1", "-y", wav_path],
-                    check=True, capture_output=True
-                )
-                if tmp_file_path != wav_path:
-                    os.unlink(tmp_file_path)
-                tmp_file_path = wav_path
-                audio_converted = True
-            except Exception as e2:
-                logger.warning(f"ffmpeg fallback conversion failed: {e2}")
-
-        # 豆包：录音文件识别（URL）；OpenAI：本地文件
+        # 前端上传为 webm；在内存中解码为 16kHz 单声道 PCM，同一份数据用于识别与归档
         transcription = None
         try:
+            content = await audio.read()
+            pcm = await transcode_to_pcm(content)
             if API_PROVIDER == "doubao":
                 base_url = (os.getenv("PUBLIC_APP_URL") or str(request.base_url)).strip().rstrip("/")
-                token = register_audio_temp(tmp_file_path)
-                try:
-                    audio_url = f"{base_url}/api/audio/temp/{token}"
-                    transcription = await transcribe_with_doubao_file_asr(audio_url)
-                finally:
-                    unregister_audio_temp(token)
+                transcription = await transcribe_with_doubao(pcm, base_url, asr_mode)
             else:
-                transcription = await transcribe_with_openai_api(tmp_file_path, "gpt-4o-mini-transcribe")
+                transcription = await transcribe_with_openai_api(pcm_to_wav_bytes(pcm), "gpt-4o-mini-transcribe")
             if not transcription or transcription.strip() == "":
                 raise ValueError("Transcription returned empty result")
             logger.info(f"Practice transcription successful: {transcription[:50]}...")
+        except AudioPoolBusy as e:
+            logger.warning(f"Practice transcription rejected: {e}")
+            return JSONResponse({"status": "error", "message": str(e)}, status_code=503)
         except Exception as e:
             logger.error(f"Error during practice transcription: {e}")
             import traceback
             logger.error(traceback.format_exc())
-            # 清理临时文件
-            try:
-                os.unlink(tmp_file_path)
-                if audio_converted and os.path.exists(tmp_file_path.replace('.wav', '.webm')):
-                    os.unlink(tmp_file_path.replace('.wav', '.webm'))
-            except:
-                pass
             return JSONResponse({
                 "status": "error",
                 "message": f"转录音频失败: {str(e)}"
@@ -2546,33 +2663,22 @@ async def practice_transcribe_audio(
         audio_url = None
         try:
             import uuid
-            current_file_dir = os.path.dirname(os.path.abspath(__file__))
-            project_dir = os.path.dirname(current_file_dir)
-            practice_audio_dir = os.path.join(project_dir, "outputs", "practice")
-            os.makedirs(practice_audio_dir, exist_ok=True)
+            from .audio_storage import audio_path
             
-            # 生成唯一的音频文件名
+            # 生成唯一的音频文件名（放到 outputs/practice/ 的分片目录）
             audio_filename = f"user_{uuid.uuid4().hex[:8]}_{int(datetime.now().timestamp() * 1000)}.wav"
-            saved_audio_path = os.path.join(practice_audio_dir, audio_filename)
+            saved_audio_path, saved_audio_url = audio_path("practice", audio_filename)
             
-            # 复制音频文件到保存目录
-            shutil.copy2(tmp_file_path, saved_audio_path)
+            # 转码得到的 PCM 直接写成 WAV
+            await asyncio.to_thread(write_wav, saved_audio_path, pcm)
             
             # 生成音频URL
-            audio_url = f"/audio/practice/{audio_filename}"
+            audio_url = saved_audio_url
             logger.info(f"User audio saved: {audio_url}")
         except Exception as e:
             logger.error(f"Error saving user audio: {e}")
             # 即使保存失败，也继续返回转录结果
         
-        # 清理临时文件
-        try:
-            os.unlink(tmp_file_path)
-            if audio_converted and os.path.exists(tmp_file_path.replace('.wav', '.webm')):
-                os.unlink(tmp_file_path.replace('.wav', '.webm'))
-        except:
-            pass
-        
         return JSONResponse({
             "status": "success",
             "transcription": transcription,
@@ -2877,6 +2983,19 @@ def signal_handler(sig, frame):
         except Exception as e:
             print(f"Error in graceful shutdown: {e}")
         
+        # os._exit 不触发 atexit，先写出记忆写回缓存中的脏数据与未同步的共享状态
+        try:
+            from .adapters.file_state_store import flush_all_stores
+            flush_all_stores()
+            from .adapters.supabase_store import flush_supabase_store
+            flush_supabase_store()
+            from .tts_cache import flush_tts_cache_index
+            flush_tts_cache_index()
+            from .state_backend import stop_state_backend
+            stop_state_backend()
+        except Exception as e:
+            print(f"Error flushing memory stores: {e}")
+
         print("Shutdown procedures completed. Exiting...")
         import os
         os._exit(0)  # Force exit as sys.exit() might not work if asyncio is running
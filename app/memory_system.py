@@ -14,11 +14,11 @@ logger = logging.getLogger(__name__)
 async def _generate_tts_one_line(
     line: Dict,
     i: int,
-    dialogue_id: str,
     audio_dir: str,
+    url_prefix: str,
     tts_encoding: str,
 ) -> None:
-    """为单行对话生成 TTS，并写入 line['audio_url']。"""
+    """为单行对话生成 TTS，并写入 line['audio_url']。固定台词由 doubao/openai TTS 内的内容寻址缓存命中，不重复请求厂商。"""
     from .app import API_PROVIDER, doubao_text_to_speech, openai_text_to_speech, OPENAI_TTS_VOICE, OPENAI_TTS_VOICE_B
     try:
         speaker = line.get("speaker", "A")
@@ -53,7 +53,7 @@ async def _generate_tts_one_line(
             line["audio_url"] = None
             return
         if success and os.path.exists(audio_path) and os.path.getsize(audio_path) > 0:
-            line["audio_url"] = f"/audio/english_dialogue/{dialogue_id}/{audio_filename}"
+            line["audio_url"] = f"{url_prefix}/{audio_filename}"
         else:
             line["audio_url"] = None
     except Exception as e:
@@ -62,19 +62,30 @@ async def _generate_tts_one_line(
 
 
 async def generate_tts_for_dialogue_lines(dialogue_lines: List[Dict], dialogue_id: str) -> None:
-    """为 dialogue_lines 每行生成 TTS 音频，填充 audio_url。并行请求以缩短复习资料生成时间。"""
-    current_file_dir = os.path.dirname(os.path.abspath(__file__))
-    project_dir = os.path.dirname(current_file_dir)
-    audio_dir = os.path.join(project_dir, "outputs", "english_dialogue", dialogue_id)
+    """为 dialogue_lines 每行生成 TTS 音频，填充 audio_url。
+    先查预渲染清单（scripts/prerender_dialogue_tts.py 生成），命中的行直接用清单 URL；其余行并行请求 TTS。"""
+    from .app import API_PROVIDER
+    from .tts_prerender import lookup_prerendered
+    tts_encoding = os.getenv("TTS_ENCODING", "mp3")
+    pending = []
+    for i, line in enumerate(dialogue_lines):
+        url = lookup_prerendered(line.get("text", ""), line.get("speaker", "A"), API_PROVIDER, tts_encoding)
+        if url:
+            line["audio_url"] = url
+        else:
+            pending.append((i, line))
+    if not pending:
+        return
+    from .audio_storage import shard_dir
     try:
-        os.makedirs(audio_dir, exist_ok=True)
+        # outputs/english_dialogue/<分片>/<dialogue_id>/，由 audio_storage 按保留时长与容量回收
+        audio_dir, url_prefix = shard_dir("english_dialogue", dialogue_id)
     except Exception as e:
         logger.warning("创建音频目录失败: %s", e)
         return
-    tts_encoding = os.getenv("TTS_ENCODING", "mp3")
     tasks = [
-        _generate_tts_one_line(line, i, dialogue_id, audio_dir, tts_encoding)
-        for i, line in enumerate(dialogue_lines)
+        _generate_tts_one_line(line, i, audio_dir, url_prefix, tts_encoding)
+        for i, line in pending
     ]
     await asyncio.gather(*tasks)
 
@@ -278,19 +289,9 @@ class DiaryMemorySystem:
         return context
     
     def save_to_session_temp(self, message: Dict, character: str = ""):
-        """保存消息到临时会话（adapter）"""
-        session_data = self._adapter.load_session_temp()
-        if session_data is None:
-            session_data = {
-                "session_start": datetime.now().isoformat(),
-                "character": character,
-                "messages": []
-            }
-        if character:
-            session_data["character"] = character
-        session_data["messages"].append(message)
-        self._adapter.save_session_temp(session_data)
-        print(f"Saved message to session temp: {self.session_temp_file} (total messages: {len(session_data['messages'])})")
+        """保存消息到临时会话（adapter 增量追加，文件后端由写回缓存合并写盘，不再每条消息整份重写）"""
+        total = self._adapter.append_session_message(message, character)
+        print(f"Saved message to session temp: {self.session_temp_file} (total messages: {total})")
     
     def load_session_temp(self) -> Optional[Dict]:
         """加载临时会话（adapter）"""
@@ -327,6 +328,11 @@ class DiaryMemorySystem:
             profile["english_level_description"] = ""
         return profile
     
+    def refresh_user_profile(self):
+        """从 adapter 重新加载用户档案（池化实例每次取用时调用；adapter 自带缓存与版本校验，开销小），
+        避免长期持有的旧档案在保存时覆盖其他 worker / 进程的更新"""
+        self.user_profile = self.load_user_profile()
+
     def save_user_profile(self):
         """保存用户档案（adapter）"""
         self.user_profile["last_updated"] = datetime.now().isoformat()
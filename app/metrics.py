@@ -0,0 +1,315 @@
+# 进程内指标：ASR 耗时、LLM 首字与总耗时、TTS 合成耗时、音频转换耗时、各接口整轮耗时的直方图，以及供应商错误计数。
+# /metrics 以 Prometheus 文本格式导出（p50/p95/p99 用 histogram_quantile 计算），
+# /api/metrics/summary 直接给出最近样本的分位数，便于无 Prometheus 时查看。不依赖 prometheus_client。
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 直方图分桶（秒）：覆盖首字几百毫秒到整轮十几秒
+METRICS_BUCKETS = tuple(
+    float(b) for b in os.getenv("METRICS_BUCKETS", "0.05,0.1,0.25,0.5,0.75,1,1.5,2,3,5,8,13,21,34").split(",") if b.strip()
+)
+# 每个标签组合保留的最近样本数（用于 summary 分位数）
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "1024"))
+
+_lock = threading.Lock()
+_registry: List["_Metric"] = []
+_collectors: List[Callable[[], List[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]] = []
+
+
+def _label_str(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for k, v in labels.items():
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        with _lock:
+            _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _render(self) -> List[str]:
+        lines = []
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_label_str(dict(zip(self.labelnames, key)))} {_fmt(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=None):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets or METRICS_BUCKETS)) + (float("inf"),)
+        # key -> [各桶计数, sum, count, 最近样本]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with _lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [[0] * len(self.buckets), 0.0, 0, deque(maxlen=METRICS_WINDOW)]
+                self._series[key] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+            series[3].append(value)
+
+    @contextmanager
+    def time(self, **labels):
+        """with HIST.time(provider="doubao"): ... 记录代码块耗时（异常时同样记录）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count, _) in sorted(self._series.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                lines.append(f"{self.name}_bucket{_label_str({**labels, 'le': _fmt(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_str(labels)} {_fmt(round(total, 6))}")
+            lines.append(f"{self.name}_count{_label_str(labels)} {count}")
+        return lines
+
+    def summary(self) -> List[dict]:
+        """各标签组合的次数、平均值与最近样本的 p50/p95/p99（秒）"""
+        with _lock:
+            items = [(key, count, total, sorted(samples)) for key, (_, total, count, samples) in self._series.items()]
+        result = []
+        for key, count, total, samples in sorted(items):
+            entry = {**dict(zip(self.labelnames, key)), "count": count, "avg": round(total / count, 4) if count else None}
+            for q in (50, 95, 99):
+                entry[f"p{q}"] = round(samples[min(len(samples) - 1, len(samples) * q // 100)], 4) if samples else None
+            result.append(entry)
+        return result
+
+
+def register_collector(fn) -> None:
+    """注册导出时调用的采集函数，返回 [(name, type, help, [(labels, value), ...]), ...]；用于把各模块已有的统计导出为 gauge"""
+    with _lock:
+        _collectors.append(fn)
+
+
+def render_prometheus() -> str:
+    """按 Prometheus 文本格式（0.0.4）导出全部指标"""
+    lines = []
+    with _lock:
+        metrics = list(_registry)
+        collectors = list(_collectors)
+        rendered = [(m, m._render()) for m in metrics]
+    for metric, body in rendered:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(body)
+    for collect in collectors:
+        try:
+            families = collect()
+        except Exception as e:
+            print(f"metrics collector {getattr(collect, '__name__', collect)} 失败: {e}")
+            continue
+        for name, mtype, help_text, samples in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {mtype}")
+            for labels, value in samples:
+                lines.append(f"{name}{_label_str(labels)} {_fmt(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics_summary() -> dict:
+    """全部直方图的分位数汇总与计数器当前值（JSON）"""
+    with _lock:
+        metrics = list(_registry)
+    out = {}
+    for m in metrics:
+        if isinstance(m, Histogram):
+            out[m.name] = m.summary()
+        elif isinstance(m, Counter):
+            with _lock:
+                out[m.name] = [{**dict(zip(m.labelnames, k)), "value": v} for k, v in sorted(m._values.items())]
+    return out
+
+
+# ---------- 指标定义 ----------
+
+ASR_SECONDS = Histogram("voicechat_asr_seconds", "ASR 识别耗时（秒）", ("provider", "mode"))
+LLM_TTFT_SECONDS = Histogram("voicechat_llm_first_token_seconds", "LLM 请求到首个回复增量的耗时（秒）", ("provider",))
+LLM_SECONDS = Histogram("voicechat_llm_seconds", "LLM 请求总耗时（秒）", ("provider",))
+TTS_SECONDS = Histogram("voicechat_tts_seconds", "TTS 合成耗时（秒，不含缓存命中）", ("provider",))
+AUDIO_CONVERSION_SECONDS = Histogram("voicechat_audio_conversion_seconds", "音频转换任务耗时（秒，含排队）", ("job",))
+TURN_SECONDS = Histogram("voicechat_turn_seconds", "一轮对话端到端耗时（秒），按接口区分", ("endpoint",))
+PROVIDER_ERRORS = Counter("voicechat_provider_errors_total", "供应商调用失败次数", ("provider", "stage"))
+
+
+# ---------- 整轮耗时 ----------
+# 接口处理返回即一轮结束；/api/voice/upload、/api/text/send 的回复在后台 process_text 中生成，
+# 由 defer_turn() 标记后在回复发出时 finish_turn() 记录。上下文经 asyncio.create_task 复制到后台任务。
+
+class _Turn:
+    __slots__ = ("endpoint", "start", "deferred", "done")
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.start = time.perf_counter()
+        self.deferred = False
+        self.done = False
+
+
+_current_turn: contextvars.ContextVar[Optional[_Turn]] = contextvars.ContextVar("voicechat_turn", default=None)
+
+
+def start_turn(endpoint: str):
+    """接口开始处理时调用，返回 token 供 end_turn 使用"""
+    return _current_turn.set(_Turn(endpoint))
+
+
+def defer_turn() -> None:
+    """本轮回复在后台任务中完成：接口返回时不记录，由后台任务调用 finish_turn"""
+    turn = _current_turn.get()
+    if turn is not None:
+        turn.deferred = True
+
+
+def finish_turn() -> None:
+    """记录当前轮耗时（只记录一次）"""
+    turn = _current_turn.get()
+    if turn is None or turn.done:
+        return
+    turn.done = True
+    TURN_SECONDS.observe(time.perf_counter() - turn.start, endpoint=turn.endpoint)
+
+
+def end_turn(token) -> None:
+    """接口返回时调用：未 defer 的轮次在此记录"""
+    turn = _current_turn.get()
+    if turn is not None and not turn.deferred:
+        finish_turn()
+    _current_turn.reset(token)
+
+
+# ---------- 导出各模块已有统计 ----------
+
+def _collect_runtime_stats():
+    families = []
+    from .tts_cache import tts_cache_stats
+    cache = tts_cache_stats()
+    families.append(("voicechat_tts_cache_entries", "gauge", "TTS 缓存条目数", [({}, cache["entries"])]))
+    families.append(("voicechat_tts_cache_bytes", "gauge", "TTS 缓存占用字节", [({}, cache["bytes"])]))
+    families.append(("voicechat_tts_cache_events_total", "counter", "TTS 缓存命中 / 未命中 / 写入 / 淘汰次数",
+                     [({"event": k}, v) for k, v in cache.items() if k not in ("entries", "bytes", "max_bytes")]))
+
+    from .audio_storage import storage_usage_report
+    storage = storage_usage_report()["categories"]
+    families.append(("voicechat_audio_storage_bytes", "gauge", "outputs/ 各类生成音频占用字节（最近一次回收时统计）",
+                     [({"category": c}, u["bytes"]) for c, u in storage.items()]))
+    families.append(("voicechat_audio_storage_files", "gauge", "outputs/ 各类生成音频文件数",
+                     [({"category": c}, u["files"]) for c, u in storage.items()]))
+    families.append(("voicechat_audio_storage_removed_total", "counter", "按保留时长 / 容量上限回收的音频文件数",
+                     [({"category": c, "reason": r}, u[r]) for c, u in storage.items() for r in ("expired", "over_quota")]))
+
+    from .audio_workers import audio_pool_stats
+    pool = audio_pool_stats()
+    families.append(("voicechat_audio_pool_jobs", "gauge", "音频进程池执行中 / 排队任务数",
+                     [({"state": "running"}, pool["running"]), ({"state": "queued"}, pool["queued"])]))
+    families.append(("voicechat_audio_pool_jobs_total", "counter", "音频进程池任务累计数",
+                     [({"result": k}, pool[k]) for k in ("submitted", "completed", "failed", "rejected")]))
+
+    from .shared import memory_pool_stats
+    memory = memory_pool_stats()
+    families.append(("voicechat_memory_pool_size", "gauge", "缓存的记忆系统实例数", [({}, memory["size"])]))
+    families.append(("voicechat_memory_pool_events_total", "counter", "记忆系统池命中 / 未命中 / 淘汰 / 超时 / 初始化失败次数",
+                     [({"event": k}, memory[k]) for k in ("hits", "misses", "evictions", "expirations", "errors")]))
+
+    from .adapters.supabase_store import supabase_store_stats
+    sb = supabase_store_stats()
+    families.append(("voicechat_supabase_pending_rows", "gauge", "Supabase 写回队列中的待写行数", [({}, sb["pending_rows"])]))
+    families.append(("voicechat_supabase_cache_events_total", "counter", "Supabase 行缓存命中 / 未命中 / 版本校验 / 重新加载 / 用户存在性查询次数",
+                     [({"event": k}, sb[k]) for k in ("hits", "misses", "revalidated", "reloads", "user_checks")]))
+    families.append(("voicechat_supabase_flush_total", "counter", "Supabase 批量写入的行数 / 请求数 / 失败次数 / 多次失败后丢弃的行数",
+                     [({"result": k}, sb[k]) for k in ("flushed_rows", "flush_batches", "flush_errors", "dropped_rows")]))
+
+    if os.environ.get("CHUNK_BACKEND", "").strip().lower() == "mysql":
+        from .chunk_db import chunk_db_pool_stats
+        db = chunk_db_pool_stats()
+        families.append(("voicechat_chunk_db_connections", "gauge", "语块数据库连接池已打开 / 空闲连接数",
+                         [({"state": "open"}, db["open"]), ({"state": "idle"}, db["idle"])]))
+        families.append(("voicechat_chunk_db_pool_events_total", "counter", "语块数据库连接借出 / 新建 / 复用 / ping / 丢弃 / 等待超时次数",
+                         [({"event": k}, db[k]) for k in ("acquired", "created", "reused", "pings", "discarded", "timeouts")]))
+
+    from .ws_router import ws_router_stats
+    ws = ws_router_stats()
+    families.append(("voicechat_ws_clients", "gauge", "WebSocket 连接数", [({}, ws["clients"])]))
+    families.append(("voicechat_ws_queue_depth", "gauge", "各账号待发 WebSocket 消息数",
+                     [({"account": acc}, depth) for acc, depth in sorted(ws["per_account"].items())]))
+    families.append(("voicechat_ws_max_queue_depth", "gauge", "单连接最大待发消息数", [({}, ws["max_queue_depth"])]))
+    families.append(("voicechat_ws_messages_total", "counter", "WebSocket 消息累计数",
+                     [({"result": k}, ws[k]) for k in ("routed", "sent", "dropped", "disconnected", "undelivered")]))
+
+    from .session_state import session_state_stats
+    sessions = session_state_stats()
+    stores = sorted(sessions["stores"].items())
+    families.append(("voicechat_session_entries", "gauge", "各会话状态存储的条目数", [({"store": n}, st["entries"]) for n, st in stores]))
+    families.append(("voicechat_session_bytes", "gauge", "各会话状态存储的估算内存（字节，清扫时更新）", [({"store": n}, st["bytes"]) for n, st in stores]))
+    families.append(("voicechat_session_spilled_files", "gauge", "各会话状态存储落盘的冷数据文件数", [({"store": n}, st["spilled_files"]) for n, st in stores]))
+    families.append(("voicechat_session_events_total", "counter", "会话状态淘汰 / 过期 / 落盘 / 恢复 / 落盘失败次数",
+                     [({"store": n, "event": k}, st[k]) for n, st in stores
+                      for k in ("evictions", "expirations", "spilled", "restored", "spill_errors")]))
+    from .state_backend import is_shared_backend, state_backend_stats
+    if is_shared_backend():
+        backend = state_backend_stats()
+        families.append(("voicechat_state_pubsub_messages_total", "counter", "跨 worker 发布 / 接收 / 发布失败的 WebSocket 消息数",
+                         [({"result": k}, backend[k]) for k in ("published", "received", "publish_errors")]))
+        families.append(("voicechat_state_pubsub_pending", "gauge", "待发布到共享库的消息数", [({}, backend["pending_publish"])]))
+        families.append(("voicechat_state_sync_writes_total", "counter", "写入共享状态库的条目次数", [({}, backend["synced"])]))
+        families.append(("voicechat_state_sync_events_total", "counter", "共享状态按版本重新读取 / 写回冲突（放弃本地修改）次数",
+                         [({"store": n, "event": k}, st.get(k, 0)) for n, st in stores for k in ("reloaded", "conflicts")
+                          if k in st]))
+    if sessions["rss_bytes"] is not None:
+        families.append(("voicechat_process_resident_memory_bytes", "gauge", "进程常驻内存（字节）", [({}, sessions["rss_bytes"])]))
+    return families
+
+
+register_collector(_collect_runtime_stats)
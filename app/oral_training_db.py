@@ -1,10 +1,12 @@
 """
 口语训练数据库：仅使用 data/oral_training_db.json。
 提供场景列表、选卡（按 scene + difficulty + 用户 unit_practice）、Review 行、摘要推荐等。
+数据文件只在变化（mtime / 大小）时重新解析，查询走 OralTrainingIndex 中的字典索引。
 """
 import json
 import os
 import random
+import threading
 from pathlib import Path
 from typing import Dict, List, Optional, Any
 
@@ -33,12 +35,78 @@ def _data_dir(base_dir: str = None) -> Path:
     return Path(base_dir) / "data"
 
 
-def _load_db(base_dir: str = None) -> List[Dict]:
+class OralTrainingIndex:
+    """
+    oral_training_db.json 的一次解析结果与索引（只读，调用方不要修改返回的记录）：
+    dialogue_id -> 记录、(scene, difficulty) -> 非 Review 记录、(scene, unit, batch) -> 记录、
+    (scene, unit) -> Review 行，以及选卡用的 (scene, difficulty) -> unit -> batch -> 记录。
+    """
+
+    def __init__(self, records: List[Dict], sig=None):
+        self.records = records
+        self.sig = sig
+        self.by_dialogue_id: Dict[str, Dict] = {}
+        self.by_scene_difficulty: Dict[tuple, List[Dict]] = {}
+        self.by_scene_difficulty_all: Dict[tuple, List[Dict]] = {}
+        self.by_scene_unit_batch: Dict[tuple, Dict] = {}
+        self.review_rows: Dict[tuple, Dict] = {}
+        # (scene, difficulty) -> {unit: {batch: 首条记录}}，unit 保持文件中首次出现的顺序
+        self.units: Dict[tuple, Dict[str, Dict[str, Dict]]] = {}
+        scenes: Dict[str, None] = {}
+        difficulties = set()
+        for r in records:
+            scene, difficulty = r.get("scene"), r.get("difficulty")
+            unit, batch = r.get("unit"), r.get("batch")
+            if r.get("dialogue_id") is not None:
+                self.by_dialogue_id.setdefault(r["dialogue_id"], r)
+            if scene:
+                scenes.setdefault(scene, None)
+            if difficulty:
+                difficulties.add(difficulty)
+            self.by_scene_difficulty_all.setdefault((scene, difficulty), []).append(r)
+            self.by_scene_unit_batch.setdefault((scene, unit, batch), r)
+            if batch == "Review":
+                self.review_rows.setdefault((scene, unit), r)
+                continue
+            self.by_scene_difficulty.setdefault((scene, difficulty), []).append(r)
+            self.units.setdefault((scene, difficulty), {}).setdefault(r.get("unit", ""), {}).setdefault(batch, r)
+        self.scenes: List[str] = list(scenes)
+        self.difficulties: List[str] = sorted(difficulties)
+
+
+_indexes: Dict[Path, OralTrainingIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def _file_sig(path: Path):
+    try:
+        st = path.stat()
+        return st.st_mtime_ns, st.st_size
+    except OSError:
+        return None
+
+
+def get_oral_index(base_dir: str = None) -> OralTrainingIndex:
+    """返回共享索引；文件 mtime / 大小变化时重新加载（文件不存在时为空索引）"""
     path = _data_dir(base_dir) / "oral_training_db.json"
-    if not path.exists():
-        return []
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    sig = _file_sig(path)
+    index = _indexes.get(path)
+    if index is not None and index.sig == sig:
+        return index
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None or index.sig != sig:
+            records = []
+            if sig is not None:
+                with open(path, "r", encoding="utf-8") as f:
+                    records = json.load(f)
+            index = OralTrainingIndex(records, sig)
+            _indexes[path] = index
+        return index
+
+
+def _load_db(base_dir: str = None) -> List[Dict]:
+    return get_oral_index(base_dir).records
 
 
 def get_all_records(base_dir: str = None) -> List[Dict]:
@@ -46,55 +114,32 @@ def get_all_records(base_dir: str = None) -> List[Dict]:
 
 
 def get_unique_scenes(base_dir: str = None) -> List[str]:
-    records = _load_db(base_dir)
-    seen = set()
-    out = []
-    for r in records:
-        s = r.get("scene", "")
-        if s and s not in seen:
-            seen.add(s)
-            out.append(s)
-    return out
+    return list(get_oral_index(base_dir).scenes)
 
 
 def get_unique_difficulties(base_dir: str = None) -> List[str]:
-    records = _load_db(base_dir)
-    seen = set()
-    for r in records:
-        d = r.get("difficulty", "")
-        if d:
-            seen.add(d)
-    return sorted(seen)  # e.g. Difficult, Intermediate, Simple
+    return list(get_oral_index(base_dir).difficulties)  # e.g. Difficult, Intermediate, Simple
 
 
 def get_records_by_scene_difficulty(
     scene: str, difficulty: str, include_review: bool = False, base_dir: str = None
 ) -> List[Dict]:
-    records = _load_db(base_dir)
-    out = []
-    for r in records:
-        if r.get("scene") != scene or r.get("difficulty") != difficulty:
-            continue
-        if not include_review and r.get("batch") == "Review":
-            continue
-        out.append(r)
-    return out
+    index = get_oral_index(base_dir)
+    by_key = index.by_scene_difficulty_all if include_review else index.by_scene_difficulty
+    return list(by_key.get((scene, difficulty), []))
 
 
 def get_review_record(scene: str, unit: str, base_dir: str = None) -> Optional[Dict]:
-    records = _load_db(base_dir)
-    for r in records:
-        if r.get("scene") == scene and r.get("unit") == unit and r.get("batch") == "Review":
-            return r
-    return None
+    return get_oral_index(base_dir).review_rows.get((scene, unit))
 
 
 def get_record_by_dialogue_id(dialogue_id: str, base_dir: str = None) -> Optional[Dict]:
-    records = _load_db(base_dir)
-    for r in records:
-        if r.get("dialogue_id") == dialogue_id:
-            return r
-    return None
+    return get_oral_index(base_dir).by_dialogue_id.get(dialogue_id)
+
+
+def get_record_by_scene_unit_batch(scene: str, unit: str, batch: str, base_dir: str = None) -> Optional[Dict]:
+    """按 (scene, unit, batch) 取记录（含 Review 批次）"""
+    return get_oral_index(base_dir).by_scene_unit_batch.get((scene, unit, batch))
 
 
 def parse_dialogue_id(dialogue_id: str) -> Optional[Dict]:
@@ -320,37 +365,28 @@ def get_dialogue_record_for_user(
     根据用户 unit_practice 为该用户选一条要练的记录。
     规则：先推荐「之前没掌握的 unit 的后续批次」（B 再 C），再推荐其他 unit 的 A；同优先级选该 unit 已完成批次数少的。
     """
-    records = get_records_by_scene_difficulty(scene, difficulty, include_review=False, base_dir=base_dir)
-    if not records:
+    units = get_oral_index(base_dir).units.get((scene, difficulty))
+    if not units:
         return None
     unit_practice = load_unit_practice(account_name, base_dir)
 
-    # 按 unit 分组
-    by_unit: Dict[str, List[Dict]] = {}
-    for r in records:
-        u = r.get("unit", "")
-        if u not in by_unit:
-            by_unit[u] = []
-        by_unit[u].append(r)
-
     candidates = []  # (priority, total_done_count, record)
-    for unit, unit_records in by_unit.items():
+    for unit, batches in units.items():
         next_batch = get_next_batch_for_unit(unit_practice, scene, unit)
         if next_batch is None:
             continue
-        for r in unit_records:
-            if r.get("batch") != next_batch:
-                continue
-            # 统计该 unit 已完成批次数
-            unit_data = unit_practice.get(scene, {}).get(unit, {})
-            total_done = sum(
-                1 for b in ("A", "B", "C")
-                if isinstance(unit_data.get(b), dict) and unit_data[b].get("completed")
-            )
-            # 优先推荐「没掌握的 unit 的后续批次」：B 优先，再 C，最后才是新 unit 的 A
-            priority = 0 if next_batch == "B" else 1 if next_batch == "C" else 2
-            candidates.append((priority, total_done, r))
-            break
+        r = batches.get(next_batch)
+        if r is None:
+            continue
+        # 统计该 unit 已完成批次数
+        unit_data = unit_practice.get(scene, {}).get(unit, {})
+        total_done = sum(
+            1 for b in ("A", "B", "C")
+            if isinstance(unit_data.get(b), dict) and unit_data[b].get("completed")
+        )
+        # 优先推荐「没掌握的 unit 的后续批次」：B 优先，再 C，最后才是新 unit 的 A
+        priority = 0 if next_batch == "B" else 1 if next_batch == "C" else 2
+        candidates.append((priority, total_done, r))
 
     if not candidates:
         return None
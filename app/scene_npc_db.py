@@ -1,9 +1,11 @@
 """
 场景-NPC 数据库：仅从 dialogues.json 加载，管理解锁状态
 """
+import hashlib
 import json
 import os
 import logging
+import threading
 from pathlib import Path
 from typing import Dict, List, Optional, Any
 
@@ -11,8 +13,13 @@ logger = logging.getLogger(__name__)
 
 # 模块加载时解析并缓存项目根目录，避免重复计算
 _PROJECT_DIR: Optional[Path] = None
-_DIALOGUES_CACHE: Optional[List[Dict]] = None
-_SCENE_INDEX: Optional[Dict[str, Any]] = None
+# dialogues + 内存索引 + 场景索引的当前快照，整体替换（见 SceneSnapshot）
+_SNAPSHOT: Optional["SceneSnapshot"] = None
+_SNAPSHOT_LOCK = threading.Lock()
+_INDEX_BUILDER = None
+_WATCH_THREAD: Optional[threading.Thread] = None
+_WATCH_STOP = threading.Event()
+_LAST_POLLED_STAT: Optional[tuple] = None
 
 
 def _project_dir() -> Path:
@@ -171,34 +178,162 @@ _IMMERSIVE_SCENE_OVERRIDE: Dict[str, str] = {"hospital": "clinic"}
 def _to_immersive_scene_id(small_scene_id: str) -> str:
     return _IMMERSIVE_SCENE_OVERRIDE.get(small_scene_id, small_scene_id)
 
-def get_dialogues() -> List[Dict]:
-    """返回 dialogues.json 全部记录。首次加载后缓存，避免路径/读取波动"""
-    global _DIALOGUES_CACHE
-    if _DIALOGUES_CACHE is not None:
-        return _DIALOGUES_CACHE
-    path = _dialogues_path()
-    data = _load_json(path, [])
-    _DIALOGUES_CACHE = data
-    if data:
-        logger.info("已加载 dialogues.json: %s，共 %d 条", path, len(data))
-    else:
-        logger.warning("dialogues.json 加载为空，路径: %s", path)
-    return data
+# 大场景排序（与 scripts/build_scene_npc_index.py 保持一致的前 6 项）
+_BIG_SCENE_ORDER: Dict[str, int] = {"daily": 1, "food": 2, "travel": 3, "shopping": 4, "work": 5, "social": 6}
+
+
+class DialogueCatalog:
+    """dialogues.json 的内存索引：加载/重载时一次性构建，查询均为 O(1)。
+    同一 (small_scene, npc, usage) 有多条时保留第一条，与原线性扫描语义一致。"""
+
+    def __init__(self, dialogues: List[Dict]):
+        self.dialogues = dialogues
+        self.by_key: Dict[tuple, Dict] = {}
+        self.by_usage: Dict[str, List[Dict]] = {}
+        self.by_small_scene: Dict[str, List[Dict]] = {}
+        self.by_small_scene_usage: Dict[tuple, List[Dict]] = {}
+        self.immersive_scenes: set = set()
+        self.big_by_small: Dict[str, Optional[str]] = {}
+        self.small_scene_names: Dict[str, str] = {}
+        self.learn_npcs_by_small: Dict[str, List[Dict]] = {}
+        self.big_scenes: List[Dict] = []
+        self.small_scenes_by_big: Dict[str, List[Dict]] = {}
+        self._build()
+
+    def _build(self) -> None:
+        big_seen: Dict[str, Dict] = {}
+        small_seen: Dict[str, Dict[str, Dict]] = {}
+        learn_seen: Dict[str, Dict[str, Dict]] = {}
+        for d in self.dialogues:
+            if not isinstance(d, dict):
+                continue
+            sid = d.get("small_scene")
+            nid = d.get("npc")
+            usage = d.get("usage")
+            bid = d.get("big_scene")
+            self.by_key.setdefault((sid, nid, usage), d)
+            self.by_usage.setdefault(usage, []).append(d)
+            self.by_small_scene_usage.setdefault((sid, usage), []).append(d)
+            if sid:
+                self.by_small_scene.setdefault(sid, []).append(d)
+                self.big_by_small.setdefault(sid, bid)
+                self.small_scene_names.setdefault(sid, d.get("small_scene_name", sid))
+                if usage == "immersive":
+                    self.immersive_scenes.add(sid)
+                if usage == "learn" and nid:
+                    npcs = learn_seen.setdefault(sid, {})
+                    if nid not in npcs:
+                        npcs[nid] = {"id": nid, "small_scene_id": sid, "name": d.get("npc_name", nid)}
+            if bid:
+                if bid not in big_seen:
+                    big_seen[bid] = {
+                        "id": bid,
+                        "name": d.get("big_scene_name", bid),
+                        "order": _BIG_SCENE_ORDER.get(bid, 99)
+                    }
+                if sid:
+                    smalls = small_seen.setdefault(bid, {})
+                    if sid not in smalls:
+                        smalls[sid] = {
+                            "id": sid,
+                            "big_scene_id": bid,
+                            "name": d.get("small_scene_name", sid),
+                            "immersive_scene_id": d.get("immersive_scene_id", _to_immersive_scene_id(sid)),
+                            "order": len(smalls) + 1
+                        }
+        self.big_scenes = sorted(big_seen.values(), key=lambda x: x.get("order", 99))
+        self.small_scenes_by_big = {
+            bid: sorted(smalls.values(), key=lambda x: (x.get("order", 99), x["id"]))
+            for bid, smalls in small_seen.items()
+        }
+        self.learn_npcs_by_small = {sid: list(npcs.values()) for sid, npcs in learn_seen.items()}
 
+    def get(self, small_scene_id: str, npc_id: str, usage: str) -> Optional[Dict]:
+        return self.by_key.get((small_scene_id, npc_id, usage))
 
-def reload_dialogues() -> None:
-    """强制重新加载 dialogues.json 与场景索引（用于配置变更后）"""
-    global _DIALOGUES_CACHE, _SCENE_INDEX
-    _DIALOGUES_CACHE = None
-    _SCENE_INDEX = None
-    clear_scene_image_url_cache()
+    def for_scene_usage(self, small_scene_id: str, usage: str) -> List[Dict]:
+        return self.by_small_scene_usage.get((small_scene_id, usage), [])
 
+    def for_usage(self, usage: str) -> List[Dict]:
+        return self.by_usage.get(usage, [])
 
-def _load_scene_index() -> Optional[Dict[str, Any]]:
-    """加载 scene_npc_index.json，首次加载后缓存。不存在时返回 None，后端回退到现场推导。"""
-    global _SCENE_INDEX
-    if _SCENE_INDEX is not None:
-        return _SCENE_INDEX
+
+class SceneSnapshot:
+    """某一版本 dialogues.json 的完整快照：原始记录、DialogueCatalog、场景索引及文件签名。
+    构建完成后才赋给 _SNAPSHOT（单次引用赋值），请求期间看到的三者总是同一版本，不会读到重建一半的缓存。"""
+
+    __slots__ = ("dialogues", "catalog", "index", "stat", "digest")
+
+    def __init__(self, dialogues: List[Dict], index: Optional[Dict[str, Any]], stat: Optional[tuple], digest: Optional[str]):
+        self.dialogues = dialogues
+        self.catalog = DialogueCatalog(dialogues)
+        self.index = index
+        self.stat = stat
+        self.digest = digest
+
+
+def _file_stat(path: Path) -> Optional[tuple]:
+    """(mtime_ns, size)，文件不存在时返回 None。用于廉价判断文件是否可能变化"""
+    try:
+        st = path.stat()
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+
+def _file_digest(path: Path) -> Optional[str]:
+    try:
+        return hashlib.sha1(path.read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+
+def _read_dialogues_file(path: Path) -> tuple:
+    """读取 dialogues.json，返回 (records, sha1)。解析与哈希基于同一份字节，保证签名与内容对应。"""
+    path_str = str(path.resolve())
+    if not path.exists():
+        logger.warning("JSON 文件不存在: %s", path_str)
+        return [], None
+    try:
+        raw = path.read_bytes()
+    except OSError as e:
+        logger.warning("读取 dialogues.json 失败 %s: %s", path_str, e)
+        return [], None
+    digest = hashlib.sha1(raw).hexdigest()
+    try:
+        data = json.loads(raw.decode("utf-8"))
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        logger.warning("dialogues.json 解析失败 %s: %s", path_str, e)
+        return [], digest
+    if not isinstance(data, list):
+        logger.warning("JSON 格式错误，应为数组: %s", path_str)
+        return [], digest
+    return data, digest
+
+
+def _index_builder():
+    """以库方式加载 scripts/build_scene_npc_index.py（scripts 不是包），失败时返回 None"""
+    global _INDEX_BUILDER
+    if _INDEX_BUILDER is not None:
+        return _INDEX_BUILDER
+    script = Path(__file__).resolve().parent.parent / "scripts" / "build_scene_npc_index.py"
+    if not script.is_file():
+        logger.debug("未找到场景索引脚本 %s，将只读已有索引文件", script)
+        return None
+    try:
+        import importlib.util
+        spec = importlib.util.spec_from_file_location("build_scene_npc_index", script)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    except Exception as e:
+        logger.warning("加载场景索引脚本失败 %s: %s", script, e)
+        return None
+    _INDEX_BUILDER = module
+    return module
+
+
+def _read_index_file() -> Optional[Dict[str, Any]]:
+    """读取已生成的 scene_npc_index.json。不存在或格式异常时返回 None，后端回退到现场推导。"""
     path = _index_path()
     if not path.is_file():
         logger.debug("场景索引未找到 %s，将现场推导", path)
@@ -207,9 +342,132 @@ def _load_scene_index() -> Optional[Dict[str, Any]]:
     if not isinstance(data, dict) or "big_scenes" not in data:
         logger.warning("scene_npc_index.json 格式异常，将现场推导")
         return None
-    _SCENE_INDEX = data
-    logger.info("已加载场景索引: %s", path)
-    return _SCENE_INDEX
+    return data
+
+
+def _build_snapshot(refresh_index_file: bool = False) -> SceneSnapshot:
+    """读取 dialogues.json 并在进程内构建场景索引，返回完整快照（不修改全局状态）。
+    refresh_index_file=True 时同时落盘 scene_npc_index.json 并补齐缺失占位图（启动与文件变更时使用）。"""
+    path = _dialogues_path()
+    # 先取签名再读内容：读取后若文件又被改，下次轮询签名必然不同，会再次重建
+    stat = _file_stat(path)
+    data, digest = _read_dialogues_file(path)
+    if data:
+        logger.info("已加载 dialogues.json: %s，共 %d 条", path, len(data))
+    else:
+        logger.warning("dialogues.json 加载为空，路径: %s", path)
+    index = None
+    builder = _index_builder() if data else None
+    if builder is not None:
+        try:
+            index = builder.build_index(data)
+            if refresh_index_file:
+                builder.write_index(_index_path(), index)
+                builder.ensure_all_images(_project_dir(), index)
+        except Exception as e:
+            logger.warning("进程内构建场景索引失败，回退读取索引文件: %s", e)
+            index = None
+    if index is None:
+        index = _read_index_file()
+    return SceneSnapshot(data, index, stat, digest)
+
+
+def _swap_snapshot(snapshot: SceneSnapshot) -> None:
+    global _SNAPSHOT
+    _SNAPSHOT = snapshot
+    clear_scene_image_url_cache()
+
+
+def _get_snapshot() -> SceneSnapshot:
+    snapshot = _SNAPSHOT
+    if snapshot is not None:
+        return snapshot
+    with _SNAPSHOT_LOCK:
+        if _SNAPSHOT is None:
+            _swap_snapshot(_build_snapshot())
+        return _SNAPSHOT
+
+
+def get_dialogues() -> List[Dict]:
+    """返回 dialogues.json 全部记录。首次加载后缓存，避免路径/读取波动"""
+    return _get_snapshot().dialogues
+
+
+def get_catalog() -> DialogueCatalog:
+    """返回 dialogues 的内存索引，与 get_dialogues 属于同一快照，reload_dialogues 时整体替换"""
+    return _get_snapshot().catalog
+
+
+def reload_dialogues(refresh_index_file: bool = False) -> None:
+    """强制重新加载 dialogues.json 与场景索引（用于配置变更后）。新快照完整构建后才替换旧快照。"""
+    with _SNAPSHOT_LOCK:
+        _swap_snapshot(_build_snapshot(refresh_index_file=refresh_index_file))
+
+
+def _load_scene_index() -> Optional[Dict[str, Any]]:
+    """返回当前快照中的场景索引（进程内由 dialogues 构建，失败时为 scene_npc_index.json 内容）。均不可用时返回 None，后端回退到现场推导。"""
+    return _get_snapshot().index
+
+
+def _poll_dialogues_file() -> bool:
+    """检查 dialogues.json 是否变化，变化则重建并替换快照；返回是否替换。
+    先比 mtime/size，变化时再比内容 sha1，仅 touch 或保存未改动不会触发重建。"""
+    global _LAST_POLLED_STAT
+    current = _get_snapshot()
+    path = _dialogues_path()
+    stat = _file_stat(path)
+    if stat is None or stat == current.stat or stat == _LAST_POLLED_STAT:
+        return False
+    # 同一签名只检查一次（内容未变或加载失败都不再重复解析，等文件再次写入）
+    _LAST_POLLED_STAT = stat
+    if _file_digest(path) == current.digest:
+        return False
+    with _SNAPSHOT_LOCK:
+        if _SNAPSHOT is not current:
+            return False  # 期间已被其他调用方重载
+        snapshot = _build_snapshot(refresh_index_file=True)
+        if not snapshot.dialogues and current.dialogues:
+            # 编辑器写到一半或 JSON 暂时不合法：保留旧快照，等下一次写入再重建
+            logger.warning("dialogues.json 变更后加载为空，继续使用旧数据")
+            return False
+        _swap_snapshot(snapshot)
+    logger.info("dialogues.json 已变更，场景索引已热重载（共 %d 条）", len(snapshot.dialogues))
+    return True
+
+
+def _watch_loop(interval: float) -> None:
+    while not _WATCH_STOP.wait(interval):
+        try:
+            _poll_dialogues_file()
+        except Exception as e:
+            logger.warning("监听 dialogues.json 失败: %s", e)
+
+
+def start_dialogues_watcher(interval: Optional[float] = None) -> bool:
+    """启动后台线程监听 dialogues.json 变更并热重载。间隔默认取环境变量 SCENE_DATA_WATCH_INTERVAL（秒，默认 2，<=0 关闭）。"""
+    global _WATCH_THREAD
+    if interval is None:
+        try:
+            interval = float(os.getenv("SCENE_DATA_WATCH_INTERVAL", "2"))
+        except ValueError:
+            interval = 2.0
+    if interval <= 0:
+        return False
+    if _WATCH_THREAD is not None and _WATCH_THREAD.is_alive():
+        return True
+    _WATCH_STOP.clear()
+    _WATCH_THREAD = threading.Thread(target=_watch_loop, args=(interval,), name="dialogues-watcher", daemon=True)
+    _WATCH_THREAD.start()
+    logger.info("已启动 dialogues.json 监听，间隔 %.1fs", interval)
+    return True
+
+
+def stop_dialogues_watcher() -> None:
+    global _WATCH_THREAD
+    _WATCH_STOP.set()
+    if _WATCH_THREAD is not None:
+        _WATCH_THREAD.join(timeout=5)
+    _WATCH_THREAD = None
 
 # --- 解锁状态 ---
 
@@ -227,13 +485,7 @@ def _npc_progress_path(account_name: str) -> Path:
 
 def _get_scenes_with_immersive_dialogues() -> set:
     """返回有 immersive 对话的 small_scene_id 集合"""
-    seen = set()
-    for d in get_dialogues():
-        if d.get("usage") == "immersive":
-            sid = d.get("small_scene")
-            if sid:
-                seen.add(sid)
-    return seen
+    return set(get_catalog().immersive_scenes)
 
 def _ensure_default_unlocks(account_name: str) -> None:
     """确保所有有沉浸式对话的场景默认解锁"""
@@ -294,13 +546,7 @@ def mark_npc_learned(account_name: str, small_scene_id: str, npc_id: str) -> Non
 
 def _get_npc_ids_with_learn_in_scene(small_scene_id: str) -> List[str]:
     """从 dialogues 中获取该小场景下所有有 learn 对话的 NPC id"""
-    seen = set()
-    for d in get_dialogues():
-        if d.get("small_scene") == small_scene_id and d.get("usage") == "learn":
-            nid = d.get("npc")
-            if nid:
-                seen.add(nid)
-    return list(seen)
+    return [n["id"] for n in get_catalog().learn_npcs_by_small.get(small_scene_id, [])]
 
 def check_and_unlock_scene(account_name: str, small_scene_id: str) -> bool:
     """若该小场景下所有 NPC 都已学完，则解锁；返回是否新解锁。Supabase 时不读写本地文件，仅按进度推导，返回 False（不区分是否「新」解锁）。"""
@@ -332,10 +578,7 @@ def scene_can_enter(account_name: str, small_scene_id: str, progress: Optional[D
 
 def get_dialogue(small_scene_id: str, npc_id: str, usage: str) -> Optional[Dict]:
     """按 small_scene, npc, usage 获取一条对话"""
-    for d in get_dialogues():
-        if d.get("small_scene") == small_scene_id and d.get("npc") == npc_id and d.get("usage") == usage:
-            return d
-    return None
+    return get_catalog().get(small_scene_id, npc_id, usage)
 
 def get_learn_dialogue(small_scene_id: str, npc_id: str) -> Optional[Dict]:
     return get_dialogue(small_scene_id, npc_id, "learn")
@@ -350,10 +593,7 @@ def get_immersive_dialogue(small_scene_id: str, npc_id: str) -> Optional[Dict]:
 def get_one_immersive_dialogue_for_scene(small_scene_id: str, seed: Optional[str] = None) -> Optional[Dict]:
     """返回该小场景下一条 usage=immersive 的对话。seed 相同时返回同一条（同一房间两人拿同一主题）。"""
     import random
-    candidates = [
-        d for d in get_dialogues()
-        if d.get("small_scene") == small_scene_id and d.get("usage") == "immersive"
-    ]
+    candidates = get_catalog().for_scene_usage(small_scene_id, "immersive")
     if not candidates:
         return None
     if seed is not None:
@@ -364,7 +604,7 @@ def get_one_immersive_dialogue_for_scene(small_scene_id: str, seed: Optional[str
 def get_one_random_immersive_dialogue(seed: Optional[str] = None) -> Optional[Dict]:
     """返回任意一条 usage=immersive 的对话。seed 相同时返回同一条（同一房间两人拿同一主题）。"""
     import random
-    candidates = [d for d in get_dialogues() if d.get("usage") == "immersive"]
+    candidates = get_catalog().for_usage("immersive")
     if not candidates:
         return None
     if seed is not None:
@@ -390,10 +630,7 @@ def build_card_title(dialogue: Dict) -> str:
 
 def get_big_scene_for_small_scene(small_scene_id: str) -> Optional[str]:
     """根据 small_scene_id 反查所属 big_scene_id（从 dialogues 取第一条匹配）"""
-    for d in get_dialogues():
-        if d.get("small_scene") == small_scene_id:
-            return d.get("big_scene")
-    return None
+    return get_catalog().big_by_small.get(small_scene_id)
 
 
 def infer_theme_scene_from_conversation(text: str) -> tuple:
@@ -571,53 +808,16 @@ def get_learning_recommendations(
 # --- 场景列表（从 dialogues 推导）---
 
 def _derive_big_scenes() -> List[Dict]:
-    """从 dialogues 推导大场景，保持原有顺序"""
-    order_map = {"daily": 1, "food": 2, "travel": 3, "shopping": 4, "work": 5, "social": 6}
-    seen = {}
-    for d in get_dialogues():
-        bid = d.get("big_scene")
-        if not bid:
-            continue
-        if bid not in seen:
-            seen[bid] = {
-                "id": bid,
-                "name": d.get("big_scene_name", bid),
-                "order": order_map.get(bid, 99)
-            }
-    return sorted(seen.values(), key=lambda x: x.get("order", 99))
+    """从 dialogues 推导大场景，保持原有顺序（索引内预计算，返回副本）"""
+    return [dict(b) for b in get_catalog().big_scenes]
 
 def _derive_small_scenes_by_big(big_scene_id: str) -> List[Dict]:
-    """从 dialogues 推导某大场景下的小场景"""
-    order_map = {}
-    seen = {}
-    for d in get_dialogues():
-        if d.get("big_scene") != big_scene_id:
-            continue
-        sid = d.get("small_scene")
-        if not sid:
-            continue
-        if sid not in seen:
-            seen[sid] = {
-                "id": sid,
-                "big_scene_id": big_scene_id,
-                "name": d.get("small_scene_name", sid),
-                "immersive_scene_id": d.get("immersive_scene_id", _to_immersive_scene_id(sid)),
-                "order": len(seen) + 1
-            }
-    return sorted(seen.values(), key=lambda x: (x.get("order", 99), x["id"]))
+    """从 dialogues 推导某大场景下的小场景（索引内预计算，返回副本）"""
+    return [dict(s) for s in get_catalog().small_scenes_by_big.get(big_scene_id, [])]
 
 def _derive_npcs_by_small_scene(small_scene_id: str) -> List[Dict]:
-    """从 dialogues 推导某小场景下的 NPC（仅包含有 learn 对话的）"""
-    seen = {}
-    for d in get_dialogues():
-        if d.get("small_scene") != small_scene_id or d.get("usage") != "learn":
-            continue
-        nid = d.get("npc")
-        if not nid:
-            continue
-        if nid not in seen:
-            seen[nid] = {"id": nid, "small_scene_id": small_scene_id, "name": d.get("npc_name", nid)}
-    return list(seen.values())
+    """从 dialogues 推导某小场景下的 NPC（仅包含有 learn 对话的；索引内预计算，返回副本）"""
+    return [dict(n) for n in get_catalog().learn_npcs_by_small.get(small_scene_id, [])]
 
 def get_big_scenes() -> List[Dict]:
     return _derive_big_scenes()
@@ -720,17 +920,16 @@ def get_immersive_scene_list(account_name: Optional[str] = None) -> List[Dict]:
                 "can_enter": scene_can_enter(acc, sid, progress),
             })
         return result
-    has_immersive = _get_scenes_with_immersive_dialogues()
+    catalog = get_catalog()
     scene_info = {}
-    for d in get_dialogues():
-        sid = d.get("small_scene")
-        if not sid or sid not in has_immersive:
+    for sid, rows in catalog.by_small_scene.items():
+        if sid not in catalog.immersive_scenes:
             continue
-        if sid not in scene_info:
-            scene_info[sid] = {
-                "name": d.get("small_scene_name", sid),
-                "immersive_scene_id": d.get("immersive_scene_id", _to_immersive_scene_id(sid))
-            }
+        d = rows[0]
+        scene_info[sid] = {
+            "name": d.get("small_scene_name", sid),
+            "immersive_scene_id": d.get("immersive_scene_id", _to_immersive_scene_id(sid))
+        }
     result = []
     for sid, info in scene_info.items():
         result.append({
@@ -775,15 +974,12 @@ def get_immersive_scene_detail(immersive_scene_id: str, account_name: Optional[s
             "can_enter": scene_can_enter(acc, small_scene_id, progress),
             "npcs": valid_npcs,
         }
-    rev = {_to_immersive_scene_id(k): k for k in _get_scenes_with_immersive_dialogues()}
+    catalog = get_catalog()
+    rev = {_to_immersive_scene_id(k): k for k in catalog.immersive_scenes}
     small_scene_id = rev.get(immersive_scene_id) or immersive_scene_id
-    if small_scene_id not in _get_scenes_with_immersive_dialogues():
+    if small_scene_id not in catalog.immersive_scenes:
         return None
-    title = small_scene_id
-    for d in get_dialogues():
-        if d.get("small_scene") == small_scene_id:
-            title = d.get("small_scene_name", small_scene_id)
-            break
+    title = catalog.small_scene_names.get(small_scene_id, small_scene_id)
     progress = get_npc_progress(acc)
     learned_set = set(progress.get(small_scene_id, []))
     npcs = _derive_npcs_by_small_scene(small_scene_id)
@@ -0,0 +1,93 @@
+# LLM 流式输出的断句器：边接收增量边切出完整句子，供逐句提交 TTS（首句合成完即可开始播放）
+import os
+import re
+from typing import List
+
+# 短于该长度的句子并入下一句，避免 "Oh!" 这类碎片单独合成导致语调生硬
+STREAM_TTS_MIN_CHARS = int(os.getenv("STREAM_TTS_MIN_CHARS", "12"))
+# 超过该长度仍无句末标点时，在最后一个逗号/空格处强制切分
+STREAM_TTS_MAX_CHARS = int(os.getenv("STREAM_TTS_MAX_CHARS", "200"))
+
+# 中文句末标点后可直接切；英文句末标点需后接空白才切（缓冲区末尾的 "3." 可能是 "3.14" 的一部分）
+_CJK_END = re.compile(r'[。！？；…]+[”’」』）)]*')
+_ASCII_END = re.compile(r'[.!?;]+["\'”’)]*(?=\s)')
+_SOFT_BREAK = re.compile(r'[,，、:：]\s*|\s+')
+_ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "st", "vs", "etc", "e.g", "i.e", "no"}
+_THINK_OPEN = "<think>"
+_THINK_BLOCK = re.compile(r'<think>[\s\S]*?</think>')
+_CJK_CHAR = re.compile(r'[\u3400-\u9fff]')
+
+
+def _weight(text: str) -> int:
+    """句长估计：汉字信息量大、朗读时长长，按 2 计"""
+    text = text.strip()
+    return len(text) + len(_CJK_CHAR.findall(text))
+
+
+class SentenceSegmenter:
+    """feed(delta) 返回本次新凑齐的句子列表；流结束时调用 flush() 取出剩余文本。"""
+
+    def __init__(self, min_chars: int = None, max_chars: int = None):
+        self.min_chars = STREAM_TTS_MIN_CHARS if min_chars is None else min_chars
+        self.max_chars = STREAM_TTS_MAX_CHARS if max_chars is None else max_chars
+        self._buffer = ""
+
+    def feed(self, delta: str) -> List[str]:
+        if not delta:
+            return []
+        self._buffer += delta
+        # 推理块 <think>...</think> 不朗读：整块去掉，未闭合时先不切分
+        self._buffer = _THINK_BLOCK.sub("", self._buffer)
+        think_at = self._buffer.find(_THINK_OPEN)
+        if think_at == -1:
+            scan_end = len(self._buffer)
+        else:
+            scan_end = think_at
+        sentences = []
+        start = 0
+        pending = ""
+        while True:
+            cut = self._next_cut(self._buffer, start, scan_end)
+            if cut is None:
+                break
+            piece = self._buffer[start:cut]
+            start = cut
+            pending += piece
+            if _weight(pending) >= self.min_chars:
+                sentences.append(pending.strip())
+                pending = ""
+        self._buffer = pending + self._buffer[start:]
+        return sentences
+
+    def flush(self) -> List[str]:
+        rest = _THINK_BLOCK.sub("", self._buffer)
+        think_at = rest.find(_THINK_OPEN)
+        if think_at != -1:
+            rest = rest[:think_at]
+        self._buffer = ""
+        rest = rest.strip()
+        return [rest] if rest else []
+
+    def _next_cut(self, text: str, start: int, end: int):
+        """返回 [start, end) 内下一处切分位置（切分点之后的下标），没有则 None"""
+        window = text[start:end]
+        best = None
+        m = _CJK_END.search(window)
+        if m:
+            best = m.end()
+        for m in _ASCII_END.finditer(window):
+            if best is not None and m.end() >= best:
+                break
+            word = re.search(r'([\w.]+)[.]+$', window[:m.start() + 1])
+            if window[m.start()] == "." and word and word.group(1).lower().rstrip(".") in _ABBREVIATIONS:
+                continue
+            best = m.end()
+            break
+        if best is not None:
+            return start + best
+        if len(window) > self.max_chars:
+            soft = None
+            for m in _SOFT_BREAK.finditer(window, 0, self.max_chars):
+                soft = m.end()
+            return start + (soft or self.max_chars)
+        return None
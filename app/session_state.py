@@ -0,0 +1,339 @@
+# 进程内会话状态存储：替代只增不减的普通 dict（练习会话、按账号的对话状态、WebSocket 账号绑定、临时音频 token）。
+# 每个条目有 TTL（可按访问续期），条目数超过上限时淘汰最久未用的；后台清扫线程定期回收过期条目。
+# 可选把冷数据（过期 / 被淘汰的可 JSON 序列化条目）写到 SESSION_SPILL_DIR，下次访问时恢复，超过 SESSION_SPILL_TTL 后删除。
+# 各存储的条目数、估算内存与淘汰 / 过期 / 落盘 / 恢复次数经 session_state_stats() 导出到 /metrics。
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# 后台清扫间隔（秒）
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+# 冷数据落盘目录；为空则不落盘，过期 / 淘汰即丢弃
+SESSION_SPILL_DIR = os.getenv("SESSION_SPILL_DIR", "").strip()
+# 落盘数据保留秒数，超过后清扫时删除
+SESSION_SPILL_TTL = float(os.getenv("SESSION_SPILL_TTL", str(7 * 24 * 3600)))
+
+_MISSING = object()
+_stores: List["SessionStore"] = []
+_stores_lock = threading.Lock()
+
+
+def _approx_size(value: Any, depth: int = 0) -> int:
+    """估算对象占用字节数（递归到 dict / list 内部，深度有限）"""
+    size = sys.getsizeof(value)
+    if depth >= 6:
+        return size
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += _approx_size(k, depth + 1) + _approx_size(v, depth + 1)
+    elif isinstance(value, (list, tuple, set)):
+        for v in value:
+            size += _approx_size(v, depth + 1)
+    return size
+
+
+class SessionStore:
+    """
+    带 TTL 与条目上限的线程安全映射，接口接近 dict（[]、in、get、pop、len）。
+    - ttl: 条目空闲（sliding=True）或自写入起（sliding=False）超过该秒数即过期；None 表示不过期
+    - max_entries: 条目上限，超出时淘汰最久未用且未被 pin 的条目
+    - pin(key, value): 返回 True 的条目不会因过期或超限被回收（例如对话进行中的账号）
+    - spill: 过期 / 淘汰时是否写入 SESSION_SPILL_DIR（键需为 str、值需可 JSON 序列化）
+    - sizeof(value): 估算单条内存，默认递归 getsizeof
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        sliding: bool = True,
+        pin: Optional[Callable[[Any, Any], bool]] = None,
+        spill: bool = False,
+        sizeof: Optional[Callable[[Any], int]] = None,
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.sliding = sliding
+        self._pin = pin
+        self._spill_dir = Path(SESSION_SPILL_DIR) / name if (spill and SESSION_SPILL_DIR) else None
+        self._sizeof = sizeof or _approx_size
+        self._data: "OrderedDict[Any, list]" = OrderedDict()  # key -> [value, 过期时刻]，最久未用在前
+        self._lock = threading.RLock()
+        self._bytes = 0
+        self.stats = {"evictions": 0, "expirations": 0, "spilled": 0, "restored": 0, "spill_errors": 0}
+        with _stores_lock:
+            _stores.append(self)
+
+    # ---------- dict 接口 ----------
+
+    def __setitem__(self, key, value) -> None:
+        self.set(key, value)
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __delitem__(self, key) -> None:
+        if self.pop(key, _MISSING) is _MISSING:
+            raise KeyError(key)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def set(self, key, value, ttl: Optional[float] = _MISSING) -> None:
+        """写入条目；ttl 缺省用存储的 ttl"""
+        ttl = self.ttl if ttl is _MISSING else ttl
+        with self._lock:
+            self._data[key] = [value, time.monotonic() + ttl if ttl is not None else None]
+            self._data.move_to_end(key)
+            self._enforce_limit()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            now = time.monotonic()
+            if entry is not None and entry[1] is not None and now >= entry[1] and not self._pinned(key, entry[0]):
+                self._expire(key)
+                entry = None
+            if entry is None:
+                value = self._restore(key)
+                if value is _MISSING:
+                    return default
+                self.set(key, value)
+                return value
+            self._touch(key, entry, now)
+            return entry[0]
+
+    def get_or_create(self, key, factory: Callable[[], Any]):
+        """取条目，不存在（或已过期且未落盘）时用 factory() 创建"""
+        with self._lock:
+            value = self.get(key, _MISSING)
+            if value is _MISSING:
+                value = factory()
+                self.set(key, value)
+            return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            self._drop_spill(key)
+            return entry[0] if entry is not None else default
+
+    def items(self) -> List[tuple]:
+        with self._lock:
+            return [(k, e[0]) for k, e in self._data.items()]
+
+    def save(self, key) -> None:
+        """原地修改过取出的值后调用；内存存储中取出的就是存储的对象，无需写回（共享后端见 state_backend）"""
+
+    def track(self, key) -> None:
+        """交出可变引用、之后可能原地修改而不调用 save() 时调用；内存存储无需处理（共享后端见 state_backend）"""
+
+    # ---------- 过期 / 淘汰 / 落盘 ----------
+
+    def _pinned(self, key, value) -> bool:
+        if self._pin is None:
+            return False
+        try:
+            return bool(self._pin(key, value))
+        except Exception:
+            return False
+
+    def _touch(self, key, entry, now) -> None:
+        self._data.move_to_end(key)
+        if self.sliding and entry[1] is not None and self.ttl is not None:
+            entry[1] = now + self.ttl
+
+    def _expire(self, key) -> None:
+        entry = self._data.pop(key)
+        self.stats["expirations"] += 1
+        self._spill(key, entry[0])
+
+    def _enforce_limit(self) -> None:
+        if self.max_entries is None:
+            return
+        over = len(self._data) - self.max_entries
+        if over <= 0:
+            return
+        for key in list(self._data):
+            if over <= 0:
+                break
+            value = self._data[key][0]
+            if self._pinned(key, value):
+                continue
+            del self._data[key]
+            self.stats["evictions"] += 1
+            self._spill(key, value)
+            over -= 1
+
+    def sweep(self) -> int:
+        """回收已过期条目并更新内存估算，返回回收数"""
+        now = time.monotonic()
+        removed = 0
+        with self._lock:
+            for key, entry in list(self._data.items()):
+                if entry[1] is not None and now >= entry[1] and not self._pinned(key, entry[0]):
+                    self._expire(key)
+                    removed += 1
+            values = [e[0] for e in self._data.values()]
+        total = 0
+        for v in values:
+            try:
+                total += self._sizeof(v)
+            except Exception:
+                pass
+        self._bytes = total
+        self._sweep_spill()
+        return removed
+
+    def _spill_path(self, key) -> Optional[Path]:
+        if self._spill_dir is None or not isinstance(key, str):
+            return None
+        return self._spill_dir / (hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def _spill(self, key, value) -> None:
+        path = self._spill_path(key)
+        if path is None:
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(path.name + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"key": key, "value": value}, f, ensure_ascii=False)
+            os.replace(tmp, path)
+            self.stats["spilled"] += 1
+        except Exception as e:
+            self.stats["spill_errors"] += 1
+            print(f"⚠️ 会话状态落盘失败（{self.name}）: {e}")
+
+    def _restore(self, key):
+        path = self._spill_path(key)
+        if path is None or not path.exists():
+            return _MISSING
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            path.unlink()
+        except Exception:
+            return _MISSING
+        if data.get("key") != key:
+            return _MISSING
+        self.stats["restored"] += 1
+        return data.get("value")
+
+    def _drop_spill(self, key) -> None:
+        path = self._spill_path(key)
+        if path is not None:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def _sweep_spill(self) -> None:
+        if self._spill_dir is None or not self._spill_dir.is_dir():
+            return
+        cutoff = time.time() - SESSION_SPILL_TTL
+        for path in self._spill_dir.glob("*.json"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                pass
+
+    def snapshot_stats(self) -> dict:
+        spilled_files = 0
+        if self._spill_dir is not None and self._spill_dir.is_dir():
+            spilled_files = sum(1 for _ in self._spill_dir.glob("*.json"))
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "spilled_files": spilled_files,
+                **self.stats,
+            }
+
+
+def create_session_store(name: str, shared: bool = True, **kwargs) -> SessionStore:
+    """按 STATE_BACKEND 创建存储：memory（默认）为进程内 SessionStore；sqlite 时 shared=True 的存储改为多个 worker 共用的
+    SqliteSessionStore。键不可序列化（如 WebSocket 对象）的存储传 shared=False，始终留在进程内。"""
+    if shared:
+        from .state_backend import is_shared_backend, SqliteSessionStore
+        if is_shared_backend():
+            return SqliteSessionStore(name, **kwargs)
+    return SessionStore(name, **kwargs)
+
+
+# ---------- 后台清扫 ----------
+
+_sweeper: Optional[threading.Thread] = None
+_sweeper_stop = threading.Event()
+
+
+def sweep_all() -> int:
+    with _stores_lock:
+        stores = list(_stores)
+    removed = 0
+    for store in stores:
+        try:
+            removed += store.sweep()
+        except Exception as e:
+            print(f"⚠️ 清扫会话状态 {store.name} 失败: {e}")
+    return removed
+
+
+def _sweep_loop() -> None:
+    while not _sweeper_stop.wait(SESSION_SWEEP_INTERVAL):
+        sweep_all()
+
+
+def start_session_sweeper() -> None:
+    """启动后台清扫线程（应用启动时调用，重复调用无副作用）"""
+    global _sweeper
+    if _sweeper is not None and _sweeper.is_alive():
+        return
+    _sweeper_stop.clear()
+    _sweeper = threading.Thread(target=_sweep_loop, name="session-sweeper", daemon=True)
+    _sweeper.start()
+
+
+def stop_session_sweeper() -> None:
+    _sweeper_stop.set()
+
+
+def _process_rss() -> Optional[int]:
+    """当前进程常驻内存（字节），Linux 读 /proc，其他平台取峰值近似"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+    except Exception:
+        return None
+
+
+def session_state_stats() -> Dict[str, Any]:
+    """各存储的条目数、估算字节、落盘文件数与累计淘汰 / 过期 / 落盘 / 恢复次数，以及进程 RSS"""
+    with _stores_lock:
+        stores = list(_stores)
+    return {
+        "stores": {s.name: s.snapshot_stats() for s in stores},
+        "rss_bytes": _process_rss(),
+    }
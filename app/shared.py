@@ -4,16 +4,23 @@ Shared resources used across the application.
 """
 
 import os
+import threading
+import time
+from collections import OrderedDict
 from dotenv import load_dotenv
 
 load_dotenv()
 
+from .session_state import SessionStore, create_session_store
+
 # WebSocket clients
 clients = set()
 active_client_status = {}  # Track status of websocket clients
 
-# WebSocket -> account_name 绑定，用于按用户分状态
-_ws_to_account = {}
+# WebSocket -> account_name 绑定，用于按用户分状态；仍在 clients 中的连接不会被回收，
+# 只兜底清理未走 remove_client 就断开的连接留下的绑定
+WS_ACCOUNT_TTL = float(os.getenv("WS_ACCOUNT_TTL", "86400"))
+_ws_to_account = SessionStore("ws_account", ttl=WS_ACCOUNT_TTL, pin=lambda ws, _: ws in clients)
 
 DEFAULT_ACCOUNT = "default"
 
@@ -27,15 +34,26 @@ def _default_user_state():
         "learning_stage": "chinese_chat",  # "chinese_chat" 或 "english_learning"
     }
 
-# 按用户 ID(account_name) 存状态
-_user_states = {}
+# 按用户 ID(account_name) 存状态（STATE_BACKEND=sqlite 时多个 worker 共用）：空闲超过 USER_STATE_IDLE_TTL 秒或超出 USER_STATE_MAX_ENTRIES 时回收
+# （对话进行中的账号除外）；配置 SESSION_SPILL_DIR 时回收的状态落盘，用户再次访问时恢复
+USER_STATE_IDLE_TTL = float(os.getenv("USER_STATE_IDLE_TTL", "7200"))
+USER_STATE_MAX_ENTRIES = int(os.getenv("USER_STATE_MAX_ENTRIES", "2000"))
+_user_states = create_session_store(
+    "user_state",
+    ttl=USER_STATE_IDLE_TTL,
+    max_entries=max(1, USER_STATE_MAX_ENTRIES),
+    pin=lambda _, state: state.get("conversation_active"),
+    spill=True,
+)
 
 def get_user_state(account_name=None):
     """获取指定用户的状态，无则创建默认。account_name 为空时使用 DEFAULT_ACCOUNT。"""
     key = (account_name or DEFAULT_ACCOUNT).strip() or DEFAULT_ACCOUNT
-    if key not in _user_states:
-        _user_states[key] = _default_user_state()
-    return _user_states[key]
+    return _user_states.get_or_create(key, _default_user_state)
+
+def _save_user_state(account_name=None):
+    """setter 原地修改状态后写回（共享后端下让其他 worker 立即可见；内存后端无操作）"""
+    _user_states.save((account_name or DEFAULT_ACCOUNT).strip() or DEFAULT_ACCOUNT)
 
 def set_websocket_account(websocket, account_name):
     """绑定 WebSocket 与账号，用于该连接后续请求按用户分状态。"""
@@ -58,6 +76,7 @@ def get_current_character(account_name=None):
 def set_current_character(character, account_name=None):
     """Set the current character for the given account."""
     get_user_state(account_name)["current_character"] = character
+    _save_user_state(account_name)
 
 def is_conversation_active(account_name=None):
     """Check if a conversation is active for the given account."""
@@ -66,14 +85,19 @@ def is_conversation_active(account_name=None):
 def set_conversation_active(active, account_name=None):
     """Set the conversation active state for the given account."""
     get_user_state(account_name)["conversation_active"] = active
+    _save_user_state(account_name)
 
 def get_conversation_history(account_name=None):
     """Get conversation history for the given account (返回引用，调用方可 append/clear)。"""
-    return get_user_state(account_name)["conversation_history"]
+    history = get_user_state(account_name)["conversation_history"]
+    # 调用方原地修改后不会调用 save：共享后端下由后台同步检查并写回
+    _user_states.track((account_name or DEFAULT_ACCOUNT).strip() or DEFAULT_ACCOUNT)
+    return history
 
 def clear_conversation_history(account_name=None):
     """Clear the conversation history for the given account."""
     get_user_state(account_name)["conversation_history"].clear()
+    _save_user_state(account_name)
 
 def get_learning_stage(account_name=None):
     """Get learning stage for the given account."""
@@ -83,6 +107,7 @@ def set_learning_stage(stage, account_name=None):
     """Set learning stage for the given account."""
     if stage in ["chinese_chat", "english_learning"]:
         get_user_state(account_name)["learning_stage"] = stage
+        _save_user_state(account_name)
         print(f"Learning stage set to: {stage} (account={account_name or DEFAULT_ACCOUNT})")
     else:
         print(f"Invalid learning stage: {stage}, must be 'chinese_chat' or 'english_learning'")
@@ -94,6 +119,7 @@ def get_continue_conversation(account_name=None):
 def set_continue_conversation(value, account_name=None):
     """Set continue_conversation for the given account."""
     get_user_state(account_name)["continue_conversation"] = value
+    _save_user_state(account_name)
 
 # ---------- 兼容旧代码：保留 conversation_history 的“当前默认用户”引用 ----------
 # 仅用于尚未传入 account_name 的调用处，建议逐步改为显式传 account_name
@@ -101,12 +127,16 @@ def _default_conversation_history():
     return get_conversation_history(DEFAULT_ACCOUNT)
 
 def add_client(client):
-    """Add a client to the set of connected clients."""
+    """Add a client to the set of connected clients（同时创建该连接的发送队列，见 ws_router）。"""
+    from .ws_router import open_outbox
     clients.add(client)
     active_client_status[client] = True
+    open_outbox(client)
 
 def remove_client(client):
     """Remove a client from the set of connected clients."""
+    from .ws_router import close_outbox
+    close_outbox(client)
     clients.discard(client)
     remove_websocket_account(client)
     if client in active_client_status:
@@ -121,36 +151,99 @@ def set_client_inactive(client):
     active_client_status[client] = False
 
 # 记忆系统（与现有账号记忆对接：按 account_name 使用，不依赖全局“当前账号”）
-memory_system = None
+# 按账号缓存 DiaryMemorySystem（LRU + 空闲超时淘汰），多个用户交替请求时各自复用实例，不再每次重建；
+# 每次取用时经 adapter 重新加载档案（adapter 有缓存 / 版本校验），多 worker 时不会用旧档案覆盖其他 worker 的更新
+MEMORY_POOL_SIZE = int(os.getenv("MEMORY_POOL_SIZE", "64"))
+MEMORY_POOL_IDLE_TTL = float(os.getenv("MEMORY_POOL_IDLE_TTL", "1800"))
+
+_memory_pool = OrderedDict()  # account_name -> (DiaryMemorySystem, 最近使用时间)，最久未用在前
+_memory_pool_lock = threading.RLock()
+_memory_build_locks = {}  # account_name -> Lock，同一账号并发首次访问时只构建一次
+_memory_pool_stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "errors": 0}
 current_account = None  # 保留用于 get_memory_system(account_name=None) 时的回退
 _last_memory_init_error = None
 
+
+def _expire_memory_pool(now):
+    """移除空闲超过 MEMORY_POOL_IDLE_TTL 的实例（需持有 _memory_pool_lock）"""
+    while _memory_pool:
+        account, (_, last_used) = next(iter(_memory_pool.items()))
+        if now - last_used <= MEMORY_POOL_IDLE_TTL:
+            break
+        _memory_pool.popitem(last=False)
+        _memory_build_locks.pop(account, None)
+        _memory_pool_stats["expirations"] += 1
+
+
+def _pool_get_memory_system(account_name):
+    now = time.monotonic()
+    with _memory_pool_lock:
+        _expire_memory_pool(now)
+        entry = _memory_pool.get(account_name)
+        if entry is not None:
+            _memory_pool[account_name] = (entry[0], now)
+            _memory_pool.move_to_end(account_name)
+            _memory_pool_stats["hits"] += 1
+    if entry is not None:
+        # 命中时重新加载档案：其他 worker 可能已更新（如 english_level），不能用池中旧档案覆盖
+        entry[0].refresh_user_profile()
+        return entry[0]
+    with _memory_pool_lock:
+        build_lock = _memory_build_locks.setdefault(account_name, threading.Lock())
+    with build_lock:
+        # 等锁期间其他线程可能已构建完成
+        with _memory_pool_lock:
+            entry = _memory_pool.get(account_name)
+            if entry is not None:
+                _memory_pool.move_to_end(account_name)
+                _memory_pool_stats["hits"] += 1
+            else:
+                _memory_pool_stats["misses"] += 1
+        if entry is not None:
+            entry[0].refresh_user_profile()
+            return entry[0]
+        from .memory_system import DiaryMemorySystem
+        instance = DiaryMemorySystem(account_name=account_name)
+        with _memory_pool_lock:
+            _memory_pool[account_name] = (instance, time.monotonic())
+            _memory_pool.move_to_end(account_name)
+            while len(_memory_pool) > max(1, MEMORY_POOL_SIZE):
+                evicted, _ = _memory_pool.popitem(last=False)
+                _memory_build_locks.pop(evicted, None)
+                _memory_pool_stats["evictions"] += 1
+        return instance
+
+
 def get_memory_system(account_name=None):
-    """获取记忆系统实例（单例模式，但基于账号）。传入 account_name 时使用该账号，与按用户分状态对接。"""
-    global memory_system, current_account, _last_memory_init_error
+    """获取该账号的记忆系统实例（按账号池化复用）。未传 account_name 时使用当前账号。初始化失败返回 None，原因见 get_last_memory_init_error。"""
+    global current_account, _last_memory_init_error
 
     if account_name is None:
         account_name = current_account
-
-    if account_name and account_name != current_account:
-        memory_system = None
+    elif account_name != current_account:
         current_account = account_name
 
-    if memory_system is None:
+    try:
+        instance = _pool_get_memory_system(account_name)
         _last_memory_init_error = None
-        try:
-            from .memory_system import DiaryMemorySystem
-            memory_system = DiaryMemorySystem(account_name=account_name)
-            current_account = account_name
-            print(f"Memory system initialized successfully for account: {account_name or 'default'}")
-        except Exception as e:
-            _last_memory_init_error = str(e)
-            print(f"Error initializing memory system: {e}")
-            import traceback
-            traceback.print_exc()
-            memory_system = None
+        return instance
+    except Exception as e:
+        _last_memory_init_error = str(e)
+        with _memory_pool_lock:
+            _memory_pool_stats["errors"] += 1
+        if account_name == current_account:
             current_account = None
-    return memory_system
+        print(f"Error initializing memory system: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+
+def memory_pool_stats():
+    """记忆系统池状态：缓存实例数、上限、空闲超时，以及命中 / 未命中 / 淘汰 / 超时 / 初始化失败次数"""
+    with _memory_pool_lock:
+        return {"size": len(_memory_pool), "max_size": MEMORY_POOL_SIZE, "idle_ttl": MEMORY_POOL_IDLE_TTL, **_memory_pool_stats}
+
 
 def get_last_memory_init_error():
     """返回上次记忆系统初始化失败时的错误信息（供登录接口返回给用户）"""
@@ -163,8 +256,6 @@ def get_current_account():
     return current_account
 
 def set_current_account(account_name):
-    """设置当前账号（会重新初始化记忆系统），用于登录等场景。"""
-    global memory_system, current_account
-    if account_name != current_account:
-        memory_system = None
-        current_account = account_name
+    """设置当前账号（全局回退值），用于登录等场景；各账号的记忆系统实例在池中保留，切换账号不会重建。"""
+    global current_account
+    current_account = account_name
@@ -0,0 +1,448 @@
+# 多进程共享状态后端：STATE_BACKEND=sqlite 时，练习会话、按账号的对话状态、临时音频 token 存到
+# SQLite（WAL 模式）文件，同一台机器上的多个 uvicorn worker 共用；WebSocket 消息经同一文件中的消息表
+# 发布 / 订阅，转发到持有目标账号连接的 worker。默认 STATE_BACKEND=memory 保持单进程内存存储。
+#
+# 多个容器需要共享同一文件（同一宿主机卷）；SQLite 不支持网络文件系统上的 WAL，跨主机部署需换用外部存储。
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, List, Optional
+
+from .session_state import SessionStore, _MISSING
+
+_PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+# 共享状态库路径（含所有用户的对话状态与消息）：默认放在项目根的 state/ 下，与 memory/ 并列；
+# 不能放到 outputs/ 下，那里的文件经 /audio/ 对外提供
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "") or str(_PROJECT_DIR / "state" / "state.db")
+# 写锁等待秒数
+STATE_DB_BUSY_TIMEOUT = float(os.getenv("STATE_DB_BUSY_TIMEOUT", "5"))
+# 后台同步线程检查被跟踪条目并写回共享库的间隔（秒）
+STATE_SYNC_INTERVAL = float(os.getenv("STATE_SYNC_INTERVAL", "1.0"))
+# track() 后保持跟踪的秒数（期间的原地修改由后台同步写回）
+STATE_TRACK_WINDOW = float(os.getenv("STATE_TRACK_WINDOW", "300"))
+# 订阅方轮询新消息的间隔（秒）
+STATE_PUBSUB_POLL = float(os.getenv("STATE_PUBSUB_POLL", "0.05"))
+# 已发布消息保留秒数（之后清理）
+STATE_PUBSUB_RETENTION = float(os.getenv("STATE_PUBSUB_RETENTION", "60"))
+
+# 本进程标识：订阅时跳过自己发布的消息（本地连接已直接投递）
+WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS session_kv (
+    store TEXT NOT NULL,
+    key TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    value BLOB,
+    expires_at REAL,
+    version TEXT NOT NULL,
+    PRIMARY KEY (store, key)
+);
+CREATE INDEX IF NOT EXISTS idx_session_kv_expires ON session_kv (store, expires_at);
+CREATE TABLE IF NOT EXISTS ws_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    origin TEXT NOT NULL,
+    account TEXT,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = False
+_stats = {"published": 0, "received": 0, "publish_errors": 0, "synced": 0}
+
+
+def state_backend_name() -> str:
+    return os.getenv("STATE_BACKEND", "memory").strip().lower() or "memory"
+
+
+def is_shared_backend() -> bool:
+    return state_backend_name() == "sqlite"
+
+
+def _connect() -> sqlite3.Connection:
+    """当前线程的连接（sqlite3 连接不能跨线程共用）"""
+    global _schema_ready
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        return conn
+    Path(STATE_DB_PATH).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(STATE_DB_PATH, timeout=STATE_DB_BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    with _schema_lock:
+        if not _schema_ready:
+            conn.executescript(_SCHEMA)
+            _schema_ready = True
+    _local.conn = conn
+    return conn
+
+
+def _encode(value: Any):
+    """bytes 原样存 BLOB，其余按 JSON 存"""
+    if isinstance(value, (bytes, bytearray)):
+        return "b", bytes(value)
+    return "j", json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _decode(kind: str, raw):
+    if kind == "b":
+        return bytes(raw)
+    return json.loads(raw)
+
+
+class SqliteSessionStore(SessionStore):
+    """
+    SessionStore 的共享实现：条目存于 SQLite 的 session_kv 表，所有 worker 可见。
+    取出的值在本进程缓存一份（按行版本号判断是否仍是最新），调用方可以像以前一样原地修改：
+    - 修改后调用 save(key) 立即写回；
+    - 交出可变引用、之后不一定调用 save() 的地方（如 conversation_history.append）先调用 track(key)，
+      STATE_TRACK_WINDOW 秒内（pin 住的条目一直）由后台同步线程比较内容，变化了才写回。
+    写回只在行版本仍是本地读到的版本时生效；其他 worker 已写入更新的版本时放弃本地修改、重新读取（计入 conflicts），
+    不覆盖对方的数据。set() 是整体替换，直接覆盖。
+    """
+
+    def __init__(self, name: str, ttl: Optional[float] = None, max_entries: Optional[int] = None,
+                 sliding: bool = True, pin: Optional[Callable[[Any, Any], bool]] = None,
+                 spill: bool = False, sizeof: Optional[Callable[[Any], int]] = None):
+        super().__init__(name, ttl=ttl, max_entries=max_entries, sliding=sliding, pin=pin, sizeof=sizeof)
+        # key -> [value, version, 跟踪截止时刻, 该版本的编码]；只缓存最近用过的条目
+        self._cache: "OrderedDict[str, list]" = OrderedDict()
+        self._cache_limit = max_entries or 1024
+        self.stats["reloaded"] = 0
+        self.stats["conflicts"] = 0
+
+    # ---------- dict 接口 ----------
+
+    def __len__(self) -> int:
+        row = _connect().execute("SELECT COUNT(*) FROM session_kv WHERE store = ?", (self.name,)).fetchone()
+        return row[0]
+
+    def set(self, key, value, ttl: Optional[float] = _MISSING) -> None:
+        ttl = self.ttl if ttl is _MISSING else ttl
+        with self._lock:
+            self._write(key, value, time.time() + ttl if ttl is not None else None)
+
+    def get(self, key, default=None):
+        with self._lock:
+            conn = _connect()
+            row = conn.execute(
+                "SELECT kind, value, expires_at, version FROM session_kv WHERE store = ? AND key = ?",
+                (self.name, key),
+            ).fetchone()
+            local = self._cache.get(key)
+            if row is None:
+                self._cache.pop(key, None)
+                return default
+            kind, raw, expires_at, version = row
+            if local is not None and local[1] == version:
+                value = local[0]
+                self._cache.move_to_end(key)
+            else:
+                if local is not None:
+                    # 其他 worker 更新过：以共享库为准；本地未写回的跟踪修改丢弃
+                    self.stats["reloaded"] += 1
+                    self._flush_tracked(key, local, reread=False)
+                value = _decode(kind, raw)
+                self._remember(key, value, version, raw, local[2] if local is not None else None)
+            now = time.time()
+            if expires_at is not None and now >= expires_at and not self._pinned(key, value):
+                self._delete(key)
+                self.stats["expirations"] += 1
+                return default
+            if self.sliding and self.ttl is not None and expires_at is not None and \
+                    now + self.ttl - expires_at > min(60.0, self.ttl / 10):
+                conn.execute("UPDATE session_kv SET expires_at = ? WHERE store = ? AND key = ?",
+                             (now + self.ttl, self.name, key))
+            return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            value = self.get(key, _MISSING)
+            self._delete(key)
+            return default if value is _MISSING else value
+
+    def save(self, key) -> None:
+        """立即写回本进程对该条目的原地修改（行版本已被其他 worker 更新时放弃本地修改）"""
+        with self._lock:
+            local = self._cache.get(key)
+            if local is not None:
+                self._write_back(key, local)
+
+    def track(self, key) -> None:
+        """调用方拿到可变引用、之后可能原地修改而不调用 save()：STATE_TRACK_WINDOW 秒内由后台同步检查并写回"""
+        with self._lock:
+            local = self._cache.get(key)
+            if local is not None:
+                local[2] = time.monotonic() + STATE_TRACK_WINDOW
+
+    def items(self) -> List[tuple]:
+        rows = _connect().execute("SELECT key, kind, value FROM session_kv WHERE store = ?", (self.name,)).fetchall()
+        return [(k, _decode(kind, raw)) for k, kind, raw in rows]
+
+    # ---------- 写回 / 回收 ----------
+
+    def _remember(self, key, value, version, encoded, tracked_until=None) -> None:
+        self._cache[key] = [value, version, tracked_until, encoded]
+        self._cache.move_to_end(key)
+        while len(self._cache) > self._cache_limit:
+            old_key, old = self._cache.popitem(last=False)
+            self._flush_tracked(old_key, old, reread=False)
+
+    def _flush_tracked(self, key, local, reread: bool = True) -> bool:
+        """被跟踪（或 pin 住）的条目内容有变化时写回，返回是否写回"""
+        if local[2] is None and not self._pinned(key, local[0]):
+            return False
+        try:
+            encoded = _encode(local[0])[1]
+        except (TypeError, ValueError):
+            return False
+        if encoded == local[3]:
+            return False
+        return self._write_back(key, local, reread=reread)
+
+    def _write_back(self, key, local, reread: bool = True) -> bool:
+        """按版本条件写回原地修改：行版本仍是本地读到的版本才写入；否则放弃本地修改（不覆盖其他 worker 的新数据）"""
+        try:
+            kind, encoded = _encode(local[0])
+        except (TypeError, ValueError):
+            return False
+        if encoded == local[3]:
+            return False
+        version = uuid.uuid4().hex
+        expires_at = time.time() + self.ttl if (self.sliding and self.ttl is not None) else None
+        cur = _connect().execute(
+            "UPDATE session_kv SET kind = ?, value = ?, expires_at = COALESCE(?, expires_at), version = ? "
+            "WHERE store = ? AND key = ? AND version = ?",
+            (kind, encoded, expires_at, version, self.name, key, local[1]),
+        )
+        if cur.rowcount == 1:
+            local[1], local[3] = version, encoded
+            _stats["synced"] += 1
+            return True
+        # 其他 worker 已写入新版本（或条目已被删除）：丢弃本地副本，下次 get 重新读取
+        self.stats["conflicts"] += 1
+        print(f"⚠️ 共享状态 {self.name}/{key} 已被其他 worker 更新，放弃本进程未写回的修改")
+        if reread and self._cache.get(key) is local:
+            del self._cache[key]
+        return False
+
+    def _write(self, key, value, expires_at, remember: bool = True) -> None:
+        kind, encoded = _encode(value)
+        version = uuid.uuid4().hex
+        _connect().execute(
+            "INSERT INTO session_kv (store, key, kind, value, expires_at, version) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (store, key) DO UPDATE SET kind = excluded.kind, value = excluded.value, "
+            "expires_at = excluded.expires_at, version = excluded.version",
+            (self.name, key, kind, encoded, expires_at, version),
+        )
+        _stats["synced"] += 1
+        if remember:
+            local = self._cache.get(key)
+            self._remember(key, value, version, encoded, local[2] if local is not None else None)
+
+    def _delete(self, key) -> None:
+        self._cache.pop(key, None)
+        _connect().execute("DELETE FROM session_kv WHERE store = ? AND key = ?", (self.name, key))
+
+    def sync(self) -> int:
+        """把被跟踪 / pin 住且内容有变化的条目写回共享库（其余条目不编码、不比较），返回写回数"""
+        written = 0
+        now = time.monotonic()
+        with self._lock:
+            for key, local in list(self._cache.items()):
+                if local[2] is None and self._pin is None:
+                    continue
+                if self._flush_tracked(key, local):
+                    written += 1
+                if local[2] is not None and now >= local[2]:
+                    # 跟踪窗口结束（本轮已做最后一次写回）
+                    local[2] = None
+        return written
+
+    def sweep(self) -> int:
+        """删除过期（未 pin）条目，超出条目上限时按过期时间最早的先删"""
+        self.sync()
+        conn = _connect()
+        now = time.time()
+        removed = 0
+        with self._lock:
+            rows = conn.execute(
+                "SELECT key, kind, value FROM session_kv WHERE store = ? AND expires_at IS NOT NULL AND expires_at <= ?",
+                (self.name, now),
+            ).fetchall()
+            for key, kind, raw in rows:
+                if self._pin is not None and self._pinned(key, _decode(kind, raw)):
+                    conn.execute("UPDATE session_kv SET expires_at = ? WHERE store = ? AND key = ?",
+                                 (now + (self.ttl or 0), self.name, key))
+                    continue
+                self._delete(key)
+                self.stats["expirations"] += 1
+                removed += 1
+            if self.max_entries is not None:
+                over = len(self) - self.max_entries
+                if over > 0:
+                    rows = conn.execute(
+                        "SELECT key, kind, value FROM session_kv WHERE store = ? ORDER BY expires_at IS NULL, expires_at",
+                        (self.name,),
+                    ).fetchall()
+                    for key, kind, raw in rows:
+                        if over <= 0:
+                            break
+                        if self._pin is not None and self._pinned(key, _decode(kind, raw)):
+                            continue
+                        self._delete(key)
+                        self.stats["evictions"] += 1
+                        over -= 1
+        row = conn.execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM session_kv WHERE store = ?",
+                           (self.name,)).fetchone()
+        self._bytes = row[0]
+        return removed
+
+    def snapshot_stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "spilled_files": 0,
+                **self.stats,
+            }
+
+
+# ---------- 后台同步 ----------
+
+_sync_thread: Optional[threading.Thread] = None
+_stop = threading.Event()
+
+
+def _sync_loop() -> None:
+    from .session_state import _stores, _stores_lock
+    while not _stop.wait(STATE_SYNC_INTERVAL):
+        with _stores_lock:
+            stores = [s for s in _stores if isinstance(s, SqliteSessionStore)]
+        for store in stores:
+            try:
+                store.sync()
+            except Exception as e:
+                print(f"⚠️ 共享状态写回失败（{store.name}）: {e}")
+
+
+# ---------- WebSocket 消息发布 / 订阅 ----------
+
+_outgoing: "queue.Queue[Optional[tuple]]" = queue.Queue()
+_publisher: Optional[threading.Thread] = None
+_subscriber: Optional[threading.Thread] = None
+
+
+def publish(message: str, account_name: Optional[str]) -> None:
+    """把消息交给其他 worker（异步写入消息表，不阻塞事件循环）"""
+    _outgoing.put((account_name, message))
+
+
+def _publish_loop() -> None:
+    while True:
+        item = _outgoing.get()
+        if item is None:
+            return
+        batch = [item]
+        while len(batch) < 256:
+            try:
+                nxt = _outgoing.get_nowait()
+            except queue.Empty:
+                break
+            if nxt is None:
+                _outgoing.put(None)
+                break
+            batch.append(nxt)
+        now = time.time()
+        conn = None
+        try:
+            conn = _connect()
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("INSERT INTO ws_messages (origin, account, payload, created_at) VALUES (?, ?, ?, ?)",
+                             [(WORKER_ID, acc, msg, now) for acc, msg in batch])
+            conn.execute("COMMIT")
+            _stats["published"] += len(batch)
+        except Exception as e:
+            _stats["publish_errors"] += len(batch)
+            print(f"⚠️ 发布 WebSocket 消息失败: {e}")
+            try:
+                if conn is not None:
+                    conn.execute("ROLLBACK")
+            except Exception:
+                pass
+
+
+def _subscribe_loop(deliver: Callable[[str, Optional[str]], Any]) -> None:
+    conn = _connect()
+    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM ws_messages").fetchone()[0]
+    last_cleanup = time.time()
+    while not _stop.wait(STATE_PUBSUB_POLL):
+        try:
+            rows = conn.execute(
+                "SELECT id, origin, account, payload FROM ws_messages WHERE id > ? ORDER BY id LIMIT 500",
+                (last_id,),
+            ).fetchall()
+            for msg_id, origin, account, payload in rows:
+                last_id = msg_id
+                if origin == WORKER_ID:
+                    continue
+                _stats["received"] += 1
+                deliver(payload, account)
+            if time.time() - last_cleanup > STATE_PUBSUB_RETENTION:
+                last_cleanup = time.time()
+                conn.execute("DELETE FROM ws_messages WHERE created_at < ?", (last_cleanup - STATE_PUBSUB_RETENTION,))
+        except Exception as e:
+            print(f"⚠️ 读取 WebSocket 消息失败: {e}")
+
+
+def start_state_backend() -> bool:
+    """sqlite 后端时启动写回同步、消息发布与订阅线程（每个 worker 启动时调用），返回是否启用"""
+    global _sync_thread, _publisher, _subscriber
+    if not is_shared_backend():
+        return False
+    from .ws_router import route_local
+    _stop.clear()
+    if _sync_thread is None or not _sync_thread.is_alive():
+        _sync_thread = threading.Thread(target=_sync_loop, name="state-sync", daemon=True)
+        _sync_thread.start()
+    if _publisher is None or not _publisher.is_alive():
+        _publisher = threading.Thread(target=_publish_loop, name="state-publish", daemon=True)
+        _publisher.start()
+    if _subscriber is None or not _subscriber.is_alive():
+        _subscriber = threading.Thread(target=_subscribe_loop, args=(route_local,), name="state-subscribe", daemon=True)
+        _subscriber.start()
+    return True
+
+
+def stop_state_backend() -> None:
+    """停止后台线程，并把本进程未写回的状态与未发布的消息写出"""
+    if not is_shared_backend():
+        return
+    _stop.set()
+    _outgoing.put(None)
+    if _publisher is not None:
+        _publisher.join(timeout=2)
+    from .session_state import _stores, _stores_lock
+    with _stores_lock:
+        stores = [s for s in _stores if isinstance(s, SqliteSessionStore)]
+    for store in stores:
+        try:
+            store.sync()
+        except Exception as e:
+            print(f"⚠️ 共享状态写回失败（{store.name}）: {e}")
+
+
+def state_backend_stats() -> dict:
+    """后端名称、本进程标识，以及累计发布 / 接收 / 发布失败的消息数与写回次数"""
+    return {"backend": state_backend_name(), "worker_id": WORKER_ID, "pending_publish": _outgoing.qsize(), **_stats}
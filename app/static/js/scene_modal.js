@@ -9,6 +9,15 @@
     return await res.json();
   }
 
+  /** 沉浸式回复语音格式：浏览器能播 Ogg Opus 时用 opus（更小），否则 mp3 */
+  function preferredAudioFormat() {
+    try {
+      var probe = document.createElement('audio');
+      if (probe.canPlayType && probe.canPlayType('audio/ogg; codecs="opus"')) return 'opus';
+    } catch (_) {}
+    return 'mp3';
+  }
+
   /** 当前账户名（与 voice_chat 一致），用于场景解锁状态从 Supabase/后端正确按用户拉取 */
   function getSceneAccount() {
     if (typeof window.currentAccountName !== 'undefined' && window.currentAccountName) return window.currentAccountName;
@@ -401,7 +410,8 @@
           message: text,
           history,
           role_swapped: immersiveState.roleSwapped,
-          account_name: acc || undefined
+          account_name: acc || undefined,
+          audio_format: preferredAudioFormat()
         })
       });
       const data = await res.json().catch(() => ({}));
@@ -447,7 +457,8 @@
           message: text.trim(),
           history: history,
           role_swapped: immersiveState.roleSwapped,
-          account_name: acc || undefined
+          account_name: acc || undefined,
+          audio_format: preferredAudioFormat()
         })
       });
       var data = await res.json().catch(function () { return {}; });
@@ -321,6 +321,15 @@ document.addEventListener("DOMContentLoaded", function() {
             console.log('✅ Host:', host);
             
             websocket = new WebSocket(wsUrl);
+
+            // 回复语音格式：浏览器能播 Ogg Opus 时用 opus（更小），否则 mp3
+            function preferredAudioFormat() {
+                try {
+                    const probe = document.createElement('audio');
+                    if (probe.canPlayType && probe.canPlayType('audio/ogg; codecs="opus"')) return 'opus';
+                } catch (_) {}
+                return 'mp3';
+            }
             
             // ✅ 连接成功回调：按用户分状态，绑定当前账号
             websocket.onopen = () => {
@@ -328,7 +337,7 @@ document.addEventListener("DOMContentLoaded", function() {
                 console.log('✅ 当前连接状态:', websocket.readyState); // 1=已连接
                 const acc = (typeof currentAccountName !== 'undefined' ? currentAccountName : null) || (typeof localStorage !== 'undefined' ? localStorage.getItem('current_account') : null) || '';
                 if (acc && websocket.readyState === WebSocket.OPEN) {
-                    websocket.send(JSON.stringify({ action: 'set_account', account_name: acc }));
+                    websocket.send(JSON.stringify({ action: 'set_account', account_name: acc, audio_format: preferredAudioFormat() }));
                 }
             };
             
@@ -506,6 +515,10 @@ document.addEventListener("DOMContentLoaded", function() {
             if (data.message) {
                 showNotification(data.message);
             }
+        } else if (data.action === 'ai_audio_chunk' && data.audio_url) {
+            enqueueReplyAudioChunk(data);
+        } else if (data.action === 'ai_audio_end') {
+            endReplyAudio(data);
         } else if (data.action === 'error') {
             console.error('Received error action:', data.message);
             showError(data.message || '发生错误');
@@ -537,6 +550,61 @@ document.addEventListener("DOMContentLoaded", function() {
         }
     }
 
+    // 流式语音分段：同一条回复的分段按 seq 顺序依次播放，收到 ai_audio_end 且全部播完后恢复输入；
+    // 新回复到来时丢弃旧回复尚未播放的分段
+    let replyAudio = { id: null, chunks: {}, nextSeq: 0, count: null, playing: false };
+
+    function resetReplyAudio(replyId) {
+        if (replyAudio.id !== replyId) {
+            replyAudio = { id: replyId, chunks: {}, nextSeq: 0, count: null, playing: false };
+        }
+    }
+
+    function enqueueReplyAudioChunk(data) {
+        console.log('Received ai_audio_chunk:', data.reply_id, data.seq, data.audio_url);
+        resetReplyAudio(data.reply_id);
+        replyAudio.chunks[data.seq] = data.audio_url;
+        isProcessing = true;
+        setInputEnabled(false);
+        playNextReplyAudio();
+    }
+
+    function endReplyAudio(data) {
+        resetReplyAudio(data.reply_id);
+        replyAudio.count = data.count;
+        playNextReplyAudio();
+    }
+
+    function playNextReplyAudio() {
+        const state = replyAudio;
+        if (state.playing) return;
+        const url = state.chunks[state.nextSeq];
+        if (!url) {
+            if (state.count !== null && state.nextSeq >= state.count) {
+                isProcessing = false;
+                setInputEnabled(true);
+            }
+            return;
+        }
+        delete state.chunks[state.nextSeq];
+        state.nextSeq += 1;
+        state.playing = true;
+        let finished = false;
+        const next = () => {
+            if (finished) return;
+            finished = true;
+            state.playing = false;
+            if (replyAudio === state) playNextReplyAudio();
+        };
+        const audio = new Audio(url);
+        audio.addEventListener('ended', next);
+        audio.addEventListener('error', next);
+        audio.play().catch(e => {
+            console.error('Audio play failed:', e);
+            next();
+        });
+    }
+
     // 处理文本消息
     function handleTextMessage(text) {
         if (text.startsWith('You:')) {
@@ -5,6 +5,8 @@ import wave
 import numpy as np
 import aiohttp
 import tempfile
+import time
+from collections import deque
 # faster_whisper / torch 按需导入（仅本地 ASR 使用，豆包/OpenAI 路径不加载）
 from dotenv import load_dotenv
 
@@ -23,6 +25,8 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
 # API_PROVIDER将从app.py导入，以便支持动态切换
 from .app import API_PROVIDER
+from .http_clients import get_http_session
+from .metrics import ASR_SECONDS, PROVIDER_ERRORS
 
 # 初始化豆包ASR客户端（可选）
 doubao_asr_client = None
@@ -87,8 +91,107 @@ def transcribe_with_whisper(audio_file):
         transcription += segment.text + " "
     return transcription.strip()
 
+# 豆包 ASR 模式：file=录音文件识别（提交音频 URL 后轮询结果），stream=流式识别（PCM 帧直接走 WebSocket，无需公网 URL）
+# 可被单次请求的 asr_mode 参数覆盖
+ASR_MODES = ("file", "stream")
+ASR_MODE = os.getenv("ASR_MODE", "file").strip().lower()
+# 录音文件识别轮询：首次查询前等待秒数、退避倍数、最长查询间隔、总超时
+ASR_POLL_INITIAL = float(os.getenv("ASR_POLL_INITIAL", "0.3"))
+ASR_POLL_BACKOFF = float(os.getenv("ASR_POLL_BACKOFF", "1.5"))
+ASR_POLL_MAX_INTERVAL = float(os.getenv("ASR_POLL_MAX_INTERVAL", "2.0"))
+ASR_POLL_TIMEOUT = float(os.getenv("ASR_POLL_TIMEOUT", "60"))
+
+# 各模式的识别耗时（最近 200 次）与成功/失败/轮询次数，供 asr_latency_stats 汇总
+_asr_latencies = {mode: deque(maxlen=200) for mode in ASR_MODES}
+_asr_counters = {mode: {"ok": 0, "error": 0, "polls": 0} for mode in ASR_MODES}
+
+
+def _record_asr_latency(mode: str, seconds: float, ok: bool) -> None:
+    _asr_counters[mode]["ok" if ok else "error"] += 1
+    if ok:
+        _asr_latencies[mode].append(seconds)
+        ASR_SECONDS.observe(seconds, provider="doubao", mode=mode)
+    else:
+        PROVIDER_ERRORS.inc(provider="doubao", stage="asr")
+    print(f"ASR[{mode}] {'完成' if ok else '失败'}，耗时 {seconds:.2f}s")
+
+
+def asr_latency_stats() -> dict:
+    """按模式汇总识别耗时：成功/失败次数，平均、p50、p95、最近一次（秒）；file 模式另含平均轮询次数"""
+    stats = {}
+    for mode in ASR_MODES:
+        samples = sorted(_asr_latencies[mode])
+        counters = _asr_counters[mode]
+        entry = {"ok": counters["ok"], "error": counters["error"]}
+        if samples:
+            entry.update({
+                "avg": round(sum(samples) / len(samples), 3),
+                "p50": round(samples[len(samples) // 2], 3),
+                "p95": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+                "last": round(_asr_latencies[mode][-1], 3),
+            })
+        if mode == "file" and counters["ok"] + counters["error"]:
+            entry["avg_polls"] = round(counters["polls"] / (counters["ok"] + counters["error"]), 2)
+        stats[mode] = entry
+    return stats
+
+
+def _read_wav_pcm(wav_path: str) -> bytes:
+    """读取 16kHz / 16bit / 单声道 WAV 的 PCM 数据（流式识别用）"""
+    with wave.open(wav_path, "rb") as wf:
+        if wf.getframerate() != 16000 or wf.getnchannels() != 1 or wf.getsampwidth() != 2:
+            raise ValueError(f"流式识别需要 16kHz 16bit 单声道 WAV，当前为 {wf.getframerate()}Hz/{wf.getnchannels()}ch/{wf.getsampwidth() * 8}bit")
+        return wf.readframes(wf.getnframes())
+
+
+async def transcribe_with_doubao(audio, base_url: str = None, mode: str = None) -> str:
+    """豆包语音识别入口：按 mode（默认 ASR_MODE）选择录音文件识别或流式识别，并记录耗时。
+
+    Args:
+        audio: 16kHz 单声道 WAV 文件路径，或同规格的 PCM 数据（bytes，上传录音内存转码的结果）
+        base_url: 录音文件识别时火山拉取音频用的服务根 URL；未传时使用环境变量 PUBLIC_APP_URL（stream 模式不需要）
+        mode: "file" 或 "stream"
+    """
+    mode = (mode or ASR_MODE or "file").strip().lower()
+    if mode not in ASR_MODES:
+        raise ValueError(f"不支持的 ASR 模式 '{mode}'，仅支持 {', '.join(ASR_MODES)}")
+    start = time.perf_counter()
+    ok = False
+    try:
+        if mode == "stream":
+            if doubao_asr_client is None:
+                raise ValueError("豆包ASR客户端未初始化，请检查 VOLCENGINE_ASR_APP_ID / VOLCENGINE_ASR_ACCESS_TOKEN")
+            if isinstance(audio, bytes):
+                pcm = audio
+            else:
+                pcm = await asyncio.to_thread(_read_wav_pcm, audio)
+            text = await doubao_asr_client.transcribe_pcm_async(pcm)
+            if not text:
+                raise ValueError("流式识别返回空文本（可能为静音或识别失败）")
+        else:
+            from .audio_temp import register_audio_temp, unregister_audio_temp
+            base = (base_url or os.getenv("PUBLIC_APP_URL", "")).strip().rstrip("/")
+            if not base:
+                raise ValueError("豆包录音文件识别需要可公网访问的 base_url，请在调用时传入 base_url 或设置环境变量 PUBLIC_APP_URL")
+            if isinstance(audio, bytes):
+                from .audio_transcode import pcm_to_wav_bytes
+                token = register_audio_temp(pcm_to_wav_bytes(audio))
+            else:
+                token = register_audio_temp(audio)
+            try:
+                text = await transcribe_with_doubao_file_asr(f"{base}/api/audio/temp/{token}")
+            finally:
+                unregister_audio_temp(token)
+        ok = True
+        return text
+    finally:
+        _record_asr_latency(mode, time.perf_counter() - start, ok)
+
+
 async def transcribe_with_doubao_file_asr(audio_url: str) -> str:
-    """豆包录音文件识别大模型：提交音频 URL，轮询查询结果。无分段延迟，响应更快。"""
+    """豆包录音文件识别大模型：提交音频 URL，轮询查询结果。
+    轮询间隔自适应：首次 ASR_POLL_INITIAL 秒后即查询，之后按 ASR_POLL_BACKOFF 倍递增（不超过 ASR_POLL_MAX_INTERVAL），
+    短语音通常首轮即可拿到结果。"""
     app_key = os.getenv("VOLCENGINE_ASR_APP_ID", "").strip()
     access_key = os.getenv("VOLCENGINE_ASR_ACCESS_TOKEN", "").strip()
     # 1.0 常用 volc.bigasr.auc，2.0 为 volc.seedasr.auc；若报 45000030 未授权可改为 volc.bigasr.auc
@@ -112,43 +215,51 @@ async def transcribe_with_doubao_file_asr(audio_url: str) -> str:
         "audio": {"url": audio_url, "format": "wav"},
         "request": {"model_name": "bigmodel", "enable_itn": True},
     }
-    async with aiohttp.ClientSession() as session:
-        async with session.post(submit_url, json=body, headers=headers_submit) as resp:
-            code = resp.headers.get("X-Api-Status-Code", "")
-            if code != "20000000":
-                msg = resp.headers.get("X-Api-Message", await resp.text())
-                raise ValueError(f"录音文件识别提交失败: {code} - {msg}")
-            x_tt_logid = resp.headers.get("X-Tt-Logid", "")
-        headers_query = {
-            "Content-Type": "application/json",
-            "X-Api-App-Key": app_key,
-            "X-Api-Access-Key": access_key,
-            "X-Api-Resource-Id": resource_id,
-            "X-Api-Request-Id": task_id,
-            "X-Tt-Logid": x_tt_logid,
-        }
-        for _ in range(60):
-            await asyncio.sleep(1)
-            async with session.post(query_url, json={}, headers=headers_query) as qresp:
-                code = qresp.headers.get("X-Api-Status-Code", "")
-                if code == "20000000":
-                    data = await qresp.json()
-                    result = (data or {}).get("result") or {}
-                    text = (result.get("text") or "").strip()
-                    if text:
-                        return text
-                    raise ValueError("录音文件识别返回空文本（可能为静音或识别失败）")
-                if code not in ("20000001", "20000002"):
-                    msg = qresp.headers.get("X-Api-Message", await qresp.text())
-                    raise ValueError(f"录音文件识别查询失败: {code} - {msg}")
-        raise ValueError("录音文件识别查询超时")
+    session = get_http_session()
+    async with session.post(submit_url, json=body, headers=headers_submit) as resp:
+        code = resp.headers.get("X-Api-Status-Code", "")
+        if code != "20000000":
+            msg = resp.headers.get("X-Api-Message", await resp.text())
+            raise ValueError(f"录音文件识别提交失败: {code} - {msg}")
+        x_tt_logid = resp.headers.get("X-Tt-Logid", "")
+    headers_query = {
+        "Content-Type": "application/json",
+        "X-Api-App-Key": app_key,
+        "X-Api-Access-Key": access_key,
+        "X-Api-Resource-Id": resource_id,
+        "X-Api-Request-Id": task_id,
+        "X-Tt-Logid": x_tt_logid,
+    }
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + ASR_POLL_TIMEOUT
+    delay = ASR_POLL_INITIAL
+    while loop.time() + delay <= deadline:
+        await asyncio.sleep(delay)
+        delay = min(delay * ASR_POLL_BACKOFF, ASR_POLL_MAX_INTERVAL)
+        _asr_counters["file"]["polls"] += 1
+        async with session.post(query_url, json={}, headers=headers_query) as qresp:
+            code = qresp.headers.get("X-Api-Status-Code", "")
+            if code == "20000000":
+                data = await qresp.json()
+                result = (data or {}).get("result") or {}
+                text = (result.get("text") or "").strip()
+                if text:
+                    return text
+                raise ValueError("录音文件识别返回空文本（可能为静音或识别失败）")
+            if code not in ("20000001", "20000002"):
+                msg = qresp.headers.get("X-Api-Message", await qresp.text())
+                raise ValueError(f"录音文件识别查询失败: {code} - {msg}")
+    raise ValueError("录音文件识别查询超时")
 
 async def transcribe_with_doubao_asr(audio_file):
-    """已废弃：请使用 transcribe_with_doubao_file_asr(audio_url)。保留仅为兼容，实际应走录音文件识别。"""
-    raise ValueError("豆包流式 ASR 已停用，请使用录音文件识别；调用方应传入 audio_url 并调用 transcribe_with_doubao_file_asr")
+    """已废弃：请使用 transcribe_with_doubao(wav_path, base_url, mode)（mode=stream 即流式识别）。保留仅为兼容。"""
+    raise ValueError("transcribe_with_doubao_asr 已停用，请调用 transcribe_with_doubao(wav_path, base_url, mode)，mode 可选 file / stream")
 
 async def transcribe_with_openai_api(audio_file, model="gpt-4o-mini-transcribe"):
     """Transcribe audio using OpenAI's API
+
+    Args:
+        audio_file: 音频文件路径，或内存中的 WAV 数据（bytes）
     
     Returns:
         str: 转录文本，如果失败则返回None
@@ -175,32 +286,41 @@ async def transcribe_with_openai_api(audio_file, model="gpt-4o-mini-transcribe")
     
     api_url = f"{base_url}/audio/transcriptions"
     
+    start = time.perf_counter()
     try:
-        async with aiohttp.ClientSession() as session:
+        session = get_http_session()
+        if isinstance(audio_file, bytes):
+            audio_bytes, filename = audio_file, "audio.wav"
+        else:
             with open(audio_file, "rb") as audio_file_data:
-                form_data = aiohttp.FormData()
-                form_data.add_field('file', 
-                                    audio_file_data.read(),
-                                    filename=os.path.basename(audio_file),
-                                    content_type='audio/wav')
-                
-                # Use the model directly
-                form_data.add_field('model', model)
-                
-                headers = {
-                    "Authorization": f"Bearer {OPENAI_API_KEY}"
-                }
-                
-                async with session.post(api_url, data=form_data, headers=headers) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        transcription = result.get("text", "")
-                        return transcription
-                    else:
-                        error_text = await response.text()
-                        print(f"Error: OpenAI ASR API调用失败 - HTTP {response.status}: {error_text}")
-                        return None
+                audio_bytes = audio_file_data.read()
+            filename = os.path.basename(audio_file)
+        form_data = aiohttp.FormData()
+        form_data.add_field('file', 
+                            audio_bytes,
+                            filename=filename,
+                            content_type='audio/wav')
+            
+        # Use the model directly
+        form_data.add_field('model', model)
+            
+        headers = {
+            "Authorization": f"Bearer {OPENAI_API_KEY}"
+        }
+            
+        async with session.post(api_url, data=form_data, headers=headers) as response:
+            if response.status == 200:
+                result = await response.json()
+                transcription = result.get("text", "")
+                ASR_SECONDS.observe(time.perf_counter() - start, provider="openai", mode="file")
+                return transcription
+            else:
+                error_text = await response.text()
+                PROVIDER_ERRORS.inc(provider="openai", stage="asr")
+                print(f"Error: OpenAI ASR API调用失败 - HTTP {response.status}: {error_text}")
+                return None
     except Exception as e:
+        PROVIDER_ERRORS.inc(provider="openai", stage="asr")
         print(f"Error: OpenAI ASR API调用失败 - {str(e)}")
         return None
 
@@ -453,18 +573,9 @@ async def transcribe_audio(transcription_model="gpt-4o-mini-transcribe", use_loc
         # 只使用全局API_PROVIDER指定的ASR供应商
         transcription = None
         if API_PROVIDER == 'doubao':
-            # 豆包录音文件识别：本地录音已是 16kHz wav，仅需注册临时 URL 供火山拉取
+            # 豆包识别：本地录音已是 16kHz wav；录音文件识别模式注册临时 URL 供火山拉取，流式模式直接发送 PCM
             try:
-                from .audio_temp import register_audio_temp, unregister_audio_temp
-                base = (base_url or os.getenv("PUBLIC_APP_URL", "")).strip().rstrip("/")
-                if not base:
-                    raise ValueError("豆包录音文件识别需要可公网访问的 base_url，请在调用时传入 base_url 或设置环境变量 PUBLIC_APP_URL")
-                token = register_audio_temp(temp_filename)
-                try:
-                    audio_url = f"{base}/api/audio/temp/{token}"
-                    transcription = await transcribe_with_doubao_file_asr(audio_url)
-                finally:
-                    unregister_audio_temp(token)
+                transcription = await transcribe_with_doubao(temp_filename, base_url)
             except Exception as e:
                 if send_status_callback:
                     await send_status_message(send_status_callback, {
@@ -0,0 +1,227 @@
+# 内容寻址的 TTS 音频缓存：按 (provider, voice, encoding, speed, text) 哈希存盘，LRU 限制总大小
+# 固定台词（dialogues.json 中的对话行）只需向厂商合成一次，之后直接从磁盘复制到输出路径
+# 锁只保护内存索引，文件复制在锁外进行；索引去抖后由后台定时器落盘。异步代码用 afetch_cached_audio / astore_cached_audio
+# （在线程中执行，不阻塞事件循环）。
+import asyncio
+import atexit
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+_PROJECT_DIR = Path(__file__).resolve().parent.parent
+TTS_CACHE_ENABLED = os.getenv("TTS_CACHE_ENABLED", "true").lower() == "true"
+TTS_CACHE_DIR = Path(os.getenv("TTS_CACHE_DIR", "") or (_PROJECT_DIR / "outputs" / "tts_cache"))
+TTS_CACHE_MAX_BYTES = int(float(os.getenv("TTS_CACHE_MAX_MB", "500")) * 1024 * 1024)
+# 仅更新访问时间时，索引最多每隔多少秒落盘一次
+_INDEX_SAVE_INTERVAL = 30
+# 新写入条目后索引落盘的去抖秒数（期间的多次写入合并为一次落盘）
+TTS_CACHE_INDEX_DELAY = float(os.getenv("TTS_CACHE_INDEX_DELAY", "2"))
+
+_lock = threading.Lock()
+# key -> {"ext": str, "size": int, "atime": float}，按最近访问排序（末尾最新）
+_index: Optional["OrderedDict[str, dict]"] = None
+_total_bytes = 0
+_index_dirty = False
+_index_saved_at = 0.0
+_index_timer: Optional[threading.Timer] = None
+_index_due = 0.0
+# 串行化索引落盘（快照在 _lock 内取，写文件在锁外）
+_index_write_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+
+def tts_cache_key(text: str, voice: Optional[str], encoding: str, speed=None, provider: str = "") -> str:
+    """缓存键：对合成参数做 sha256。text 去首尾空白，其余参数原样参与。"""
+    payload = json.dumps(
+        [provider or "", voice or "", (encoding or "").lower(), str(speed) if speed is not None else "", (text or "").strip()],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _index_path() -> Path:
+    return TTS_CACHE_DIR / "index.json"
+
+
+def _entry_path(key: str, ext: str) -> Path:
+    # 两级分片，避免单目录文件过多
+    return TTS_CACHE_DIR / key[:2] / f"{key}.{ext}"
+
+
+def _load_index() -> "OrderedDict[str, dict]":
+    """加载索引（调用方持锁）。索引缺失或损坏时扫描缓存目录重建。"""
+    global _index, _total_bytes
+    if _index is not None:
+        return _index
+    entries = {}
+    try:
+        with open(_index_path(), "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        for key, e in (raw or {}).items():
+            if _entry_path(key, e["ext"]).is_file():
+                entries[key] = {"ext": e["ext"], "size": int(e["size"]), "atime": float(e.get("atime", 0))}
+    except (OSError, ValueError, KeyError, TypeError):
+        if TTS_CACHE_DIR.is_dir():
+            for p in TTS_CACHE_DIR.glob("*/*.*"):
+                if p.name.endswith(".tmp"):
+                    continue
+                try:
+                    st = p.stat()
+                except OSError:
+                    continue
+                entries[p.stem] = {"ext": p.suffix.lstrip("."), "size": st.st_size, "atime": st.st_mtime}
+    _index = OrderedDict(sorted(entries.items(), key=lambda kv: kv[1]["atime"]))
+    _total_bytes = sum(e["size"] for e in _index.values())
+    return _index
+
+
+def _schedule_index_save(delay: float) -> None:
+    """delay 秒后在后台落盘索引；已有更早的计划时不重复安排（调用方持锁）"""
+    global _index_timer, _index_due
+    due = time.monotonic() + delay
+    if _index_timer is not None:
+        if _index_due <= due:
+            return
+        _index_timer.cancel()
+    timer = threading.Timer(max(delay, 0.0), flush_tts_cache_index)
+    timer.daemon = True
+    _index_timer, _index_due = timer, due
+    timer.start()
+
+
+def flush_tts_cache_index() -> None:
+    """把有变化的索引原子落盘（后台定时器与进程退出时调用）"""
+    global _index_dirty, _index_saved_at, _index_timer
+    with _index_write_lock:
+        with _lock:
+            if _index_timer is not None:
+                _index_timer.cancel()
+                _index_timer = None
+            if _index is None or not _index_dirty:
+                return
+            snapshot = dict(_index)
+            _index_dirty = False
+        try:
+            TTS_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            tmp = _index_path().with_suffix(".json.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp, _index_path())
+            _index_saved_at = time.time()
+        except OSError as e:
+            print(f"TTS 缓存索引写入失败: {e}")
+            with _lock:
+                _index_dirty = True
+
+
+def _evict() -> None:
+    """超出容量时按 LRU 删除最久未用的条目（调用方持锁）"""
+    global _total_bytes
+    while _total_bytes > TTS_CACHE_MAX_BYTES and _index:
+        key, e = _index.popitem(last=False)
+        _total_bytes -= e["size"]
+        _stats["evictions"] += 1
+        try:
+            _entry_path(key, e["ext"]).unlink()
+        except OSError:
+            pass
+
+
+def _place(src: Path, dst: Path) -> None:
+    """把 src 复制到 dst，先写临时名再替换。不用硬链接：输出文件之后可能被原地覆盖写，会连带改坏缓存"""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(f"{dst.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def fetch_cached_audio(key: str, ext: str, output_path: str) -> bool:
+    """命中则把缓存音频放到 output_path 并返回 True；未命中或缓存关闭返回 False。阻塞调用，异步代码用 afetch_cached_audio。"""
+    global _index_dirty, _total_bytes
+    if not TTS_CACHE_ENABLED:
+        return False
+    with _lock:
+        index = _load_index()
+        entry = index.get(key)
+        if entry is None or entry["ext"] != ext:
+            _stats["misses"] += 1
+            return False
+    try:
+        _place(_entry_path(key, ext), Path(output_path))
+    except OSError:
+        with _lock:
+            # 文件被外部删除 / 刚被淘汰：移出索引，按未命中处理
+            if index.get(key) is entry:
+                index.pop(key)
+                _total_bytes -= entry["size"]
+                _index_dirty = True
+            _stats["misses"] += 1
+        return False
+    with _lock:
+        entry["atime"] = time.time()
+        if key in index:
+            index.move_to_end(key)
+        _index_dirty = True
+        _stats["hits"] += 1
+        _schedule_index_save(_INDEX_SAVE_INTERVAL)
+    return True
+
+
+def store_cached_audio(key: str, ext: str, source_path: str) -> None:
+    """把刚合成好的音频文件存入缓存（失败只打印，不影响调用方）。阻塞调用，异步代码用 astore_cached_audio。"""
+    global _total_bytes, _index_dirty
+    if not TTS_CACHE_ENABLED:
+        return
+    src = Path(source_path)
+    try:
+        size = src.stat().st_size
+    except OSError:
+        return
+    if size <= 0 or size > TTS_CACHE_MAX_BYTES:
+        return
+    try:
+        _place(src, _entry_path(key, ext))
+    except OSError as e:
+        print(f"TTS 缓存写入失败: {e}")
+        return
+    with _lock:
+        index = _load_index()
+        old = index.pop(key, None)
+        if old is not None:
+            _total_bytes -= old["size"]
+        index[key] = {"ext": ext, "size": size, "atime": time.time()}
+        _total_bytes += size
+        _stats["stores"] += 1
+        _evict()
+        _index_dirty = True
+        _schedule_index_save(TTS_CACHE_INDEX_DELAY)
+
+
+async def afetch_cached_audio(key: str, ext: str, output_path: str) -> bool:
+    """fetch_cached_audio 的异步版本：在线程中复制文件，不阻塞事件循环"""
+    if not TTS_CACHE_ENABLED:
+        return False
+    return await asyncio.to_thread(fetch_cached_audio, key, ext, output_path)
+
+
+async def astore_cached_audio(key: str, ext: str, source_path: str) -> None:
+    """store_cached_audio 的异步版本"""
+    if not TTS_CACHE_ENABLED:
+        return
+    await asyncio.to_thread(store_cached_audio, key, ext, source_path)
+
+
+def tts_cache_stats() -> dict:
+    """命中/未命中/写入/淘汰计数与当前条目数、占用字节"""
+    with _lock:
+        index = _load_index()
+        return {**_stats, "entries": len(index), "bytes": _total_bytes, "max_bytes": TTS_CACHE_MAX_BYTES}
+
+
+atexit.register(flush_tts_cache_index)
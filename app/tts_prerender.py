@@ -0,0 +1,87 @@
+# 对话台词 TTS 预渲染清单：scripts/prerender_dialogue_tts.py 离线批量合成 dialogues.json 全部台词，
+# 生成 outputs/prerendered_tts/manifest.json（台词 -> 音频 URL）；生成卡片时按台词查表，命中即无需调用 TTS。
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from .tts_cache import tts_cache_key
+
+_PROJECT_DIR = Path(__file__).resolve().parent.parent
+PRERENDER_DIR = _PROJECT_DIR / "outputs" / "prerendered_tts"
+MANIFEST_PATH = PRERENDER_DIR / "manifest.json"
+
+_manifest_lock = threading.Lock()
+_manifest_cache: Optional[Dict[str, Dict]] = None
+_manifest_mtime: Optional[int] = None
+
+
+def line_tts_params(speaker: str, provider: str, tts_encoding: str = None) -> Dict:
+    """某说话人台词的合成参数（与 memory_system._generate_tts_one_line 的选择一致）：provider 标签、人声、扩展名、语速。"""
+    tts_encoding = tts_encoding or os.getenv("TTS_ENCODING", "mp3")
+    if provider == "doubao":
+        voice_a = os.getenv("TTS_VOICE_TYPE") or "zh_female_cancan_mars_bigtts"
+        voice_b = os.getenv("TTS_VOICE_TYPE_B")
+        voice = voice_b if speaker == "B" and voice_b else voice_a
+        return {"provider": "doubao", "voice": voice, "ext": "mp3" if tts_encoding == "mp3" else "wav", "speed": None}
+    voice_a = os.getenv("OPENAI_TTS_VOICE", "alloy")
+    voice = os.getenv("OPENAI_TTS_VOICE_B", voice_a) if speaker == "B" else voice_a
+    model = os.getenv("OPENAI_MODEL_TTS", "gpt-4o-mini-tts")
+    return {"provider": f"openai:{model}", "voice": voice, "ext": "wav", "speed": float(os.getenv("VOICE_SPEED", "1.0"))}
+
+
+def prerender_key(text: str, params: Dict) -> str:
+    return tts_cache_key(text, params["voice"], params["ext"], params["speed"], params["provider"])
+
+
+def prerender_relpath(key: str, ext: str) -> str:
+    """相对 outputs/ 的路径，/audio/{relpath} 即可访问"""
+    return f"prerendered_tts/{key[:2]}/{key}.{ext}"
+
+
+def load_manifest() -> Dict[str, Dict]:
+    """读取清单（按 mtime 缓存，重新预渲染后自动生效）。无清单时返回空 dict。"""
+    global _manifest_cache, _manifest_mtime
+    try:
+        mtime = MANIFEST_PATH.stat().st_mtime_ns
+    except OSError:
+        return {}
+    with _manifest_lock:
+        if _manifest_cache is not None and _manifest_mtime == mtime:
+            return _manifest_cache
+        try:
+            with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            entries = data.get("entries") if isinstance(data, dict) else None
+        except (OSError, ValueError):
+            entries = None
+        _manifest_cache = entries if isinstance(entries, dict) else {}
+        _manifest_mtime = mtime
+        return _manifest_cache
+
+
+def save_manifest(entries: Dict[str, Dict]) -> None:
+    """原子写出清单（先写临时文件再替换）"""
+    PRERENDER_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = MANIFEST_PATH.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "entries": entries}, f, ensure_ascii=False)
+    os.replace(tmp, MANIFEST_PATH)
+
+
+def lookup_prerendered(text: str, speaker: str, provider: str, tts_encoding: str = None) -> Optional[str]:
+    """按台词查预渲染音频，命中且文件存在时返回 /audio/... URL，否则 None。"""
+    if not text or not text.strip():
+        return None
+    manifest = load_manifest()
+    if not manifest:
+        return None
+    params = line_tts_params(speaker, provider, tts_encoding)
+    entry = manifest.get(prerender_key(text, params))
+    if not entry:
+        return None
+    relpath = entry.get("path")
+    if not relpath or not (_PROJECT_DIR / "outputs" / relpath).is_file():
+        return None
+    return f"/audio/{relpath}"
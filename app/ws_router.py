@@ -0,0 +1,150 @@
+# WebSocket 消息路由：按 shared._ws_to_account 的绑定只把消息投递给目标账号的连接；
+# 每个连接一个有界发送队列 + 独立发送协程，多个连接并发发送、互不阻塞，同一连接内保持消息顺序。
+# 发送队列积压超过上限或单条发送超时的慢连接会被断开（或按配置丢弃消息），不拖慢其他用户。
+import asyncio
+import os
+from typing import Dict, Optional
+
+# 每个连接最多积压的待发消息数
+WS_CLIENT_QUEUE_SIZE = int(os.getenv("WS_CLIENT_QUEUE_SIZE", "256"))
+# 单条消息发送超时（秒），超时视为慢连接
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+# 队列满时的处理：disconnect=断开该连接（客户端重连后恢复），drop=丢弃这条消息
+WS_SLOW_CLIENT_POLICY = os.getenv("WS_SLOW_CLIENT_POLICY", "disconnect").strip().lower()
+
+_counters = {"routed": 0, "sent": 0, "dropped": 0, "disconnected": 0, "undelivered": 0}
+
+
+class _Outbox:
+    """单个连接的发送队列与发送协程；绑定连接所在的事件循环"""
+
+    def __init__(self, client, loop: asyncio.AbstractEventLoop):
+        self.client = client
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=WS_CLIENT_QUEUE_SIZE)
+        self.max_depth = 0
+        self.closing = False
+        self.task = loop.create_task(self._run())
+
+    def enqueue(self, message: str) -> None:
+        """只能在 self.loop 中调用（跨线程经 call_soon_threadsafe 转入）"""
+        if self.closing or self.task.done():
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            if WS_SLOW_CLIENT_POLICY == "drop":
+                _counters["dropped"] += 1
+                return
+            print(f"⚠️ WebSocket 客户端积压 {self.queue.qsize()} 条消息，断开慢连接")
+            self.closing = True
+            self.loop.create_task(_disconnect(self.client, "send queue full"))
+            return
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    async def _run(self) -> None:
+        while True:
+            message = await self.queue.get()
+            try:
+                await asyncio.wait_for(self.client.send_text(message), WS_SEND_TIMEOUT)
+                _counters["sent"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Error sending message to client: {e}")
+                await _disconnect(self.client, "send failed")
+                return
+
+
+_outboxes: Dict[object, _Outbox] = {}
+
+
+def open_outbox(client) -> None:
+    """连接建立时调用（需在连接所在事件循环中）：为其创建发送队列"""
+    if client not in _outboxes:
+        _outboxes[client] = _Outbox(client, asyncio.get_running_loop())
+
+
+def close_outbox(client) -> None:
+    """连接断开时调用：丢弃未发送消息并停止发送协程"""
+    outbox = _outboxes.pop(client, None)
+    if outbox is None:
+        return
+    try:
+        current = asyncio.current_task()
+    except RuntimeError:
+        current = None
+    if outbox.task is not current and not outbox.task.done():
+        outbox.loop.call_soon_threadsafe(outbox.task.cancel)
+
+
+async def _disconnect(client, reason: str) -> None:
+    from .shared import remove_client
+    if client not in _outboxes:
+        return
+    _counters["disconnected"] += 1
+    remove_client(client)
+    try:
+        # 1013 = Try Again Later：前端断线重连后重新绑定账号
+        await client.close(code=1013, reason=reason)
+    except Exception:
+        pass
+
+
+def route_message(message: str, account_name: Optional[str] = None) -> int:
+    """把消息放入目标连接的发送队列，返回本进程投递的连接数。
+    account_name 为 None 时广播给所有连接；否则只投递给绑定到该账号的连接（未绑定的连接视为 DEFAULT_ACCOUNT）。
+    STATE_BACKEND=sqlite 时同时发布给其他 worker，由持有该账号连接的 worker 投递（见 state_backend）。"""
+    from .shared import DEFAULT_ACCOUNT
+    from .state_backend import is_shared_backend, publish
+    if account_name is not None:
+        account_name = account_name.strip() or DEFAULT_ACCOUNT
+    shared = is_shared_backend()
+    if shared:
+        publish(message, account_name)
+    delivered = route_local(message, account_name, count_undelivered=not shared)
+    _counters["routed"] += 1
+    return delivered
+
+
+def route_local(message: str, account_name: Optional[str] = None, count_undelivered: bool = False) -> int:
+    """只投递给本进程的连接（route_message 与跨 worker 订阅线程共用）"""
+    from .shared import get_websocket_account
+    try:
+        current_loop = asyncio.get_running_loop()
+    except RuntimeError:
+        current_loop = None
+    delivered = 0
+    for client, outbox in list(_outboxes.items()):
+        if account_name is not None and get_websocket_account(client) != account_name:
+            continue
+        if outbox.loop is current_loop:
+            outbox.enqueue(message)
+        else:
+            # 后台对话线程（独立事件循环）发送：转交到连接所在的循环
+            outbox.loop.call_soon_threadsafe(outbox.enqueue, message)
+        delivered += 1
+    if not delivered and count_undelivered:
+        _counters["undelivered"] += 1
+    return delivered
+
+
+def ws_router_stats() -> dict:
+    """路由状态：连接数、各账号待发消息数、最大单连接积压，以及累计路由 / 发送 / 丢弃 / 断开 / 无人接收次数"""
+    from .shared import get_websocket_account
+    per_account: Dict[str, int] = {}
+    depths = []
+    for client, outbox in list(_outboxes.items()):
+        depth = outbox.queue.qsize()
+        depths.append(depth)
+        acc = get_websocket_account(client)
+        per_account[acc] = per_account.get(acc, 0) + depth
+    return {
+        "clients": len(depths),
+        "queued": sum(depths),
+        "max_queue_depth": max(depths, default=0),
+        "peak_queue_depth": max((o.max_depth for o in list(_outboxes.values())), default=0),
+        "queue_limit": WS_CLIENT_QUEUE_SIZE,
+        "per_account": per_account,
+        **_counters,
+    }
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+语块 MySQL 后端推荐接口压测：对比「逐场景查询」（旧实现）与「预排序索引」推荐的耗时，并校验两者结果一致。
+
+用法（项目根目录）：
+  # 使用 .env 中 CHUNK_DB_* 配置的 MySQL / MariaDB（需已按 docs/sql/chunk_schema.sql 建表并有数据）
+  python scripts/bench_chunk_db.py --user alice --rounds 200 --concurrency 8
+  # 无数据库时用临时 SQLite 替身（自动生成数据，仅验证正确性与连接池行为，不代表网络往返耗时）
+  python scripts/bench_chunk_db.py --sqlite --labels 300 --chunks 5000
+"""
+import argparse
+import os
+import random
+import re
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv(ROOT / ".env")
+except ImportError:
+    pass
+
+from app import chunk_db
+from app.chunk_db import ChunkDatabase
+
+
+# ---------- SQLite 替身：把 pymysql 风格的 SQL / 游标适配到 sqlite3 ----------
+
+class _SqliteCursor:
+    def __init__(self, cur):
+        self._cur = cur
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cur.close()
+
+    def execute(self, sql, args=()):
+        sql = sql.replace("%s", "?").replace("INSERT IGNORE", "INSERT OR IGNORE")
+        sql = re.sub(r"ON DUPLICATE KEY UPDATE.*", "", sql, flags=re.S)
+        self._cur.execute(sql, tuple(args))
+
+    def fetchone(self):
+        row = self._cur.fetchone()
+        return dict(row) if row is not None else None
+
+    def fetchall(self):
+        return [dict(r) for r in self._cur.fetchall()]
+
+    @property
+    def lastrowid(self):
+        return self._cur.lastrowid
+
+
+class _SqliteConnection:
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        # 索引摘要用到的 MySQL 函数
+        self._conn.create_function("CRC32", 1, lambda v: zlib.crc32(str(v).encode("utf-8")), deterministic=True)
+        self._conn.create_function("CONCAT_WS", -1, lambda sep, *args: sep.join(str(a) for a in args if a is not None),
+                                   deterministic=True)
+
+    def cursor(self):
+        return _SqliteCursor(self._conn.cursor())
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def ping(self, reconnect=True):
+        self._conn.execute("SELECT 1")
+
+    def close(self):
+        self._conn.close()
+
+
+def _build_sqlite(path, labels, chunks, users):
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE scene_label (label_id INTEGER PRIMARY KEY, first_scene TEXT, second_scene TEXT, third_scene TEXT, weight REAL);
+        CREATE TABLE chunk_core (chunk_id INTEGER PRIMARY KEY, chunk TEXT, difficulty INT, category INT,
+                                 learn_count INT DEFAULT 0, correct_count INT DEFAULT 0, last_correct INT DEFAULT 1, weight REAL);
+        CREATE TABLE chunk_scene_mapping (chunk_id INT, label_id INT, PRIMARY KEY (chunk_id, label_id));
+        CREATE TABLE user_scene_weight (user_id TEXT, label_id INT, weight REAL, PRIMARY KEY (user_id, label_id));
+        CREATE TABLE user_chunk_progress (user_id TEXT, chunk_id INT, learn_count INT, correct_count INT,
+                                          last_correct INT, last_learned_at TEXT, PRIMARY KEY (user_id, chunk_id));
+    """)
+    rnd = random.Random(42)
+    conn.executemany("INSERT INTO scene_label VALUES (?, ?, ?, ?, ?)", [
+        (i, f"F{i % 6}", f"S{i % 17}", f"T{i}", round(rnd.random(), 2)) for i in range(1, labels + 1)
+    ])
+    conn.executemany("INSERT INTO chunk_core (chunk_id, chunk, difficulty, category, weight) VALUES (?, ?, ?, ?, ?)", [
+        (i, f"chunk {i}", rnd.randint(1, 3), rnd.randint(1, 2), rnd.randint(0, 5)) for i in range(1, chunks + 1)
+    ])
+    pairs = {(c, rnd.randint(1, labels)) for c in range(1, chunks + 1) for _ in range(2)}
+    conn.executemany("INSERT INTO chunk_scene_mapping VALUES (?, ?)", sorted(pairs))
+    for u in users:
+        conn.executemany("INSERT INTO user_chunk_progress VALUES (?, ?, 1, 0, ?, '')", [
+            (u, c, rnd.randint(0, 1)) for c in rnd.sample(range(1, chunks + 1), chunks // 10)
+        ])
+    conn.commit()
+    conn.close()
+
+
+# ---------- 旧实现：逐场景查询 ----------
+
+def _legacy_chunks_for_labels(conn, label_ids, user_id, difficulty_max, limit):
+    result, seen = [], set()
+    for label_id in label_ids:
+        if len(result) >= limit:
+            break
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT c.chunk_id, c.chunk, c.difficulty, c.category, c.weight,
+                       COALESCE(p.last_correct, 1) AS last_correct,
+                       COALESCE(p.learn_count, 0) AS learn_count
+                FROM chunk_core c
+                INNER JOIN chunk_scene_mapping m ON m.chunk_id = c.chunk_id AND m.label_id = %s
+                LEFT JOIN user_chunk_progress p ON p.chunk_id = c.chunk_id AND p.user_id = %s
+                WHERE c.difficulty <= %s
+                ORDER BY c.weight DESC, c.difficulty ASC, COALESCE(p.last_correct, 1) ASC, c.chunk_id
+                """,
+                (label_id, user_id, difficulty_max),
+            )
+            rows = cur.fetchall()
+        for r in rows:
+            if r["chunk_id"] in seen:
+                continue
+            seen.add(r["chunk_id"])
+            result.append(r)
+            if len(result) >= limit:
+                break
+    return result
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, len(samples) * q // 100)] * 1000
+    return f"p50={pick(50):.1f}ms p95={pick(95):.1f}ms p99={pick(99):.1f}ms mean={statistics.mean(samples) * 1000:.1f}ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sqlite", action="store_true", help="使用临时 SQLite 文件替身")
+    parser.add_argument("--labels", type=int, default=200)
+    parser.add_argument("--chunks", type=int, default=3000)
+    parser.add_argument("--user", action="append", help="参与压测的用户 ID（可多次指定）")
+    parser.add_argument("--rounds", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--limit", type=int, default=30)
+    args = parser.parse_args()
+    users = args.user or ["bench_user_1", "bench_user_2"]
+
+    if args.sqlite:
+        path = os.path.join(tempfile.mkdtemp(prefix="bench_chunk_"), "chunk.db")
+        _build_sqlite(path, args.labels, args.chunks, users)
+        chunk_db.set_connection_factory(lambda: _SqliteConnection(path))
+    db = ChunkDatabase(str(ROOT))
+
+    # 正确性：索引推荐与逐场景查询结果一致
+    with chunk_db._pooled_connection() as conn:
+        for u in users:
+            db._init_user_scene_weights(conn, u)
+            label_ids = db.get_ordered_label_ids(conn, u, None)
+            old = [r["chunk_id"] for r in _legacy_chunks_for_labels(conn, label_ids, u, 3, args.limit)]
+            new = [r["chunk_id"] for r in db.get_chunks_for_labels(conn, label_ids, u, 3, args.limit)]
+            status = "一致" if old == new else "不一致"
+            print(f"[{u}] {len(label_ids)} 个场景，逐场景 {len(old)} 条 / 索引 {len(new)} 条：{status}")
+
+    def run(fn):
+        samples, lock = [], threading.Lock()
+
+        def one(i):
+            u = users[i % len(users)]
+            start = time.perf_counter()
+            fn(u)
+            with lock:
+                samples.append(time.perf_counter() - start)
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as ex:
+            list(ex.map(one, range(args.rounds)))
+        return samples, time.perf_counter() - t0
+
+    def legacy(u):
+        # 旧实现：每次推荐各借一次连接补全权重，再逐场景查询
+        db.init_user_scene_weights(u)
+        with chunk_db._pooled_connection() as conn:
+            label_ids = db.get_ordered_label_ids(conn, u, None)
+            _legacy_chunks_for_labels(conn, label_ids, u, 3, args.limit)
+
+    def batched(u):
+        db.get_recommended_chunks(user_id=u, user_difficulty_max=3, limit=args.limit)
+
+    for name, fn in (("逐场景查询", legacy), ("预排序索引", batched)):
+        samples, total = run(fn)
+        print(f"{name}: {args.rounds} 次 / 并发 {args.concurrency}，{args.rounds / total:.1f} req/s，{_percentiles(samples)}")
+    print("连接池:", chunk_db.chunk_db_pool_stats())
+
+
+if __name__ == "__main__":
+    main()
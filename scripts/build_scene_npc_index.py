@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 """
 从 data/dialogues.json 生成 data/scene_npc_index.json，并为缺失的小场景自动复制占位图。
-程序启动时会自动调用本脚本，无需人工执行；也可在项目根目录手动运行：
+程序启动时会在进程内调用 build_index / write_index / ensure_all_images（app/scene_npc_db 以库方式加载本文件），
+dialogues.json 变更时后台监听也会自动重建，无需人工执行；也可在项目根目录手动运行：
   python scripts/build_scene_npc_index.py
 """
 import json
@@ -83,23 +84,35 @@ def ensure_npc_images(root: Path, scene_detail_by_immersive_id: dict) -> None:
                     print(f"  警告: 复制 NPC 占位图到 {target} 失败: {e}", file=sys.stderr)
 
 
-def main(root: Path = None):
-    if root is None:
-        root = Path(__file__).resolve().parent.parent
-    dialogues_path = root / "data" / "dialogues.json"
-    index_path = root / "data" / "scene_npc_index.json"
+def ensure_all_images(root: Path, index: dict) -> None:
+    """为索引中的小场景、大场景、NPC 确保存在本地图（无则复制对应 default_*.svg）"""
+    ensure_scene_images(root, set(index.get("has_immersive") or []))
+    ensure_big_scene_images(root, index.get("big_scenes") or [])
+    ensure_npc_images(root, index.get("scene_detail_by_immersive_id") or {})
 
-    if not dialogues_path.exists():
-        print(f"错误: 未找到 {dialogues_path}", file=sys.stderr)
-        sys.exit(1)
 
+def load_dialogues(dialogues_path: Path) -> list:
+    """读取 dialogues.json；文件缺失或格式不对时抛 ValueError（供库调用方处理，CLI 由 main 转为退出码）"""
+    if not dialogues_path.exists():
+        raise ValueError(f"未找到 {dialogues_path}")
     with open(dialogues_path, "r", encoding="utf-8") as f:
         dialogues = json.load(f)
-
     if not isinstance(dialogues, list):
-        print("错误: dialogues.json 应为数组", file=sys.stderr)
-        sys.exit(1)
+        raise ValueError("dialogues.json 应为数组")
+    return dialogues
+
+
+def write_index(index_path: Path, index: dict) -> None:
+    """写入 scene_npc_index.json：先写同目录临时文件再 replace，读方不会读到半截文件"""
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = index_path.with_name(index_path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    tmp_path.replace(index_path)
+
 
+def build_index(dialogues: list) -> dict:
+    """由 dialogues 记录推导场景索引（纯函数，不读写文件）"""
     order_map = {"daily": 1, "food": 2, "travel": 3, "transport": 3, "shopping": 4, "work": 5, "social": 6}
 
     # 有 immersive 的 small_scene_id
@@ -193,24 +206,34 @@ def main(root: Path = None):
         k: v for k, v in scene_detail_by_immersive_id.items() if v.get("npcs")
     }
 
-    index = {
+    return {
         "has_immersive": list(has_immersive),
         "big_scenes": big_scenes,
         "small_scenes_by_big": small_scenes_by_big,
         "scene_detail_by_immersive_id": scene_detail_by_immersive_id,
     }
 
-    index_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(index_path, "w", encoding="utf-8") as f:
-        json.dump(index, f, ensure_ascii=False, indent=2)
+
+def main(root: Path = None):
+    if root is None:
+        root = Path(__file__).resolve().parent.parent
+    dialogues_path = root / "data" / "dialogues.json"
+    index_path = root / "data" / "scene_npc_index.json"
+
+    try:
+        dialogues = load_dialogues(dialogues_path)
+    except ValueError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    index = build_index(dialogues)
+    write_index(index_path, index)
 
     # 为小场景、大场景、NPC 确保存在本地图（无则复制对应 default_*.svg）
-    ensure_scene_images(root, has_immersive)
-    ensure_big_scene_images(root, big_scenes)
-    ensure_npc_images(root, scene_detail_by_immersive_id)
+    ensure_all_images(root, index)
 
     print(f"已生成索引: {index_path}")
-    print(f"  大场景: {len(big_scenes)}, 有沉浸的小场景: {len(has_immersive)}, 场景详情: {len(scene_detail_by_immersive_id)}")
+    print(f"  大场景: {len(index['big_scenes'])}, 有沉浸的小场景: {len(index['has_immersive'])}, 场景详情: {len(index['scene_detail_by_immersive_id'])}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+离线预渲染 data/dialogues.json 全部台词的 TTS 音频，写入 outputs/prerendered_tts/ 并生成 manifest.json（台词 -> 音频 URL）。
+生成卡片 / 开始练习时 generate_tts_for_dialogue_lines 先查清单，命中的行不再请求 TTS。
+
+- 使用与主站相同的供应商与人声配置（.env 中 API_PROVIDER、TTS_VOICE_TYPE / TTS_VOICE_TYPE_B、OPENAI_TTS_VOICE 等）；
+  修改人声后重新运行即可，清单按合成参数区分，旧条目不会被误用。
+- 可中断：已在清单中且文件存在的台词会跳过，每完成若干条即保存一次清单。
+
+用法（项目根目录）：
+  python scripts/prerender_dialogue_tts.py [--concurrency 4] [--usage learn,review,immersive] [--limit N] [--dry-run]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from dotenv import load_dotenv
+load_dotenv(ROOT / ".env")
+
+# 每完成多少条保存一次清单
+SAVE_EVERY = 20
+
+
+def collect_lines(dialogues_path: Path, usages: set) -> list:
+    """返回去重后的 [(speaker, text), ...]，保持首次出现顺序"""
+    with open(dialogues_path, "r", encoding="utf-8") as f:
+        dialogues = json.load(f)
+    if not isinstance(dialogues, list):
+        raise ValueError("dialogues.json 应为数组")
+    seen = set()
+    lines = []
+    for d in dialogues:
+        if usages and d.get("usage") not in usages:
+            continue
+        for item in d.get("content") or []:
+            speaker = item.get("role", "B")
+            text = (item.get("content") or "").strip()
+            if not text or (speaker, text) in seen:
+                continue
+            seen.add((speaker, text))
+            lines.append((speaker, text))
+    return lines
+
+
+async def render_all(lines: list, concurrency: int, dry_run: bool) -> int:
+    from app.tts_prerender import (
+        PRERENDER_DIR, line_tts_params, prerender_key, prerender_relpath, load_manifest, save_manifest,
+    )
+
+    # 与 app.app 启动时的取值一致；--dry-run 不需要加载整个应用
+    API_PROVIDER = os.getenv("API_PROVIDER", "doubao")
+    if API_PROVIDER not in ("doubao", "openai"):
+        print(f"错误: 不支持的 API_PROVIDER={API_PROVIDER}", file=sys.stderr)
+        return 1
+
+    manifest = dict(load_manifest())
+    outputs_dir = ROOT / "outputs"
+    todo = []
+    for speaker, text in lines:
+        params = line_tts_params(speaker, API_PROVIDER)
+        key = prerender_key(text, params)
+        entry = manifest.get(key)
+        if entry and (outputs_dir / entry.get("path", "")).is_file():
+            continue
+        todo.append((key, speaker, text, params))
+
+    print(f"供应商: {API_PROVIDER}，台词 {len(lines)} 条，已完成 {len(lines) - len(todo)} 条，待渲染 {len(todo)} 条")
+    if dry_run or not todo:
+        return 0
+
+    from app.app import doubao_text_to_speech, openai_text_to_speech
+
+    sem = asyncio.Semaphore(max(1, concurrency))
+    done = 0
+    failed = 0
+    started = time.time()
+
+    async def render_one(key, speaker, text, params):
+        nonlocal done, failed
+        async with sem:
+            relpath = prerender_relpath(key, params["ext"])
+            target = outputs_dir / relpath
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp = target.with_name(f"{target.stem}.part.{params['ext']}")
+            ok = False
+            try:
+                if API_PROVIDER == "doubao":
+                    ok = await doubao_text_to_speech(text, str(tmp), voice_type=params["voice"])
+                else:
+                    await openai_text_to_speech(text, str(tmp), voice=params["voice"])
+                    ok = True
+                ok = ok and tmp.is_file() and tmp.stat().st_size > 0
+                if ok:
+                    os.replace(tmp, target)
+            except Exception as e:
+                print(f"  失败 [{speaker}] {text[:40]}: {e}", file=sys.stderr)
+                ok = False
+            finally:
+                if tmp.exists():
+                    tmp.unlink()
+            if ok:
+                manifest[key] = {"path": relpath, "speaker": speaker, "text": text, "voice": params["voice"], "provider": params["provider"]}
+                done += 1
+                if done % SAVE_EVERY == 0:
+                    save_manifest(manifest)
+                    print(f"  进度 {done}/{len(todo)}，用时 {time.time() - started:.0f}s")
+            else:
+                failed += 1
+
+    try:
+        await asyncio.gather(*(render_one(*t) for t in todo))
+    finally:
+        save_manifest(manifest)
+        from app.http_clients import close_http_clients
+        await close_http_clients()
+    print(f"完成: 新渲染 {done} 条，失败 {failed} 条，清单: {PRERENDER_DIR / 'manifest.json'}")
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="预渲染 dialogues.json 台词 TTS")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("TTS_POOL_SIZE", "4")), help="并发合成数（默认同 TTS_POOL_SIZE）")
+    parser.add_argument("--usage", default="", help="只渲染指定 usage，逗号分隔，如 learn,review")
+    parser.add_argument("--limit", type=int, default=0, help="最多处理多少条台词（调试用）")
+    parser.add_argument("--dry-run", action="store_true", help="只统计待渲染数量，不调用 TTS")
+    args = parser.parse_args(argv)
+
+    usages = {u.strip() for u in args.usage.split(",") if u.strip()}
+    try:
+        lines = collect_lines(ROOT / "data" / "dialogues.json", usages)
+    except (OSError, ValueError) as e:
+        print(f"错误: {e}", file=sys.stderr)
+        sys.exit(1)
+    if args.limit > 0:
+        lines = lines[:args.limit]
+    sys.exit(asyncio.run(render_all(lines, args.concurrency, args.dry_run)))
+
+
+if __name__ == "__main__":
+    main()